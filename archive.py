@@ -0,0 +1,282 @@
+"""
+Opt-in local archive of generated summaries, searchable by text, date and tags.
+
+Every archived summary keeps its narrative and the downloaded file (DOCX or
+ZIP), so an old summary can be found and downloaded again without a new
+Gemini call. Rows live in SQLite; search uses an FTS5 index.
+
+Summaries, titles, tags and files are encrypted with Fernet. The FTS5 index
+can't be encrypted, so it holds keyed hashes of the words instead of the
+words themselves (a blind index): queries are tokenized and hashed the same
+way, and matching still runs inside SQLite. Without an encryption key the
+archive is kept in memory only, like the job store.
+
+Tokenization is Hebrew-aware: niqqud and geresh/gershayim are dropped, and a
+word is also indexed without up to two attached prefix letters
+(ו/ה/ב/ל/מ/ש/כ), so searching "דנה" finds "ולדנה".
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+
+PREFIX_LETTERS = "ובהלמשכ"
+MIN_STEM_LENGTH = 3  # shorter stems after stripping prefixes match too many unrelated words
+TOKEN_PATTERN = re.compile(r"[א-ת]+|[^\W_]+")
+NIQQUD_PATTERN = re.compile(r"[֑-ׇ]|['׳\"״]")
+HASH_CHARS = 16  # hex chars kept per hashed term (64 bits)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    created REAL NOT NULL,
+    session_date TEXT NOT NULL,
+    title BLOB,
+    tags BLOB,
+    summary BLOB NOT NULL,
+    filename BLOB,
+    mime TEXT,
+    artifact BLOB,
+    artifact_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS summaries_date ON summaries (session_date, created);
+CREATE VIRTUAL TABLE IF NOT EXISTS summaries_index USING fts5 (terms, tokenize = 'ascii');
+"""
+
+
+@dataclass
+class ArchiveEntry:
+    id: int
+    created: float
+    session_date: str
+    title: str
+    tags: list = field(default_factory=list)
+    filename: str = None
+    mime: str = None
+    artifact_bytes: int = 0
+    summary: str = None  # loaded by get(); search() fills excerpt instead
+    excerpt: str = ""
+
+
+def normalize(text: str) -> str:
+    return NIQQUD_PATTERN.sub("", text).lower()
+
+
+def word_forms(word: str) -> list:
+    """The word plus its stems without up to two attached prefix letters."""
+    forms = [word]
+    for i in (1, 2):
+        if len(word) - i >= MIN_STEM_LENGTH and all(letter in PREFIX_LETTERS for letter in word[:i]):
+            forms.append(word[i:])
+    return forms
+
+
+def words(text: str) -> list:
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+def parse_tags(value: str) -> list:
+    """Tags from comma-separated input, in order and without duplicates."""
+    return list(dict.fromkeys(tag.strip() for tag in (value or "").split(",") if tag.strip()))
+
+
+class SummaryArchive:
+    """Thread-safe; path None (or no encryption key) keeps the archive in memory."""
+
+    def __init__(self, path: str = None, encryption_key: str = None):
+        self._fernet = None
+        if path and encryption_key:
+            from cryptography.fernet import Fernet
+
+            self._fernet = Fernet(encryption_key)
+        else:
+            path = ":memory:"  # never write summaries to disk unencrypted
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # Index terms are keyed with a key derived from the encryption key
+        self._term_key = hmac.new((encryption_key or "").encode("utf-8"), b"archive-index", hashlib.sha256).digest()
+        self._lock = threading.Lock()
+        self._tags = None  # every tag in use, decrypted once on first tags() call
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def _seal(self, data: bytes):
+        if data is None:
+            return None
+        return self._fernet.encrypt(data) if self._fernet else data
+
+    def _open(self, data: bytes):
+        if data is None:
+            return None
+        return self._fernet.decrypt(data) if self._fernet else data
+
+    def _open_text(self, data: bytes) -> str:
+        value = self._open(data)
+        return value.decode("utf-8") if value is not None else None
+
+    def _term(self, form: str) -> str:
+        return hmac.new(self._term_key, form.encode("utf-8"), hashlib.sha256).hexdigest()[:HASH_CHARS]
+
+    def _tag_term(self, tag: str) -> str:
+        return "t" + self._term("#" + normalize(tag.strip()))
+
+    def index_terms(self, text: str, tags=()) -> str:
+        """The FTS5 document for a summary: hashed word forms and tags, space-separated."""
+        forms = {form for word in words(text) for form in word_forms(word)}
+        return " ".join([self._term(form) for form in forms] + [self._tag_term(tag) for tag in tags])
+
+    def _match_expression(self, query: str, tags=()) -> str:
+        """Every query word must match (any of its forms), and every tag."""
+        groups = []
+        for word in dict.fromkeys(words(query)):
+            # The query word's own form, or its stem when the query has a prefix the notes don't
+            forms = dict.fromkeys(self._term(form) for form in word_forms(word))
+            groups.append("(" + " OR ".join(f'"{term}"' for term in forms) + ")")
+        groups.extend(f'"{self._tag_term(tag)}"' for tag in tags if tag.strip())
+        return " AND ".join(groups)
+
+    def add(self, summary: str, artifact: bytes = None, filename: str = None, mime: str = None,
+            title: str = None, tags=(), session_date: str = None) -> int:
+        """Archives a summary (and its download) and returns its id. session_date is YYYY-MM-DD (default today)."""
+        tags = [tag.strip() for tag in tags if tag.strip()]
+        now = time.time()
+        terms = self.index_terms(f"{title or ''}\n{summary}", tags)
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                entry_id = self._db.execute(
+                    "INSERT INTO summaries (created, session_date, title, tags, summary, filename, mime, artifact,"
+                    " artifact_bytes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (now, session_date or time.strftime("%Y-%m-%d", time.localtime(now)),
+                     self._seal((title or "").encode("utf-8")),
+                     self._seal(json.dumps(tags, ensure_ascii=False).encode("utf-8")),
+                     self._seal(summary.encode("utf-8")),
+                     self._seal(filename.encode("utf-8")) if filename else None, mime,
+                     self._seal(artifact), len(artifact or b"")),
+                ).lastrowid
+                self._db.execute("INSERT INTO summaries_index (rowid, terms) VALUES (?, ?)", (entry_id, terms))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if self._tags is not None:
+                self._tags.update(tags)
+        return entry_id
+
+    def search(self, query: str = "", tags=(), date_from: str = None, date_to: str = None,
+               limit: int = 50) -> list:
+        """
+        Entries matching every word of query and every tag, within the date
+        range (YYYY-MM-DD, inclusive), best matches first (newest first
+        without a query). Each entry carries an excerpt around the first match.
+        """
+        conditions, params = [], []
+        match = self._match_expression(query, tags)
+        if match:
+            conditions.append("summaries_index MATCH ?")
+            params.append(match)
+        if date_from:
+            conditions.append("s.session_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("s.session_date <= ?")
+            params.append(date_to)
+        where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+        columns = "s.id, s.created, s.session_date, s.title, s.tags, s.filename, s.mime, s.artifact_bytes, s.summary"
+        order = "s.session_date DESC, s.created DESC"
+        if match:
+            # bm25 over the hashed terms still ranks by term frequency and rarity
+            sql = (f"SELECT {columns} FROM summaries_index JOIN summaries s ON s.id = summaries_index.rowid"
+                   f" {where} ORDER BY bm25(summaries_index), {order} LIMIT ?")
+        else:
+            sql = f"SELECT {columns} FROM summaries s {where} ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        query_words = words(query)
+        entries = []
+        for row in rows:
+            entry = self._entry(row[:8])
+            entry.excerpt = excerpt(self._open_text(row[8]), query_words)
+            entries.append(entry)
+        return entries
+
+    def _entry(self, row) -> ArchiveEntry:
+        return ArchiveEntry(
+            id=row[0], created=row[1], session_date=row[2], title=self._open_text(row[3]) or "",
+            tags=json.loads(self._open_text(row[4]) or "[]"), filename=self._open_text(row[5]), mime=row[6],
+            artifact_bytes=row[7],
+        )
+
+    def get(self, entry_id: int):
+        """The entry with its full summary (None if unknown)."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, created, session_date, title, tags, filename, mime, artifact_bytes, summary"
+                " FROM summaries WHERE id = ?", (entry_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = self._entry(row[:8])
+        entry.summary = self._open_text(row[8])
+        return entry
+
+    def artifact(self, entry_id: int) -> bytes:
+        """The archived download; raises KeyError for an unknown entry."""
+        with self._lock:
+            row = self._db.execute("SELECT artifact FROM summaries WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            raise KeyError(entry_id)
+        return self._open(row[0])
+
+    def reader(self, entry_id: int):
+        """Zero-argument callable returning the archived download, for st.download_button(data=...)."""
+        return lambda: self.artifact(entry_id)
+
+    def delete(self, entry_id: int) -> bool:
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                deleted = self._db.execute("DELETE FROM summaries WHERE id = ?", (entry_id,)).rowcount
+                self._db.execute("DELETE FROM summaries_index WHERE rowid = ?", (entry_id,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._tags = None  # the entry's tags may have been the last of their kind
+        return bool(deleted)
+
+    def tags(self) -> list:
+        """Every tag in use, for filter suggestions. The first call decrypts every row's tags."""
+        with self._lock:
+            if self._tags is None:
+                rows = self._db.execute("SELECT tags FROM summaries").fetchall()
+                self._tags = {tag for (blob,) in rows for tag in json.loads(self._open_text(blob) or "[]")}
+            return sorted(self._tags)
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+
+def excerpt(text: str, query_words: list, width: int = 160) -> str:
+    """A short piece of text around the first occurrence of a query word (or its stem)."""
+    if not text:
+        return ""
+    start = 0
+    normalized = normalize(text)
+    positions = [normalized.find(form) for word in query_words for form in word_forms(word)]
+    positions = [p for p in positions if p >= 0]
+    if positions:
+        # normalize() drops characters, so the position is approximate; widen a little to compensate
+        start = max(0, min(positions) - width // 3)
+    snippet = text[start:start + width].replace("\n", " ").strip()
+    return ("…" if start else "") + snippet + ("…" if start + width < len(text) else "")
@@ -0,0 +1,171 @@
+"""
+Content-addressed store for rendered downloads (DOCX, ZIP).
+
+Each artifact is written once under the hash of its content and the page
+only keeps its id; the bytes are read back when the download button is
+actually clicked, instead of being copied into Streamlit's media storage on
+every rerun. Identical documents share one copy. Artifacts expire
+ttl_seconds after they were last stored or read, and each session may
+reference at most session_max_bytes; beyond that its oldest artifacts are
+released (and deleted once no session references them).
+
+Artifacts hold summaries, so like the job store they are encrypted with
+Fernet on disk, and kept in memory only when no encryption key is
+configured.
+"""
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class ArtifactTooLargeError(ValueError):
+    """A single artifact is larger than the per-session cap."""
+
+
+class ArtifactStore:
+    """Thread-safe; directory None (or no encryption key) keeps artifacts in memory."""
+
+    def __init__(self, directory: str = None, encryption_key: str = None, ttl_seconds: float = 3600,
+                 session_max_bytes: int = 20 * 1024 * 1024):
+        self._fernet = None
+        if directory and encryption_key:
+            from cryptography.fernet import Fernet
+
+            self._fernet = Fernet(encryption_key)
+            os.makedirs(directory, exist_ok=True)
+        else:
+            directory = None  # never write summaries to disk unencrypted
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.session_max_bytes = session_max_bytes
+        # Keyed ids, so an id doesn't reveal whether a guessed document is stored
+        self._id_key = (encryption_key or "").encode("utf-8")
+        self._lock = threading.Lock()
+        self._sizes = {}  # artifact id -> stored size (encrypted on disk)
+        self._touched = {}  # artifact id -> last store/read time
+        self._memory = {}  # artifact id -> bytes, when not on disk
+        self._sessions = {}  # session id -> OrderedDict(artifact id -> size), oldest first
+        self._last_eviction = 0.0
+        if directory:
+            self._load_existing()
+
+    def _load_existing(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp") or not os.path.isfile(path):
+                continue
+            if now - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                continue
+            # Left over from before a restart: no session references it until it is stored again
+            self._sizes[name] = os.path.getsize(path)
+            self._touched[name] = os.path.getmtime(path)
+
+    def _path(self, artifact_id: str) -> str:
+        return os.path.join(self.directory, artifact_id)
+
+    def artifact_id(self, data: bytes) -> str:
+        return hmac.new(self._id_key, data, hashlib.sha256).hexdigest()
+
+    def put(self, data: bytes, session_id: str = None) -> str:
+        """Stores data (once per content) for the session and returns its id."""
+        if len(data) > self.session_max_bytes:
+            raise ArtifactTooLargeError(
+                f"Artifact of {len(data)} bytes exceeds the per-session cap of {self.session_max_bytes} bytes."
+            )
+        artifact_id = self.artifact_id(data)
+        self.evict_expired()
+        with self._lock:
+            if artifact_id not in self._sizes:
+                if self.directory:
+                    sealed = self._fernet.encrypt(data)
+                    self._write(artifact_id, sealed)
+                    self._sizes[artifact_id] = len(sealed)
+                else:
+                    self._memory[artifact_id] = data
+                    self._sizes[artifact_id] = len(data)
+            self._touched[artifact_id] = time.time()
+            if session_id is not None:
+                self._reference(session_id, artifact_id, len(data))
+        return artifact_id
+
+    def _write(self, artifact_id: str, sealed: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(sealed)
+        os.replace(tmp_path, self._path(artifact_id))
+
+    def _reference(self, session_id: str, artifact_id: str, size: int):
+        refs = self._sessions.setdefault(session_id, OrderedDict())
+        refs[artifact_id] = size
+        refs.move_to_end(artifact_id)
+        while sum(refs.values()) > self.session_max_bytes:
+            released, _ = refs.popitem(last=False)
+            self._drop_if_unreferenced(released)
+
+    def _drop_if_unreferenced(self, artifact_id: str):
+        if any(artifact_id in refs for refs in self._sessions.values()):
+            return
+        self._sizes.pop(artifact_id, None)
+        self._touched.pop(artifact_id, None)
+        if self._memory.pop(artifact_id, None) is None and self.directory:
+            try:
+                os.remove(self._path(artifact_id))
+            except FileNotFoundError:
+                pass
+
+    def get(self, artifact_id: str) -> bytes:
+        """The artifact's bytes; raises KeyError once it has expired or been released."""
+        with self._lock:
+            if artifact_id not in self._sizes:
+                raise KeyError(artifact_id)
+            self._touched[artifact_id] = time.time()
+            data = self._memory.get(artifact_id)
+        if data is not None:
+            return data
+        with open(self._path(artifact_id), "rb") as f:
+            return self._fernet.decrypt(f.read())
+
+    def reader(self, artifact_id: str):
+        """Zero-argument callable returning the artifact, for st.download_button(data=...)."""
+        return lambda: self.get(artifact_id)
+
+    def evict_expired(self, force: bool = False) -> int:
+        """Deletes artifacts not stored or read for ttl_seconds (checked at most once a minute)."""
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_eviction < 60:
+                return 0
+            self._last_eviction = now
+            expired = [a for a, touched in self._touched.items() if now - touched > self.ttl_seconds]
+            for refs in self._sessions.values():
+                for artifact_id in expired:
+                    refs.pop(artifact_id, None)
+            for artifact_id in expired:
+                self._drop_if_unreferenced(artifact_id)
+            for session_id in [s for s, refs in self._sessions.items() if not refs]:
+                del self._sessions[session_id]
+        return len(expired)
+
+    def session_bytes(self, session_id: str) -> int:
+        with self._lock:
+            return sum(self._sessions.get(session_id, {}).values())
+
+    def live_bytes(self) -> int:
+        """Bytes held by all stored artifacts, on disk or in memory."""
+        with self._lock:
+            return sum(self._sizes.values())
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "artifacts": len(self._sizes),
+                "live_bytes": sum(self._sizes.values()),
+                "sessions": len(self._sessions),
+                "on_disk": self.directory is not None,
+            }
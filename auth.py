@@ -0,0 +1,56 @@
+"""
+Signed, expiring login tokens.
+
+After a successful password login the browser keeps a token in a cookie, so
+returning within its lifetime skips the password prompt. A token is just its
+expiry time and an HMAC of it, keyed by the app password (and an optional
+extra secret): changing the password invalidates every token issued before.
+"""
+import hashlib
+import hmac
+import time
+
+AUTH_COOKIE = "therapist_helper_auth"
+
+
+def _signature(expires: int, secret: str) -> str:
+    key = hashlib.sha256(f"auth-token:{secret}".encode("utf-8")).digest()
+    return hmac.new(key, str(expires).encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def issue_token(secret: str, ttl_seconds: float, now: float = None) -> str:
+    expires = int((time.time() if now is None else now) + ttl_seconds)
+    return f"{expires}.{_signature(expires, secret)}"
+
+
+def verify_token(token: str, secret: str, now: float = None) -> bool:
+    """True if token was issued with this secret and hasn't expired."""
+    if not isinstance(token, str):
+        return False
+    expires_text, _, signature = token.partition(".")
+    if not expires_text.isdigit() or not signature:
+        return False
+    expires = int(expires_text)
+    if expires < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(signature, _signature(expires, secret))
+
+
+def sign_value(value: str, secret: str) -> str:
+    """value with an HMAC of it appended, for links that must not be guessed or altered."""
+    key = hashlib.sha256(f"signed-value:{secret}".encode("utf-8")).digest()
+    return f"{value}.{hmac.new(key, value.encode('utf-8'), hashlib.sha256).hexdigest()}"
+
+
+def unsign_value(signed: str, secret: str):
+    """The value from sign_value's output if the signature matches this secret, else None."""
+    if not isinstance(signed, str):
+        return None
+    value, _, signature = signed.rpartition(".")
+    if not value or not signature:
+        return None
+    return value if hmac.compare_digest(sign_value(value, secret), signed) else None
+
+
+def password_matches(given: str, expected: str) -> bool:
+    return hmac.compare_digest(given.encode("utf-8"), expected.encode("utf-8"))
@@ -0,0 +1,193 @@
+"""
+Batch summarization: many sets of session notes in, one ZIP of DOCX files out.
+
+Notes can come from several text areas in the app, from uploaded
+.txt/.csv/.jsonl files, or from the command line:
+
+    python batch.py notes.jsonl day2.csv -o summaries.zip --workers 4
+
+Items are summarized concurrently with a bounded thread pool; a failure in
+one item is recorded on its result and never stops the rest of the batch.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+DEFAULT_MAX_WORKERS = 4
+TXT_SESSION_SEPARATOR = re.compile(r"^\s*-{3,}\s*$", re.MULTILINE)
+
+
+@dataclass
+class BatchItem:
+    name: str
+    notes: str
+
+
+@dataclass
+class BatchResult:
+    item: BatchItem
+    summary: str = ""
+    docx: bytes = None
+    error: str = None
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_batch_file(filename: str, data: bytes) -> list:
+    """
+    Parses an uploaded notes file into batch items:
+    .txt   - one session, or several separated by a line of '---'
+    .csv   - a 'notes' column (else the first column), optional 'name' column
+    .jsonl - one object per line with 'notes' (or 'text') and optional 'name'
+    """
+    text = data.decode("utf-8-sig")
+    stem, ext = os.path.splitext(os.path.basename(filename))
+    ext = ext.lower()
+    items = []
+
+    if ext == ".txt":
+        for part in TXT_SESSION_SEPARATOR.split(text):
+            if part.strip():
+                items.append(BatchItem(name=stem, notes=part.strip()))
+    elif ext == ".csv":
+        rows = list(csv.reader(io.StringIO(text)))
+        if not rows:
+            return []
+        header = [h.strip().lower() for h in rows[0]]
+        if "notes" in header:
+            notes_col = header.index("notes")
+            name_col = header.index("name") if "name" in header else None
+            rows = rows[1:]
+        else:
+            notes_col, name_col = 0, None
+        for row in rows:
+            if len(row) > notes_col and row[notes_col].strip():
+                name = row[name_col].strip() if name_col is not None and len(row) > name_col else stem
+                items.append(BatchItem(name=name or stem, notes=row[notes_col].strip()))
+    elif ext == ".jsonl":
+        for line_no, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{filename}:{line_no}: invalid JSON ({e.msg})") from None
+            notes = str(record.get("notes") or record.get("text") or "").strip()
+            if notes:
+                items.append(BatchItem(name=str(record.get("name") or stem), notes=notes))
+    else:
+        raise ValueError(f"Unsupported notes file type '{ext}' (expected .txt, .csv or .jsonl).")
+
+    if len(items) > 1:
+        for i, item in enumerate(items, start=1):
+            if item.name == stem:
+                item.name = f"{stem}_{i}"
+    return items
+
+
+def iter_batch(items: list, summarize, render, max_workers: int = DEFAULT_MAX_WORKERS):
+    """
+    Runs summarize(notes) -> str and render(summary) -> bytes for every item on a
+    bounded thread pool and yields (index, BatchResult) as each item finishes.
+    """
+    def process(item):
+        started = time.perf_counter()
+        result = BatchResult(item=item)
+        try:
+            result.summary = summarize(item.notes)
+            result.docx = render(result.summary)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        result.seconds = time.perf_counter() - started
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="batch") as pool:
+        futures = {pool.submit(process, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def run_batch(items: list, summarize, render, max_workers: int = DEFAULT_MAX_WORKERS) -> list:
+    """Like iter_batch, but waits for all items and returns results in input order."""
+    results = [None] * len(items)
+    for index, result in iter_batch(items, summarize, render, max_workers):
+        results[index] = result
+    return results
+
+
+def safe_filename(name: str) -> str:
+    cleaned = re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("._")
+    return cleaned[:60] or "session"
+
+
+def build_zip(results: list) -> bytes:
+    """Packs each successful result as NN_<name>.docx; failures go into errors.txt."""
+    bio = io.BytesIO()
+    errors = []
+    with zipfile.ZipFile(bio, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for i, result in enumerate(results, start=1):
+            if result.ok:
+                zf.writestr(f"{i:02d}_{safe_filename(result.item.name)}.docx", result.docx)
+            else:
+                errors.append(f"{i:02d} {result.item.name}: {result.error}")
+        if errors:
+            zf.writestr("errors.txt", "\n".join(errors) + "\n")
+    return bio.getvalue()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize many session notes into a ZIP of DOCX files.")
+    parser.add_argument("inputs", nargs="+", help=".txt, .csv or .jsonl notes files")
+    parser.add_argument("-o", "--output", default="summaries.zip", help="output ZIP path")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent Gemini requests")
+    parser.add_argument("--template", default=None, help="registered DOCX template name")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        print("GEMINI_API_KEY is not set.", file=sys.stderr)
+        return 2
+
+    from summary_core import generate_narrative_summary, render_summary_docx
+
+    items = []
+    for path in args.inputs:
+        with open(path, "rb") as f:
+            items.extend(parse_batch_file(path, f.read()))
+    if not items:
+        print("No notes found in the given files.", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    results = [None] * len(items)
+    for index, result in iter_batch(
+        items,
+        summarize=lambda notes: generate_narrative_summary(api_key, notes),
+        render=lambda summary: render_summary_docx(summary, args.template).data,
+        max_workers=args.workers,
+    ):
+        results[index] = result
+        status = "ok" if result.ok else f"ERROR {result.error}"
+        print(f"[{index + 1}/{len(items)}] {result.item.name}: {status} ({result.seconds:.1f}s)", file=sys.stderr)
+
+    with open(args.output, "wb") as f:
+        f.write(build_zip(results))
+    failed = sum(1 for r in results if not r.ok)
+    print(f"Wrote {args.output}: {len(results) - failed} ok, {failed} failed, "
+          f"{time.perf_counter() - started:.1f}s total", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
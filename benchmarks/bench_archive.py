@@ -0,0 +1,137 @@
+"""
+Search and re-download benchmark for the local summary archive.
+
+Fills an encrypted archive with synthetic Hebrew summaries (each with a
+small DOCX-sized download), then measures archiving one summary, searching
+by words, tags and dates, and reading a download back:
+
+    python benchmarks/bench_archive.py --entries 20000 --queries 200 --json archive.json
+
+The archive is written to a temporary directory and removed afterwards;
+no Gemini calls are made.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+SENTENCES = (
+    "המטופלת מתארת תחושות חרדה וקשיי הירדמות שהחמירו בחודשים האחרונים.",
+    "בפגישה עלו קשיים בתקשורת עם בני המשפחה ותחושת בדידות.",
+    "הומלץ על תרגול טכניקות נשימה וניהול יומן מחשבות.",
+    "מדווחת על שיפור קל בתפקוד בעבודה ובשגרת היום.",
+    "המטופל שיתף בזיכרונות מהשירות הצבאי ובסיוטים חוזרים.",
+    "דובר על גבולות בקשר עם ההורים ועל הדרכת הורים לקראת המעבר לחטיבה.",
+    "נבנתה תוכנית חשיפה הדרגתית למצבים חברתיים.",
+    "הוחלט להעלות את תדירות המפגשים לפעמיים בשבוע.",
+)
+TAGS = ("חרדה", "דיכאון", "הדרכת הורים", "טראומה", "זוגי", "ילדים", "CBT", "מעקב")
+QUERIES = ("חרדה", "הירדמות", "בעבודה", "משפחה בדידות", "הדרכת הורים", "סיוטים", "חשיפה הדרגתית", "נשימה")
+
+
+def synthetic_entry(rng) -> dict:
+    summary = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(8, 20)))
+    day = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(730))
+    return {
+        "summary": summary,
+        "artifact": rng.randbytes(rng.randint(12_000, 20_000)),
+        "title": " ".join(summary.split()[:8]),
+        "tags": rng.sample(TAGS, rng.randint(0, 2)),
+        "session_date": day.isoformat(),
+    }
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def timed_ms(action) -> tuple:
+    started = time.perf_counter()
+    value = action()
+    return (time.perf_counter() - started) * 1000, value
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000, help="summaries to archive before measuring")
+    parser.add_argument("--queries", type=int, default=200, help="searches to time")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    from cryptography.fernet import Fernet
+
+    from archive import SummaryArchive
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory(prefix="archive-bench-") as workdir:
+        path = os.path.join(workdir, "archive.sqlite3")
+        archive = SummaryArchive(path, encryption_key=Fernet.generate_key().decode())
+        add_ms = []
+        for _ in range(args.entries):
+            entry = synthetic_entry(rng)
+            add_ms.append(timed_ms(lambda: archive.add(
+                entry["summary"], entry["artifact"], filename="summary.docx",
+                mime="application/octet-stream", title=entry["title"], tags=entry["tags"],
+                session_date=entry["session_date"],
+            ))[0])
+
+        searches = {"words": [], "words_and_tag": [], "dates": [], "latest": []}
+        results = []
+        for i in range(args.queries):
+            query = QUERIES[i % len(QUERIES)]
+            tag = TAGS[i % len(TAGS)]
+            start = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(700))
+            elapsed, found = timed_ms(lambda: archive.search(query, limit=20))
+            searches["words"].append(elapsed)
+            results.append(len(found))
+            searches["words_and_tag"].append(timed_ms(lambda: archive.search(query, [tag], limit=20))[0])
+            searches["dates"].append(timed_ms(lambda: archive.search(
+                date_from=start.isoformat(), date_to=(start + datetime.timedelta(days=30)).isoformat(), limit=20,
+            ))[0])
+            searches["latest"].append(timed_ms(lambda: archive.search(limit=20))[0])
+
+        ids = [rng.randint(1, args.entries) for _ in range(args.queries)]
+        download_ms = [timed_ms(lambda: archive.artifact(entry_id))[0] for entry_id in ids]
+        tags_ms = timed_ms(archive.tags)[0]
+        database_mb = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir)) / 1e6
+
+    results = {
+        "benchmark": "archive",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "entries": args.entries,
+        "database_mb": round(database_mb, 1),
+        "add_ms": round(statistics.median(add_ms), 2),
+        "tags_first_call_ms": round(tags_ms, 1),
+        "mean_results_per_word_query": round(statistics.mean(results), 1),
+        "search_ms": {
+            kind: {"p50": round(statistics.median(samples), 2), "p95": round(percentile(samples, 0.95), 2)}
+            for kind, samples in searches.items()
+        },
+        "download_ms": {"p50": round(statistics.median(download_ms), 2),
+                        "p95": round(percentile(download_ms, 0.95), 2)},
+    }
+    print(f"{args.entries} summaries, {results['database_mb']} MB on disk, add {results['add_ms']} ms each")
+    print(f"{'search':>14} {'p50 ms':>8} {'p95 ms':>8}")
+    for kind, row in results["search_ms"].items():
+        print(f"{kind:>14} {row['p50']:>8} {row['p95']:>8}")
+    print(f"{'download':>14} {results['download_ms']['p50']:>8} {results['download_ms']['p95']:>8}")
+    print(f"tags (first call, decrypts every row): {results['tags_first_call_ms']} ms")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
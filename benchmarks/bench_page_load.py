@@ -0,0 +1,101 @@
+"""
+Page load benchmark for the Streamlit app, run headless with AppTest.
+
+Measures the server side of time to interactive: the first script run of a
+new session (login page), the login round trip, and a steady-state rerun of
+the main page. Also reports the markup the page sends on every rerun and
+the remote assets (fonts, icons, stylesheets) a browser has to fetch before
+the page settles:
+
+    python benchmarks/bench_page_load.py --sessions 5 --reruns 10 --json page.json
+
+No Gemini calls are made; only the page itself is rendered.
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)
+
+APP_PASSWORD = "benchmark-password"
+REMOTE_ASSET = re.compile(r"""(?:@import\s+url\(|src=|<link[^>]*?href=|url\()\s*['"]?(https?://[^'")\s>]+)""")
+
+
+def page_markup(at) -> list:
+    return [element.value for element in (*at.markdown, *at.get("html")) if isinstance(element.value, str)]
+
+
+def timed(action) -> float:
+    started = time.perf_counter()
+    action()
+    return (time.perf_counter() - started) * 1000
+
+
+def measure_session(reruns: int) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(REPO_ROOT, "patient_doc_generator.py"), default_timeout=60)
+    at.secrets["APP_PASSWORD"] = APP_PASSWORD
+    at.secrets["GEMINI_API_KEY"] = "offline-benchmark"
+    at.secrets["TELEMETRY_LOG_PATH"] = ""
+    first_run_ms = timed(at.run)
+
+    def login():
+        at.text_input(key="password_field").input(APP_PASSWORD)
+        at.button(key="login_button").click().run()
+
+    login_ms = timed(login)
+    if at.exception:
+        raise RuntimeError(f"App raised: {at.exception}")
+    rerun_ms = [timed(at.run) for _ in range(reruns)]
+    markup = page_markup(at)
+    return {
+        "first_run_ms": first_run_ms,
+        "login_ms": login_ms,
+        "rerun_ms": statistics.median(rerun_ms),
+        "markup_bytes": sum(len(text.encode("utf-8")) for text in markup),
+        "remote_assets": sorted({url for text in markup for url in REMOTE_ASSET.findall(text)}),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=5, help="fresh sessions to measure")
+    parser.add_argument("--reruns", type=int, default=10, help="steady-state reruns per session")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    samples = [measure_session(args.reruns) for _ in range(args.sessions)]
+    results = {
+        "benchmark": "page_load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sessions": args.sessions,
+        # The first session also pays for imports and template/prompt setup
+        "cold_first_run_ms": round(samples[0]["first_run_ms"], 1),
+        "first_run_ms": round(statistics.median(s["first_run_ms"] for s in samples[1:] or samples), 1),
+        "login_ms": round(statistics.median(s["login_ms"] for s in samples), 1),
+        "rerun_ms": round(statistics.median(s["rerun_ms"] for s in samples), 1),
+        "markup_bytes_per_rerun": samples[-1]["markup_bytes"],
+        "remote_assets": samples[-1]["remote_assets"],
+    }
+    for key in ("cold_first_run_ms", "first_run_ms", "login_ms", "rerun_ms", "markup_bytes_per_rerun"):
+        print(f"{key:>24}: {results[key]}")
+    print(f"{'remote_assets':>24}: {len(results['remote_assets'])}")
+    for url in results["remote_assets"]:
+        print(f"{'':>26}{url}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
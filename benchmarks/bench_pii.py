@@ -0,0 +1,131 @@
+"""
+Throughput benchmark for the local PII scrubber.
+
+Builds synthetic Hebrew session notes of several sizes, seeded with names,
+ID numbers, phone numbers, emails and addresses, and measures scrubbing the
+notes plus restoring a summary-sized answer, as done around every Gemini
+request:
+
+    python benchmarks/bench_pii.py --sizes 1000 10000 100000 --repeat 20 --json pii.json
+
+Everything runs locally; no Gemini calls are made.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+FILLER = (
+    "המטופלת מתארת תחושות חרדה וקשיי הירדמות שהחמירו בחודשים האחרונים.",
+    "בפגישה עלו קשיים בתקשורת עם בני המשפחה ותחושת בדידות.",
+    "הומלץ על תרגול טכניקות נשימה וניהול יומן מחשבות.",
+    "מדווחת על שיפור קל בתפקוד בעבודה ובשגרת היום.",
+    "קופ\"ח כללית, הפגישה התקיימה בזום.",
+)
+IDENTIFIERS = (
+    "פגישה עם {name}, בת {age}.",
+    "הבת {name} מלווה את הטיפול, טלפון 05{d}-{ddd}{dddd}.",
+    "ת\"ז {israeli_id}.",
+    "גרה ברחוב הרצל {house} בקומה שלישית.",
+    "ניתן ליצור קשר במייל family{house}@example.com.",
+    "ול{name} יש קשר טוב עם השכנים.",
+    "התייעצות עם ד\"ר {word_name} לגבי הטיפול התרופתי.",
+    "תחושה יותר טובה אחרי השיחה עם {word_name}.",
+)
+NAMES = ("יעל", "מיכל", "יונתן", "אסתר", "משה", "נועה", "רחל", "איתי")
+WORD_NAMES = ("טובה", "אלון", "תמר", "נועם")  # names that are also everyday words
+
+
+def israeli_id(rng) -> str:
+    """A random 9-digit ID number with a valid check digit."""
+    from pii_scrubber import valid_israeli_id
+
+    base = f"{rng.randrange(10 ** 8):08d}"
+    return next(base + str(check) for check in range(10) if valid_israeli_id(base + str(check)))
+
+
+def synthetic_notes(chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    while sum(len(s) + 1 for s in sentences) < chars:
+        if rng.random() < 0.3:
+            sentences.append(rng.choice(IDENTIFIERS).format(
+                name=rng.choice(NAMES), word_name=rng.choice(WORD_NAMES), age=rng.randint(20, 90),
+                d=rng.randint(0, 9), ddd=rng.randint(100, 999), dddd=rng.randint(1000, 9999),
+                israeli_id=israeli_id(rng), house=rng.randint(1, 200),
+            ))
+        else:
+            sentences.append(rng.choice(FILLER))
+    return " ".join(sentences)[:chars]
+
+
+def measure(notes: str, repeat: int) -> dict:
+    from pii_scrubber import Scrubber
+
+    scrub_ms, restore_ms = [], []
+    replaced = 0
+    for _ in range(repeat):
+        scrubber = Scrubber()
+        started = time.perf_counter()
+        scrubbed = scrubber.scrub(notes)
+        scrub_ms.append((time.perf_counter() - started) * 1000)
+        # The answer is roughly a page, whatever the length of the notes
+        answer = scrubbed[:4000]
+        started = time.perf_counter()
+        scrubber.restore(answer)
+        restore_ms.append((time.perf_counter() - started) * 1000)
+        replaced = scrubber.replaced
+    if scrubber.restore(scrubbed) != notes:
+        raise RuntimeError("Restoring the scrubbed notes did not give back the original text.")
+    median_scrub = statistics.median(scrub_ms)
+    return {
+        "chars": len(notes),
+        "identifiers_replaced": replaced,
+        "scrub_ms": round(median_scrub, 3),
+        "restore_ms": round(statistics.median(restore_ms), 3),
+        "scrub_mb_per_s": round(len(notes.encode("utf-8")) / 1e6 / (median_scrub / 1000), 2),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="notes sizes in characters")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per size (the median is reported)")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    import pii_scrubber
+
+    started = time.perf_counter()
+    pii_scrubber.identifier_pattern()
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    results = {
+        "benchmark": "pii_scrubber",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "names_in_dictionary": len(pii_scrubber.HEBREW_FIRST_NAMES),
+        "word_names_in_dictionary": len(pii_scrubber.WORD_FIRST_NAMES),
+        "pattern_compile_ms": round(compile_ms, 2),
+        "sizes": [measure(synthetic_notes(size), args.repeat) for size in args.sizes],
+    }
+    print(f"pattern compile (once per process): {results['pattern_compile_ms']} ms")
+    print(f"{'chars':>8} {'replaced':>9} {'scrub ms':>9} {'restore ms':>11} {'MB/s':>7}")
+    for row in results["sizes"]:
+        print(f"{row['chars']:>8} {row['identifiers_replaced']:>9} {row['scrub_ms']:>9} {row['restore_ms']:>11} "
+              f"{row['scrub_mb_per_s']:>7}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Offline end-to-end benchmark of the summary pipeline.
+
+Runs the real summary_core.generate_narrative_summary path (prompt registry,
+summary cache, scheduler, retries) and the real DOCX template renderer, with
+Gemini replaced by the local stand-in from fake_gemini.py. No network or API
+key is needed:
+
+    python benchmarks/bench_pipeline.py --sessions 8 --requests-per-session 5 \\
+        --ttft-ms 400 --chunk-chars 120 --failure-rate 0.05 --json run.json
+
+Reported: end-to-end latency percentiles (p50/p95/p99), throughput across
+N concurrent sessions, summarize vs DOCX render time, and peak Python memory
+allocated per request (measured in a separate sequential pass).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.chdir(REPO_ROOT)  # the default DOCX template path is relative to the repo
+
+from fake_gemini import FakeGeminiClient, FakeGeminiConfig  # noqa: E402
+
+BENCH_API_KEY = "offline-benchmark"
+SAMPLE_NOTES = (
+    "פגישה עם מטופלת בת 40, נשואה ואם לשלושה. מתארת עומס רגשי בעבודה ובבית, קשיי שינה "
+    "ותחושת בדידות. מספרת על ריבים עם בן הזוג סביב חלוקת האחריות. מבקשת כלים להתמודדות "
+    "עם לחץ. סוכם על מפגשים שבועיים ותרגול הרפיה."
+)
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(p / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize_latencies(values: list) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+
+def notes_for(session: int, request: int, note_repeats: int, unique: bool) -> str:
+    notes = " ".join([SAMPLE_NOTES] * note_repeats)
+    # A unique suffix defeats the summary cache so every request reaches "Gemini"
+    return f"{notes} (פגישה {session}-{request})" if unique else notes
+
+
+def run_one(core, notes: str, session_id: str, stream: bool) -> dict:
+    started = time.perf_counter()
+    on_chunk = (lambda partial: None) if stream else None
+    summary = core.generate_narrative_summary(BENCH_API_KEY, notes, on_chunk=on_chunk, session_id=session_id)
+    summarized = time.perf_counter()
+    rendered = core.render_summary_docx(summary)
+    finished = time.perf_counter()
+    return {
+        "total_ms": (finished - started) * 1000,
+        "summarize_ms": (summarized - started) * 1000,
+        "render_ms": rendered.render_ms,
+        "docx_bytes": len(rendered.data),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the summary pipeline.")
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions")
+    parser.add_argument("--requests-per-session", type=int, default=5)
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="stand-in time to first token")
+    parser.add_argument("--inter-chunk-ms", type=float, default=30.0)
+    parser.add_argument("--chunk-chars", type=int, default=120)
+    parser.add_argument("--output-chars", type=int, default=2400)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--note-repeats", type=int, default=1, help="multiply the sample notes to test long inputs")
+    parser.add_argument("--no-stream", action="store_true", help="use non-streaming generate_content")
+    parser.add_argument("--cache-hits", action="store_true", help="repeat identical notes to measure cache hits")
+    parser.add_argument("--memory-samples", type=int, default=5, help="sequential requests traced for memory")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="write results to this JSON file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    # Generous limits so the stand-in, not the rate limiter, is what's measured
+    os.environ.setdefault("GEMINI_RPM", "1000000")
+    os.environ.setdefault("GEMINI_TPM", "1000000000")
+    os.environ.setdefault("GEMINI_MAX_CONCURRENCY", str(max(8, args.sessions)))
+    os.environ.setdefault("GEMINI_MAX_RETRIES", "6")
+    os.environ.setdefault("SUMMARY_CACHE_DIR", "")
+
+    import summary_core as core
+
+    fake_config = FakeGeminiConfig(
+        time_to_first_token_ms=args.ttft_ms,
+        inter_chunk_ms=args.inter_chunk_ms,
+        chunk_chars=args.chunk_chars,
+        output_chars=args.output_chars,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+    fake_client = FakeGeminiClient(fake_config)
+    core.install_gemini_client(BENCH_API_KEY, fake_client)
+    stream = not args.no_stream
+    unique = not args.cache_hits
+
+    # Warm-up: imports, template parse, scheduler start
+    run_one(core, notes_for(-1, 0, args.note_repeats, True), "warmup", stream)
+
+    # Concurrent pass: one thread per session, each sending its requests in sequence
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def session_worker(session: int):
+        for request in range(args.requests_per_session):
+            try:
+                sample = run_one(core, notes_for(session, request, args.note_repeats, unique), f"session-{session}", stream)
+                with lock:
+                    samples.append(sample)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(session_worker, range(args.sessions)))
+    wall_seconds = time.perf_counter() - wall_started
+
+    # Sequential pass under tracemalloc for per-request memory
+    memory_peaks = []
+    tracemalloc.start()
+    for i in range(args.memory_samples):
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        run_one(core, notes_for(10_000, i, args.note_repeats, unique), "memory", stream)
+        _, peak = tracemalloc.get_traced_memory()
+        memory_peaks.append(peak - baseline)
+    tracemalloc.stop()
+
+    results = {
+        "benchmark": "pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {**vars(args), "stream": stream},
+        "end_to_end": summarize_latencies([s["total_ms"] for s in samples]),
+        "summarize": summarize_latencies([s["summarize_ms"] for s in samples]),
+        "docx_render": summarize_latencies([s["render_ms"] for s in samples]),
+        "throughput": {
+            "sessions": args.sessions,
+            "completed": len(samples),
+            "failed": len(errors),
+            "wall_seconds": round(wall_seconds, 3),
+            "requests_per_second": round(len(samples) / wall_seconds, 3) if wall_seconds else 0.0,
+        },
+        "memory_per_request": {
+            "samples": len(memory_peaks),
+            "peak_kib_median": round(percentile(memory_peaks, 50) / 1024, 1),
+            "peak_kib_max": round(max(memory_peaks) / 1024, 1) if memory_peaks else 0.0,
+        },
+        "stand_in": dict(fake_client.stats),
+        "scheduler": core.get_gemini_scheduler(BENCH_API_KEY).stats(),
+        "summary_cache": core.get_summary_cache().stats(),
+        "errors": errors[:20],
+    }
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"e2e p50 {results['end_to_end']['p50_ms']} ms, p95 {results['end_to_end']['p95_ms']} ms, "
+              f"{results['throughput']['requests_per_second']} req/s -> {args.json}")
+    else:
+        print(output)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
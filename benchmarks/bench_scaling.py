@@ -0,0 +1,202 @@
+"""
+Load test for the multi-process deployment (JOB_BROKER_URL + python -m worker).
+
+Starts 1, 2, 4... worker processes against one broker, submits summary jobs
+from this process the way the Streamlit app does, and reports throughput and
+job latency for each worker count. Gemini is replaced by the local stand-in
+from fake_gemini.py in every worker, so no API key or network is needed:
+
+    python benchmarks/bench_scaling.py --processes 1 2 4 --threads 4 --jobs 200 --json scaling.json
+    python benchmarks/bench_scaling.py --broker-url redis://localhost:6379/15   # Redis instead of SQLite
+    python benchmarks/bench_scaling.py --rate-limit-rpm 600                     # also check the shared RPM limit
+
+After each run the same notes are submitted again: those jobs should all be
+served from the shared summary cache, whichever worker first summarized them.
+With --rate-limit-rpm, a final run checks that the workers together stay
+within GEMINI_RPM once the burst allowance is used up.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, BENCH_DIR)
+os.chdir(REPO_ROOT)  # the default DOCX template path is relative to the repo
+
+BENCH_API_KEY = "offline-benchmark"
+SAMPLE_NOTES = (
+    "פגישה עם מטופלת בת 40, נשואה ואם לשלושה. מתארת עומס רגשי בעבודה ובבית, קשיי שינה "
+    "ותחושת בדידות. סוכם על מפגשים שבועיים ותרגול הרפיה."
+)
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def worker_process(api_key: str, threads: int, ttft_ms: float, calls, slot: int):
+    """A worker as started by python -m worker, with Gemini replaced by the stand-in."""
+    from fake_gemini import FakeGeminiClient, FakeGeminiConfig
+
+    import summary_core
+
+    fake_client = FakeGeminiClient(FakeGeminiConfig(time_to_first_token_ms=ttft_ms, inter_chunk_ms=10.0))
+    summary_core.install_gemini_client(api_key, fake_client)
+    summary_core.get_job_queue(api_key, workers=threads)
+    while True:
+        calls[slot] = fake_client.stats["calls"]
+        time.sleep(0.1)
+
+
+def wait_for(queue, job_ids: list, timeout: float) -> list:
+    deadline = time.time() + timeout
+    pending = set(job_ids)
+    while pending and time.time() < deadline:
+        pending = {job_id for job_id in pending if queue.status(job_id) in ("queued", "running")}
+        time.sleep(0.05)
+    if pending:
+        raise RuntimeError(f"{len(pending)} jobs did not finish within {timeout:.0f} s.")
+    return [queue.get(job_id) for job_id in job_ids]
+
+
+def submit_all(queue, notes: list) -> list:
+    return [queue.submit("summary", {"notes": text, "session_id": f"bench-{i % 16}"}, session_id=f"bench-{i % 16}")
+            for i, text in enumerate(notes)]
+
+
+def run(processes: int, args, api_key: str, round_id: int, rpm_limited: bool = False) -> dict:
+    import summary_core
+
+    queue = summary_core.get_job_queue(api_key)  # this process only submits, like the app
+    context = multiprocessing.get_context("spawn")
+    calls = context.Array("i", processes)
+    workers = [context.Process(target=worker_process, args=(api_key, args.threads, args.ttft_ms, calls, slot),
+                               daemon=True)
+               for slot in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        count = int(args.rate_limit_rpm * 1.5) if rpm_limited else args.jobs
+        notes = [f"{SAMPLE_NOTES} ({round_id}-{i})" for i in range(count)]
+        started = time.perf_counter()
+        jobs = wait_for(queue, submit_all(queue, notes), args.timeout)
+        wall = time.perf_counter() - started
+        failed = [job.error for job in jobs if job.status != "done"]
+        latencies = [(job.updated - job.created) * 1000 for job in jobs]
+        time.sleep(0.3)  # let the workers publish their final call counts
+        gemini_calls = sum(calls)
+        result = {
+            "processes": processes,
+            "threads_per_process": args.threads,
+            "jobs": len(jobs),
+            "failed": len(failed),
+            "wall_seconds": round(wall, 2),
+            "jobs_per_second": round(len(jobs) / wall, 2),
+            "latency_p50_ms": round(percentile(latencies, 0.5), 1),
+            "latency_p95_ms": round(percentile(latencies, 0.95), 1),
+            "gemini_calls": gemini_calls,
+            "errors": failed[:5],
+        }
+        if rpm_limited:
+            # The bucket starts full (one minute's worth); the other half has to wait for refills
+            result["expected_min_seconds"] = round((count - args.rate_limit_rpm) / (args.rate_limit_rpm / 60), 1)
+            return result
+
+        # The same notes again: every job should be a shared-cache hit, with no new Gemini calls
+        started = time.perf_counter()
+        repeat = wait_for(queue, submit_all(queue, notes), args.timeout)
+        repeat_wall = time.perf_counter() - started
+        time.sleep(0.3)
+        result.update({
+            "repeat_jobs_per_second": round(len(repeat) / repeat_wall, 2),
+            "repeat_gemini_calls": sum(calls) - gemini_calls,
+        })
+        return result
+    finally:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4], help="worker process counts to run")
+    parser.add_argument("--threads", type=int, default=4, help="job threads per worker process")
+    parser.add_argument("--jobs", type=int, default=200, help="jobs per run")
+    parser.add_argument("--ttft-ms", type=float, default=400.0, help="stand-in time to first token")
+    parser.add_argument("--broker-url", help="broker to use (default: a temporary SQLite file)")
+    parser.add_argument("--rate-limit-rpm", type=float, help="also run once with this shared GEMINI_RPM")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds to wait for a run")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    from cryptography.fernet import Fernet
+
+    workdir = tempfile.mkdtemp(prefix="scaling-bench-")
+    # Workers are spawned, so they inherit these settings through the environment
+    os.environ.update({
+        "JOB_BROKER_URL": args.broker_url or f"sqlite:///{os.path.join(workdir, 'broker.sqlite3')}",
+        "SUMMARY_CACHE_KEY": Fernet.generate_key().decode(),
+        "TEMPLATE_CACHE_DIR": os.path.join(workdir, "templates"),
+        "TELEMETRY_LOG_PATH": "",
+        "GEMINI_RPM": "1000000",
+        "GEMINI_TPM": "1000000000",
+        "GEMINI_MAX_CONCURRENCY": str(args.threads),
+        "JOB_WORKERS": "0",
+    })
+    try:
+        import summary_core
+
+        summary_core.publish_templates()
+        runs = [run(processes, args, BENCH_API_KEY, round_id) for round_id, processes in enumerate(args.processes)]
+        rate_limited = None
+        if args.rate_limit_rpm:
+            # Another API key gets fresh shared buckets, created by the workers with the lower limit
+            os.environ["GEMINI_RPM"] = str(args.rate_limit_rpm)
+            rate_limited = run(max(args.processes), args, BENCH_API_KEY + "-rate-limited", len(args.processes),
+                               rpm_limited=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base = runs[0]["jobs_per_second"]
+    results = {
+        "benchmark": "scaling",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "broker": "redis" if args.broker_url and not args.broker_url.startswith("sqlite") else "sqlite",
+        "config": vars(args),
+        "runs": runs,
+        "speedup": {str(r["processes"]): round(r["jobs_per_second"] / base, 2) for r in runs},
+        "rate_limited": rate_limited,
+    }
+    print(f"{'procs':>6} {'jobs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'calls':>6}"
+          f" {'cached jobs/s':>14} {'cached calls':>13}")
+    for r in runs:
+        print(f"{r['processes']:>6} {r['jobs_per_second']:>8} {r['latency_p50_ms']:>8} {r['latency_p95_ms']:>8}"
+              f" {results['speedup'][str(r['processes'])]:>8} {r['gemini_calls']:>6}"
+              f" {r['repeat_jobs_per_second']:>14} {r['repeat_gemini_calls']:>13}")
+    for r in runs:
+        if r["failed"]:
+            print(f"{r['processes']} processes: {r['failed']} jobs failed, e.g. {r['errors'][0]}")
+    if rate_limited:
+        print(f"shared RPM {args.rate_limit_rpm:g}: {rate_limited['jobs']} jobs on {rate_limited['processes']} processes"
+              f" took {rate_limited['wall_seconds']} s (at least {rate_limited['expected_min_seconds']} s expected)")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 1 if any(r["failed"] for r in runs) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
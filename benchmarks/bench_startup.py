@@ -0,0 +1,77 @@
+"""
+Cold-start benchmark for the headless entry points.
+
+Runs each command in a fresh interpreter several times and reports the
+median and minimum wall time, so regressions in import cost show up:
+
+    python benchmarks/bench_startup.py --runs 10 --json startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "import summary_core": [sys.executable, "-c", "import summary_core"],
+    "summarize --help": [sys.executable, "-m", "summarize", "--help"],
+    "import summary_core + prompts + templates": [
+        sys.executable, "-c", "import summary_core, prompts, docx_templates, gemini_scheduler"
+    ],
+    "import Streamlit app (reference)": [sys.executable, "-c", "import patient_doc_generator"],
+}
+
+
+def time_command(command: list, runs: int) -> dict:
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": runs,
+        "median_ms": round(statistics.median(timings), 1),
+        "min_ms": round(min(timings), 1),
+        "max_ms": round(max(timings), 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {
+        "benchmark": "startup",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "results": {},
+    }
+    baseline = time_command([sys.executable, "-c", "pass"], args.runs)
+    results["results"]["python (empty)"] = baseline
+    for name, command in COMMANDS.items():
+        try:
+            results["results"][name] = time_command(command, args.runs)
+        except subprocess.CalledProcessError as e:
+            results["results"][name] = {"error": f"exit code {e.returncode}"}
+
+    for name, result in results["results"].items():
+        if "error" in result:
+            print(f"{name:45s} {result['error']}")
+        else:
+            print(f"{name:45s} median {result['median_ms']:8.1f} ms   min {result['min_ms']:8.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
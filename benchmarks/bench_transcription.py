@@ -0,0 +1,105 @@
+"""
+Benchmark for local transcription of dictated notes.
+
+Transcribes the given recordings with the same model and settings as the
+app, and reports for each one the real-time factor (processing seconds per
+second of audio), the time until the first text appears, and peak memory:
+
+    python benchmarks/bench_transcription.py dictation1.m4a dictation2.wav --repeat 3 --json transcription.json
+    python benchmarks/bench_transcription.py notes.wav --model small --compute-type int8 --threads 4
+
+The model is loaded once, before the first run, and its load time is reported
+separately. Needs faster-whisper; audio and text stay on this machine.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def run(transcriber, path: str) -> dict:
+    started = time.perf_counter()
+    first_text_at = []
+
+    def on_text(_text):
+        if not first_text_at:
+            first_text_at.append(time.perf_counter() - started)
+
+    transcript = transcriber.transcribe(path, on_text=on_text)
+    return {
+        "audio_seconds": round(transcript.audio_seconds, 2),
+        "seconds": round(transcript.seconds, 3),
+        "real_time_factor": round(transcript.real_time_factor, 3),
+        "first_text_seconds": round(first_text_at[0], 3) if first_text_at else None,
+        "chunks": transcript.chunks,
+        "peak_rss_mb": round(transcript.peak_rss_mb, 1),
+        "added_rss_mb": round(transcript.added_rss_mb, 1),
+        "text_chars": len(transcript.text),
+    }
+
+
+def main(argv=None) -> int:
+    from transcription import CHUNK_SECONDS, DEFAULT_MODEL, Transcriber, transcription_available
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("audio", nargs="+", help="recordings to transcribe (any format FFmpeg reads)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="faster-whisper model name or local directory")
+    parser.add_argument("--compute-type", default="int8", help="CTranslate2 compute type")
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads (default: all CPUs)")
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--chunk-seconds", type=float, default=CHUNK_SECONDS)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per recording")
+    parser.add_argument("--json", help="write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not transcription_available():
+        print("faster-whisper is not installed (pip install faster-whisper).", file=sys.stderr)
+        return 2
+    transcriber = Transcriber(model_name=args.model, compute_type=args.compute_type, cpu_threads=args.threads,
+                              beam_size=args.beam_size, chunk_seconds=args.chunk_seconds)
+    started = time.perf_counter()
+    transcriber._get_model()
+    load_seconds = time.perf_counter() - started
+
+    recordings = []
+    print(f"{'recording':<30} {'audio s':>8} {'RTF':>7} {'first text s':>13} {'peak MB':>8} {'added MB':>9}")
+    for path in args.audio:
+        runs = [run(transcriber, path) for _ in range(args.repeat)]
+        summary = {
+            "path": path,
+            "audio_seconds": runs[0]["audio_seconds"],
+            "real_time_factor": round(statistics.median(r["real_time_factor"] for r in runs), 3),
+            "first_text_seconds": runs[0]["first_text_seconds"],
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+            "added_rss_mb": max(r["added_rss_mb"] for r in runs),
+            "runs": runs,
+        }
+        recordings.append(summary)
+        print(f"{os.path.basename(path)[:30]:<30} {summary['audio_seconds']:>8} {summary['real_time_factor']:>7}"
+              f" {summary['first_text_seconds'] if summary['first_text_seconds'] is not None else '-':>13}"
+              f" {summary['peak_rss_mb']:>8} {summary['added_rss_mb']:>9}")
+    print(f"model {args.model} ({args.compute_type}, {transcriber.cpu_threads} threads) loaded in {load_seconds:.1f} s")
+
+    results = {
+        "benchmark": "transcription",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+        "load_seconds": round(load_seconds, 2),
+        "recordings": recordings,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
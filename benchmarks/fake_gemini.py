@@ -0,0 +1,137 @@
+"""
+Local stand-in for the google-genai client, for offline benchmarks.
+
+Implements the parts of genai.Client the app uses (models / aio.models
+generate_content, generate_content_stream and count_tokens, caches.create)
+with configurable latency, streaming chunk sizes and failure rates. Responses
+are built from the request's notes so every request does real work on the
+prompt, cache and DOCX side.
+"""
+import asyncio
+import random
+import threading
+import time
+import types
+from dataclasses import dataclass
+
+from google.genai import errors as genai_errors
+
+
+@dataclass
+class FakeGeminiConfig:
+    time_to_first_token_ms: float = 400.0
+    latency_jitter: float = 0.25  # +/- fraction applied to every delay
+    output_chars: int = 2400
+    chunk_chars: int = 120
+    inter_chunk_ms: float = 30.0
+    failure_rate: float = 0.0  # fraction of calls failing with a retryable error
+    failure_status: int = 503
+    seed: int = None
+
+
+def _usage(prompt_chars: int, output_chars: int):
+    prompt_tokens = prompt_chars // 3
+    output_tokens = output_chars // 3
+    return types.SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        cached_content_token_count=0,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+def _prompt_chars(contents, config) -> int:
+    chars = len(getattr(config, "system_instruction", None) or "")
+    for content in contents:
+        for part in content.parts:
+            chars += len(part.text or "")
+    return chars
+
+
+class _FakeModelsBase:
+    def __init__(self, config: FakeGeminiConfig, stats: dict):
+        self.config = config
+        self.stats = stats
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def _delay(self, ms: float) -> float:
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.config.latency_jitter, self.config.latency_jitter)
+            return max(0.0, ms * factor / 1000)
+
+    def _maybe_fail(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            failed = self._random.random() < self.config.failure_rate
+            if failed:
+                self.stats["failures"] += 1
+        if failed:
+            raise genai_errors.APIError(self.config.failure_status, {
+                "error": {"code": self.config.failure_status, "message": "fake failure", "status": "UNAVAILABLE"}
+            })
+
+    def _response_text(self, contents) -> str:
+        notes = contents[-1].parts[0].text or ""
+        seed_text = (" ".join(notes.split()) or "סיכום") + " "
+        return (seed_text * (self.config.output_chars // len(seed_text) + 1))[:self.config.output_chars]
+
+    def _chunks(self, text: str):
+        size = max(1, self.config.chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeAsyncModels(_FakeModelsBase):
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self._delay(self.config.time_to_first_token_ms))
+        self._maybe_fail()
+        text = self._response_text(contents)
+        await asyncio.sleep(self._delay(self.config.inter_chunk_ms * (len(self._chunks(text)) - 1)))
+        return types.SimpleNamespace(text=text, candidates=None,
+                                     usage_metadata=_usage(_prompt_chars(contents, config), len(text)))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        text = self._response_text(contents)
+        chunks = self._chunks(text)
+        usage = _usage(_prompt_chars(contents, config), len(text))
+
+        async def stream():
+            await asyncio.sleep(self._delay(self.config.time_to_first_token_ms))
+            self._maybe_fail()
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(self._delay(self.config.inter_chunk_ms))
+                yield types.SimpleNamespace(text=chunk, usage_metadata=usage if i == len(chunks) - 1 else None)
+
+        return stream()
+
+    async def count_tokens(self, model, contents, config=None):
+        return types.SimpleNamespace(total_tokens=_prompt_chars(contents, config) // 3)
+
+
+class FakeSyncModels(_FakeModelsBase):
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self._delay(self.config.time_to_first_token_ms))
+        self._maybe_fail()
+        text = self._response_text(contents)
+        return types.SimpleNamespace(text=text, candidates=None,
+                                     usage_metadata=_usage(_prompt_chars(contents, config), len(text)))
+
+    def count_tokens(self, model, contents, config=None):
+        return types.SimpleNamespace(total_tokens=_prompt_chars(contents, config) // 3)
+
+
+class FakeCaches:
+    def create(self, model, config=None):
+        return types.SimpleNamespace(name=f"cachedContents/fake-{abs(hash((model, config.display_name)))}")
+
+
+class FakeGeminiClient:
+    """Drop-in for genai.Client in summary_core.install_gemini_client()."""
+
+    def __init__(self, config: FakeGeminiConfig = None):
+        self.config = config or FakeGeminiConfig()
+        self.stats = {"calls": 0, "failures": 0}
+        self.models = FakeSyncModels(self.config, self.stats)
+        self.aio = types.SimpleNamespace(models=FakeAsyncModels(self.config, self.stats))
+        self.caches = FakeCaches()
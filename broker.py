@@ -0,0 +1,427 @@
+"""
+Shared state for running the app as several processes (or machines).
+
+Streamlit frontends submit summary jobs to a broker, and worker processes
+(python -m worker) run them. The broker holds what the processes have to
+agree on:
+
+- the job queue, with leases, so a job whose worker dies is run by another,
+- a shared tier of the summary cache (Fernet tokens only, never plain text),
+- the DOCX templates registered by the frontends, so workers render with the
+  same files,
+- token buckets for the Gemini requests/minute and tokens/minute quotas, so
+  the quota of an API key is shared by every process using it.
+
+Two backends, picked by JOB_BROKER_URL: SQLite (sqlite:///data/broker.sqlite3,
+for processes on one machine or on storage they all reach) and Redis
+(redis://host:6379/0, or any local server speaking the Redis protocol).
+Session notes and summaries are always encrypted, so a broker needs a key.
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from gemini_scheduler import TokenBucket
+from jobs import DONE, FAILED, QUEUED, RUNNING, Job, JobStore
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_cache (key TEXT PRIMARY KEY, token BLOB NOT NULL, expires REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS templates (name TEXT PRIMARY KEY, content_hash TEXT NOT NULL, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+"""
+CACHE_PRUNE_EVERY = 200  # puts between deletions of expired cache rows
+
+
+def open_broker(url: str, encryption_key: str):
+    """A SqliteBroker or RedisBroker for the URL. Raises ValueError for an unknown scheme or a missing key."""
+    if not encryption_key:
+        raise ValueError("A job broker needs an encryption key (JOB_STORE_KEY or SUMMARY_CACHE_KEY).")
+    if url.startswith("sqlite:///"):
+        return SqliteBroker(url[len("sqlite:///"):], encryption_key)
+    if url.split("://", 1)[0] in ("redis", "rediss", "unix"):
+        return RedisBroker(url, encryption_key)
+    raise ValueError(f"Unsupported JOB_BROKER_URL '{url}' (use sqlite:///path or redis://host:port/db).")
+
+
+def bucket_name(kind: str, api_key: str) -> str:
+    """Rate limits are per API key; the key itself is never stored."""
+    return f"{kind}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+
+
+# --- SQLite ---
+class SqliteBroker:
+    def __init__(self, path: str, encryption_key: str):
+        self.path = path
+        self._encryption_key = encryption_key
+        self._job_store = None
+        self._lock = threading.Lock()
+        self._puts = 0
+        # The job store creates the file (and its directory); the other tables share it
+        self._db = sqlite3.connect(self.job_store().path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.executescript(SQLITE_SCHEMA)
+
+    def job_store(self) -> JobStore:
+        if self._job_store is None:
+            self._job_store = JobStore(self.path, encryption_key=self._encryption_key)
+        return self._job_store
+
+    def _transaction(self, work):
+        """Runs work() under the database write lock, so read-modify-write is atomic across processes."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work()
+                self._db.execute("COMMIT")
+                return value
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def token_bucket(self, name: str, rate_per_minute: float) -> TokenBucket:
+        return SqliteTokenBucket(self, name, rate_per_minute)
+
+    def cache_get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT token FROM summary_cache WHERE key = ? AND expires > ?",
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def cache_put(self, key: str, token: bytes, ttl_seconds: float):
+        now = time.time()
+        with self._lock:
+            self._puts += 1
+            self._db.execute("INSERT OR REPLACE INTO summary_cache (key, token, expires) VALUES (?, ?, ?)",
+                             (key, token, now + ttl_seconds))
+            if self._puts % CACHE_PRUNE_EVERY == 0:
+                self._db.execute("DELETE FROM summary_cache WHERE expires <= ?", (now,))
+
+    def put_template(self, name: str, data: bytes) -> str:
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO templates (name, content_hash, data) VALUES (?, ?, ?)",
+                             (name, content_hash, data))
+        return content_hash
+
+    def template_hash(self, name: str):
+        with self._lock:
+            row = self._db.execute("SELECT content_hash FROM templates WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def get_template(self, name: str):
+        with self._lock:
+            row = self._db.execute("SELECT data FROM templates WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    A TokenBucket whose level lives in the broker. Taking tokens waits on the
+    database lock or a network round trip, so on the scheduler's event loop
+    it runs in a thread and the other requests keep streaming meanwhile.
+    """
+
+    async def take(self, amount: float) -> float:
+        return await asyncio.to_thread(self.try_take, amount)
+
+    async def charge(self, delta: float):
+        await asyncio.to_thread(self.adjust, delta)
+
+
+class SqliteTokenBucket(SharedTokenBucket):
+    """A TokenBucket whose level is kept in the broker database, shared by every process using it."""
+
+    def __init__(self, broker: SqliteBroker, name: str, rate_per_minute: float):
+        super().__init__(rate_per_minute)
+        self._broker = broker
+        self.name = name
+
+    def _level(self, now: float) -> float:
+        row = self._broker._db.execute("SELECT tokens, updated FROM rate_limits WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return self.capacity
+        return min(self.capacity, row[0] + max(0.0, now - row[1]) * self.refill_per_second)
+
+    def _update(self, change):
+        """change(level) -> (new level, return value), applied atomically."""
+        def work():
+            now = time.time()
+            level, value = change(self._level(now))
+            self._broker._db.execute("INSERT OR REPLACE INTO rate_limits (name, tokens, updated) VALUES (?, ?, ?)",
+                                     (self.name, level, now))
+            return value
+
+        return self._broker._transaction(work)
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        with self._broker._lock:
+            level = self._level(time.time())
+        return 0.0 if level >= amount else (amount - level) / self.refill_per_second
+
+    def try_take(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        return self._update(lambda level: (level - amount, 0.0) if level >= amount
+                            else (level, (amount - level) / self.refill_per_second))
+
+    def adjust(self, delta: float):
+        self._update(lambda level: (min(self.capacity, level - delta), None))
+
+
+# --- Redis ---
+class RedisBroker:
+    """Redis (or a compatible server) as the broker; needs the redis package."""
+
+    def __init__(self, url: str, encryption_key: str, prefix: str = "therapist_helper:"):
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url)
+        self._encryption_key = encryption_key
+        self._job_store = None
+
+    def job_store(self):
+        if self._job_store is None:
+            self._job_store = RedisJobStore(self.client, self._encryption_key, self.prefix)
+        return self._job_store
+
+    def token_bucket(self, name: str, rate_per_minute: float) -> TokenBucket:
+        return RedisTokenBucket(self.client, self.prefix + "rate:" + name, rate_per_minute)
+
+    def cache_get(self, key: str):
+        return self.client.get(self.prefix + "cache:" + key)
+
+    def cache_put(self, key: str, token: bytes, ttl_seconds: float):
+        self.client.set(self.prefix + "cache:" + key, token, ex=max(1, int(ttl_seconds)))
+
+    def put_template(self, name: str, data: bytes) -> str:
+        content_hash = hashlib.sha256(data).hexdigest()
+        self.client.hset(self.prefix + "template:" + name, mapping={"content_hash": content_hash, "data": data})
+        return content_hash
+
+    def template_hash(self, name: str):
+        value = self.client.hget(self.prefix + "template:" + name, "content_hash")
+        return value.decode("ascii") if value else None
+
+    def get_template(self, name: str):
+        return self.client.hget(self.prefix + "template:" + name, "data")
+
+
+def _watched(client, keys: list, work):
+    """
+    Runs work(pipe) in an optimistic WATCH/MULTI transaction on keys, retrying
+    when another process changed them first. work reads with pipe (immediate
+    mode), calls pipe.multi() before queuing writes, and returns its value.
+    """
+    from redis.exceptions import WatchError
+
+    with client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(*keys)
+                value = work(pipe)
+                if pipe.explicit_transaction:
+                    pipe.execute()
+                else:
+                    pipe.unwatch()
+                return value
+            except WatchError:
+                continue
+
+
+class RedisTokenBucket(SharedTokenBucket):
+    """A TokenBucket kept in a Redis hash; the server clock is used so every node agrees on time."""
+
+    def __init__(self, client, key: str, rate_per_minute: float):
+        super().__init__(rate_per_minute)
+        self._client = client
+        self.key = key
+
+    def _level(self, reader) -> tuple:
+        seconds, micros = reader.time()
+        now = seconds + micros / 1e6
+        tokens, updated = reader.hmget(self.key, "tokens", "updated")
+        if tokens is None:
+            return self.capacity, now
+        return min(self.capacity, float(tokens) + max(0.0, now - float(updated)) * self.refill_per_second), now
+
+    def _update(self, change):
+        def work(pipe):
+            level, now = self._level(pipe)
+            level, value = change(level)
+            pipe.multi()
+            pipe.hset(self.key, mapping={"tokens": level, "updated": now})
+            pipe.expire(self.key, 3600)  # an idle bucket is full again after a minute anyway
+            return value
+
+        return _watched(self._client, [self.key], work)
+
+    def wait_time(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        level, _ = self._level(self._client)
+        return 0.0 if level >= amount else (amount - level) / self.refill_per_second
+
+    def try_take(self, amount: float) -> float:
+        amount = min(amount, self.capacity)
+        return self._update(lambda level: (level - amount, 0.0) if level >= amount
+                            else (level, (amount - level) / self.refill_per_second))
+
+    def adjust(self, delta: float):
+        self._update(lambda level: (min(self.capacity, level - delta), None))
+
+
+class RedisJobStore:
+    """
+    The JobStore interface on Redis: a hash per job, a list of queued ids
+    (oldest at the right), a sorted set of running ids scored by lease
+    expiry, and sorted sets of finished and failed ids scored by time.
+    """
+
+    def __init__(self, client, encryption_key: str, prefix: str = "therapist_helper:"):
+        from cryptography.fernet import Fernet
+
+        self._client = client
+        self._fernet = Fernet(encryption_key)
+        self.path = None
+        self._queue = prefix + "jobs:queued"
+        self._running = prefix + "jobs:running"
+        self._finished = {DONE: prefix + "jobs:done", FAILED: prefix + "jobs:failed"}
+        self._job_prefix = prefix + "job:"
+
+    def _key(self, job_id: str) -> str:
+        return self._job_prefix + job_id
+
+    def _seal(self, data: bytes):
+        return self._fernet.encrypt(data) if data is not None else b""
+
+    def _open(self, data: bytes):
+        return self._fernet.decrypt(data) if data else None
+
+    def add(self, kind: str, payload: dict, session_id: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        pipe = self._client.pipeline()
+        pipe.hset(self._key(job_id), mapping={
+            "kind": kind, "session_id": session_id or "", "status": QUEUED, "created": now, "updated": now,
+            "attempts": 0, "payload": self._seal(json.dumps(payload).encode("utf-8")),
+        })
+        pipe.lpush(self._queue, job_id)
+        pipe.execute()
+        return job_id
+
+    def claim_next(self, worker: str = None, lease_seconds: float = 60.0):
+        def work(pipe):
+            job_id = pipe.lindex(self._queue, -1)
+            if job_id is None:
+                return None
+            job_id = job_id.decode("ascii")
+            now = time.time()
+            pipe.multi()
+            pipe.rpop(self._queue)
+            pipe.hset(self._key(job_id), mapping={"status": RUNNING, "updated": now, "worker": worker or ""})
+            pipe.hincrby(self._key(job_id), "attempts", 1)
+            pipe.zadd(self._running, {job_id: now + lease_seconds})
+            return job_id
+
+        job_id = _watched(self._client, [self._queue], work)
+        return self.get(job_id) if job_id else None
+
+    def renew(self, job_ids: list, lease_seconds: float = 60.0):
+        if job_ids:
+            # XX: only jobs still running; a finished job must not reappear
+            self._client.zadd(self._running, {job_id: time.time() + lease_seconds for job_id in job_ids}, xx=True)
+
+    def _close(self, job_id: str, status: str, fields: dict):
+        now = time.time()
+        pipe = self._client.pipeline()
+        pipe.hset(self._key(job_id), mapping={"status": status, "updated": now, **fields})
+        pipe.hdel(self._key(job_id), "payload", "progress")
+        pipe.zrem(self._running, job_id)
+        pipe.zadd(self._finished[status], {job_id: now})
+        pipe.execute()
+
+    def finish(self, job_id: str, result: dict, artifact: bytes = None):
+        self._close(job_id, DONE, {"result": self._seal(json.dumps(result).encode("utf-8")),
+                                   "artifact": self._seal(artifact)})
+
+    def fail(self, job_id: str, error: str):
+        self._close(job_id, FAILED, {"error": error})
+
+    def set_progress(self, job_id: str, text: str):
+        self._client.hset(self._key(job_id), "progress", self._seal(text.encode("utf-8")))
+
+    def progress(self, job_id: str) -> str:
+        value = self._open(self._client.hget(self._key(job_id), "progress"))
+        return value.decode("utf-8") if value else ""
+
+    def get(self, job_id: str):
+        fields = {key.decode("ascii"): value for key, value in self._client.hgetall(self._key(job_id)).items()}
+        if not fields:
+            return None
+        text = lambda name: fields[name].decode("utf-8") if fields.get(name) else None  # noqa: E731
+        payload, result = self._open(fields.get("payload")), self._open(fields.get("result"))
+        return Job(
+            id=job_id, kind=text("kind"), session_id=text("session_id"), status=text("status"),
+            created=float(fields["created"]), updated=float(fields["updated"]), attempts=int(fields["attempts"]),
+            payload=json.loads(payload) if payload else {},
+            result=json.loads(result) if result else None,
+            artifact=self._open(fields.get("artifact")),
+            error=text("error"),
+        )
+
+    def status(self, job_id: str):
+        value = self._client.hget(self._key(job_id), "status")
+        return value.decode("ascii") if value else None
+
+    def position(self, job_id: str) -> int:
+        index = self._client.lpos(self._queue, job_id)
+        if index is None:
+            return 0
+        return self._client.llen(self._queue) - index - 1
+
+    def requeue_running(self) -> int:
+        return self._requeue(self._client.zrange(self._running, 0, -1))
+
+    def requeue_expired(self) -> int:
+        return self._requeue(self._client.zrangebyscore(self._running, "-inf", time.time()))
+
+    def _requeue(self, job_ids: list) -> int:
+        requeued = 0
+        for job_id in job_ids:
+            job_id = job_id.decode("ascii")
+
+            def work(pipe, job_id=job_id):
+                score = pipe.zscore(self._running, job_id)
+                if score is None:
+                    return 0  # finished, or requeued by another worker meanwhile
+                pipe.multi()
+                pipe.zrem(self._running, job_id)
+                pipe.hset(self._key(job_id), mapping={"status": QUEUED, "updated": time.time()})
+                pipe.hdel(self._key(job_id), "progress")
+                pipe.rpush(self._queue, job_id)  # back at the head of the queue
+                return 1
+
+            requeued += _watched(self._client, [self._running], work)
+        return requeued
+
+    def purge(self, older_than_seconds: float) -> int:
+        cutoff = time.time() - older_than_seconds
+        purged = 0
+        for finished in self._finished.values():
+            job_ids = self._client.zrangebyscore(finished, "-inf", cutoff)
+            if job_ids:
+                pipe = self._client.pipeline()
+                pipe.delete(*(self._key(job_id.decode("ascii")) for job_id in job_ids))
+                pipe.zrem(finished, *job_ids)
+                pipe.execute()
+                purged += len(job_ids)
+        return purged
+
+    def counts(self) -> dict:
+        counts = {QUEUED: self._client.llen(self._queue), RUNNING: self._client.zcard(self._running),
+                  DONE: self._client.zcard(self._finished[DONE]), FAILED: self._client.zcard(self._finished[FAILED])}
+        return {status: count for status, count in counts.items() if count}
@@ -0,0 +1,70 @@
+"""
+Splits long session notes into chunks for map-reduce summarization.
+
+Chunks break on paragraph boundaries where possible, then on sentence
+boundaries, and only as a last resort between words, so every chunk stays
+readable on its own. Packing is greedy from the start of the notes, so text
+appended at the end leaves the earlier chunks (and their cached partial
+summaries) unchanged.
+"""
+import re
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?׃;…])\s+|\n")
+
+
+def _pieces(text: str, max_chars: int, separators: tuple) -> list:
+    """Recursively splits text at the first separator that yields pieces under max_chars."""
+    if len(text) <= max_chars:
+        return [text]
+    if not separators:
+        words, pieces, current = text.split(), [], ""
+        for word in words:
+            while len(word) > max_chars:  # a single "word" longer than a chunk (e.g. a pasted URL)
+                if current:
+                    pieces.append(current)
+                    current = ""
+                pieces.append(word[:max_chars])
+                word = word[max_chars:]
+            if current and len(current) + 1 + len(word) > max_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+        return pieces
+    pieces = []
+    for part in separators[0].split(text):
+        part = part.strip()
+        if part:
+            pieces.extend(_pieces(part, max_chars, separators[1:]))
+    return pieces
+
+
+def split_notes(text: str, max_chars: int) -> list:
+    """
+    Splits notes into chunks of at most max_chars characters, packing whole
+    paragraphs (or sentences of an oversized paragraph) into each chunk.
+    Returns [text] unchanged when it already fits.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    chunks, current = [], []
+    current_len = 0
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        for piece in _pieces(paragraph, max_chars, (SENTENCE_END,)):
+            joiner_len = 1 if current else 0
+            if current and current_len + joiner_len + len(piece) > max_chars:
+                chunks.append("\n".join(current))
+                current, current_len, joiner_len = [], 0, 0
+            current.append(piece)
+            current_len += joiner_len + len(piece)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
@@ -0,0 +1,268 @@
+"""
+Export a rendered summary DOCX to other formats (PDF, HTML, Markdown).
+
+Every format is derived from the rendered DOCX, so the template's text,
+paragraph direction, alignment and emphasis carry over. The DOCX is parsed
+once; the formats are then produced concurrently. PDF is converted by a
+local LibreOffice (soffice), which lays the document out exactly as Word
+would; without one the PDF format is simply not offered.
+"""
+import html
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+
+
+@dataclass
+class ExportFormat:
+    key: str
+    label: str
+    extension: str
+    mime: str
+
+
+FORMATS = {
+    "docx": ExportFormat("docx", "DOCX", "docx",
+                         "application/vnd.openxmlformats-officedocument.wordprocessingml.document"),
+    "pdf": ExportFormat("pdf", "PDF", "pdf", "application/pdf"),
+    "html": ExportFormat("html", "HTML", "html", "text/html"),
+    "md": ExportFormat("md", "Markdown", "md", "text/markdown"),
+}
+
+
+@dataclass
+class ExportedFile:
+    format: str
+    filename: str
+    data: bytes
+    render_ms: float
+
+
+@dataclass
+class _Paragraph:
+    runs: list = field(default_factory=list)  # (text, bold, italic, underline); "\n" is a line break
+    heading: int = 0
+    rtl: bool = False
+    align: str = None
+
+
+@dataclass
+class _Layout:
+    paragraphs: list
+    font_pt: float = 12.0
+    space_after_pt: float = 8.0
+    page_width_mm: float = 210.0
+    margins_mm: tuple = (25.4, 25.4, 25.4, 25.4)  # top, right, bottom, left
+
+
+def find_soffice(path: str = None):
+    """Path to a LibreOffice executable (the given one, or soffice/libreoffice on PATH), or None."""
+    if path:
+        return path if os.path.exists(path) or shutil.which(path) else None
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def available_formats(soffice: str = None) -> list:
+    return [key for key in FORMATS if key != "pdf" or soffice]
+
+
+def _read_layout(docx_bytes: bytes) -> _Layout:
+    from docx import Document
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+    from docx.oxml.ns import qn
+
+    document = Document(BytesIO(docx_bytes))
+    alignments = {WD_ALIGN_PARAGRAPH.CENTER: "center", WD_ALIGN_PARAGRAPH.RIGHT: "right",
+                  WD_ALIGN_PARAGRAPH.LEFT: "left", WD_ALIGN_PARAGRAPH.JUSTIFY: "justify"}
+    paragraphs = []
+    for paragraph in document.paragraphs:
+        p_pr = paragraph._p.pPr
+        block = _Paragraph(
+            rtl=p_pr is not None and p_pr.find(qn("w:bidi")) is not None,
+            align=alignments.get(paragraph.alignment),
+        )
+        match = re.match(r"(?:Heading|Title)\s*(\d?)", paragraph.style.name or "")
+        if match:
+            block.heading = int(match.group(1) or 1)
+        for run in paragraph.runs:
+            # Runs keep <w:br/> as separate children; python-docx's run.text maps them to "\n"
+            block.runs.append((run.text, bool(run.bold), bool(run.italic), bool(run.underline)))
+        paragraphs.append(block)
+
+    layout = _Layout(paragraphs)
+    defaults = document.styles.element.find(qn("w:docDefaults"))
+    if defaults is not None:
+        size = defaults.find(f"{qn('w:rPrDefault')}/{qn('w:rPr')}/{qn('w:sz')}")
+        if size is not None:
+            layout.font_pt = int(size.get(qn("w:val"))) / 2
+        spacing = defaults.find(f"{qn('w:pPrDefault')}/{qn('w:pPr')}/{qn('w:spacing')}")
+        if spacing is not None and spacing.get(qn("w:after")) is not None:
+            layout.space_after_pt = int(spacing.get(qn("w:after"))) / 20
+    section = document.sections[0] if len(document.sections) else None
+    if section is not None and section.page_width:
+        layout.page_width_mm = section.page_width.mm
+        layout.margins_mm = tuple(
+            (value.mm if value is not None else 25.4)
+            for value in (section.top_margin, section.right_margin, section.bottom_margin, section.left_margin)
+        )
+    return layout
+
+
+def _trim(paragraphs: list) -> list:
+    """Drops empty paragraphs at the end (templates usually end with one)."""
+    paragraphs = list(paragraphs)
+    while paragraphs and not "".join(text for text, *_ in paragraphs[-1].runs).strip():
+        paragraphs.pop()
+    return paragraphs
+
+
+def layout_to_html(layout: _Layout, title: str = "") -> str:
+    blocks = []
+    for paragraph in _trim(layout.paragraphs):
+        parts = []
+        for text, bold, italic, underline in paragraph.runs:
+            part = html.escape(text).replace("\n", "<br>")
+            if bold:
+                part = f"<strong>{part}</strong>"
+            if italic:
+                part = f"<em>{part}</em>"
+            if underline:
+                part = f"<u>{part}</u>"
+            parts.append(part)
+        tag = f"h{min(paragraph.heading, 6)}" if paragraph.heading else "p"
+        attributes = ' dir="rtl"' if paragraph.rtl else ""
+        if paragraph.align:
+            attributes += f' style="text-align: {paragraph.align}"'
+        blocks.append(f"<{tag}{attributes}>{''.join(parts)}</{tag}>")
+    top, right, bottom, left = layout.margins_mm
+    body = "\n".join(blocks)
+    return f"""<!DOCTYPE html>
+<html lang="he" dir="rtl">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<style>
+    @page {{ margin: {top:.1f}mm {right:.1f}mm {bottom:.1f}mm {left:.1f}mm; }}
+    body {{ font-family: 'David', 'Arial Hebrew', Arial, sans-serif; font-size: {layout.font_pt:g}pt;
+            max-width: {layout.page_width_mm - left - right:.0f}mm; margin: 2em auto; line-height: 1.6; }}
+    p {{ margin: 0 0 {layout.space_after_pt:g}pt 0; }}
+</style>
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]<>])")
+MARKDOWN_BLOCK_MARK = re.compile(r"^(\s*)([#+\-])(?=\s)", re.MULTILINE)
+MARKDOWN_LIST_NUMBER = re.compile(r"^(\s*\d+)\.(?=\s)", re.MULTILINE)
+
+
+def _markdown_escape(text: str) -> str:
+    """Escapes characters Markdown would otherwise read as formatting, lists or headings."""
+    text = MARKDOWN_SPECIAL.sub(r"\\\1", text)
+    text = MARKDOWN_BLOCK_MARK.sub(r"\1\\\2", text)
+    return MARKDOWN_LIST_NUMBER.sub(r"\1\\.", text)
+
+
+def layout_to_markdown(layout: _Layout) -> str:
+    blocks = []
+    for paragraph in _trim(layout.paragraphs):
+        parts = []
+        for text, bold, italic, _underline in paragraph.runs:
+            part = _markdown_escape(text)
+            if part.strip():
+                if bold:
+                    part = f"**{part}**"
+                if italic:
+                    part = f"*{part}*"
+            parts.append(part)
+        text = "".join(parts)
+        # Blank lines inside a paragraph start a new one; single breaks stay hard line breaks
+        for chunk in re.split(r"\n\s*\n", text):
+            chunk = chunk.strip()
+            if not chunk:
+                continue
+            chunk = chunk.replace("\n", "  \n")
+            blocks.append("#" * min(paragraph.heading, 6) + " " + chunk if paragraph.heading else chunk)
+    return "\n\n".join(blocks) + "\n"
+
+
+def docx_to_pdf(docx_bytes: bytes, soffice: str, timeout: float = 120) -> bytes:
+    """Converts with a headless LibreOffice; each call uses its own profile so conversions can run in parallel."""
+    with tempfile.TemporaryDirectory(prefix="summary-export-") as workdir:
+        source = os.path.join(workdir, "summary.docx")
+        with open(source, "wb") as f:
+            f.write(docx_bytes)
+        profile = "file://" + os.path.join(workdir, "profile")
+        subprocess.run(
+            [soffice, f"-env:UserInstallation={profile}", "--headless", "--convert-to", "pdf",
+             "--outdir", workdir, source],
+            check=True, capture_output=True, timeout=timeout,
+        )
+        with open(os.path.join(workdir, "summary.pdf"), "rb") as f:
+            return f.read()
+
+
+def export_document(docx_bytes: bytes, formats: list, base_name: str, soffice: str = None,
+                    docx_render_ms: float = 0.0, max_workers: int = 4) -> list:
+    """
+    The DOCX plus each requested format as ExportedFile objects, in FORMATS
+    order. Formats are rendered concurrently; render_ms is per format.
+    Raises ValueError for unknown or unavailable formats.
+    """
+    unknown = [key for key in formats if key not in available_formats(soffice)]
+    if unknown:
+        raise ValueError(f"Export format(s) not available: {', '.join(unknown)}")
+    layout = None
+    layout_ms = 0.0
+    if "html" in formats or "md" in formats:
+        started = time.perf_counter()
+        layout = _read_layout(docx_bytes)
+        layout_ms = (time.perf_counter() - started) * 1000
+
+    renderers = {
+        "pdf": lambda: docx_to_pdf(docx_bytes, soffice),
+        "html": lambda: layout_to_html(layout, title=base_name).encode("utf-8"),
+        "md": lambda: layout_to_markdown(layout).encode("utf-8"),
+    }
+
+    def render(key):
+        started = time.perf_counter()
+        data = renderers[key]()
+        # The shared DOCX parse is counted toward each format that used it
+        extra_ms = layout_ms if key in ("html", "md") else 0.0
+        return key, data, (time.perf_counter() - started) * 1000 + extra_ms
+
+    files = {}
+    if "docx" in formats:
+        files["docx"] = (docx_bytes, docx_render_ms)
+    others = [key for key in formats if key != "docx"]
+    if others:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(others)), thread_name_prefix="export") as pool:
+            for key, data, render_ms in pool.map(render, others):
+                files[key] = (data, render_ms)
+    return [
+        ExportedFile(key, f"{base_name}.{FORMATS[key].extension}", *files[key])
+        for key in FORMATS if key in files
+    ]
+
+
+def bundle(files: list, base_name: str) -> tuple:
+    """(data, filename, mime) for one download: the file itself, or a ZIP of several."""
+    if len(files) == 1:
+        return files[0].data, files[0].filename, FORMATS[files[0].format].mime
+    bio = BytesIO()
+    with zipfile.ZipFile(bio, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for exported in files:
+            zf.writestr(exported.filename, exported.data)
+    return bio.getvalue(), f"{base_name}.zip", "application/zip"
@@ -0,0 +1,307 @@
+"""
+Rate-limit-aware scheduler for Gemini requests.
+
+A single asyncio event loop runs in a background thread per scheduler. Callers
+(Streamlit script threads, batch workers) submit request coroutines tagged
+with a session id and block until the result is ready. The scheduler
+
+- serves sessions round-robin, so one session's batch can't starve the others,
+- admits requests through token buckets for requests/minute and tokens/minute,
+- caps the number of requests in flight,
+- retries 429 and 5xx errors with exponential backoff and full jitter,
+- drops or interrupts a request when the caller's cancel event is set.
+"""
+import asyncio
+import atexit
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+_JOB_DONE = object()
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.refill_per_second = float(rate_per_minute) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)."""
+        with self._lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_second
+
+    def try_take(self, amount: float) -> float:
+        """Takes `amount` tokens if available and returns 0, else returns the wait time."""
+        with self._lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.refill_per_second
+
+    async def take(self, amount: float) -> float:
+        """try_take for the event loop; buckets whose level lives outside the process override it."""
+        return self.try_take(amount)
+
+    async def acquire(self, amount: float):
+        while True:
+            delay = await self.take(amount)
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def adjust(self, delta: float):
+        """Charges (positive) or refunds (negative) tokens once the real usage is known."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+    async def charge(self, delta: float):
+        """adjust for the event loop, like take."""
+        self.adjust(delta)
+
+
+class RequestCancelledError(RuntimeError):
+    """The caller cancelled the request before it completed."""
+
+
+def is_retryable(error: Exception) -> bool:
+    from google.genai import errors as genai_errors
+
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    # Network-level failures (timeouts, dropped connections) are worth retrying too
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__module__.startswith("httpx")
+
+
+class ScheduledJob:
+    def __init__(self, session_id: str, request, estimated_tokens: int):
+        self.session_id = session_id
+        self.request = request  # async callable: request(emit) -> (result, actual_tokens or None)
+        self.estimated_tokens = estimated_tokens
+        self.future = Future()
+        self.chunks = queue.Queue()
+        self.started = False
+        self.cancelled = False
+        self.task = None
+        self.attempts = 0
+        # Wake the waiting caller as soon as the job finishes
+        self.future.add_done_callback(lambda _: self.chunks.put(_JOB_DONE))
+
+    def emit(self, partial):
+        self.chunks.put(partial)
+
+
+class GeminiScheduler:
+    def __init__(self, requests_per_minute: float = 60, tokens_per_minute: float = 250_000,
+                 max_concurrency: int = 8, max_retries: int = 4,
+                 backoff_base_seconds: float = 1.0, backoff_max_seconds: float = 30.0,
+                 request_bucket: TokenBucket = None, token_bucket: TokenBucket = None):
+        # Buckets shared with other processes (broker.py) can be passed in instead
+        self.request_bucket = request_bucket or TokenBucket(requests_per_minute)
+        self.token_bucket = token_bucket or TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self._queues = OrderedDict()  # session_id -> deque[ScheduledJob], in round-robin order
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._avg_latency = 5.0  # EWMA of request latency in seconds, seeded with a guess
+        self.retries = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gemini-scheduler", daemon=True)
+        self._thread.start()
+        self._wakeup = None
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        atexit.register(self.close)
+
+    def close(self):
+        """Cancels outstanding work and stops the event loop thread."""
+        if not self._thread.is_alive():
+            return
+
+        async def cancel_tasks():
+            for task in asyncio.all_tasks():
+                if task is not asyncio.current_task():
+                    task.cancel()
+
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+    # --- Public API (any thread) ---
+
+    def call(self, session_id: str, request, estimated_tokens: int,
+             on_chunk=None, on_wait=None, cancel_event: threading.Event = None, poll_interval: float = 0.25):
+        """
+        Queues `request` for `session_id` and blocks until it completes, returning
+        its result. Partial results passed to emit() are forwarded to on_chunk in
+        the calling thread; while the job waits in the queue, on_wait receives
+        (jobs ahead, estimated wait in seconds). Setting cancel_event drops the
+        job from the queue or interrupts it in flight, and the call raises
+        RequestCancelledError.
+        """
+        job = ScheduledJob(session_id, request, estimated_tokens)
+        with self._lock:
+            self._queues.setdefault(session_id, deque()).append(job)
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+        while True:
+            try:
+                items = [job.chunks.get(timeout=poll_interval)]
+                while not job.chunks.empty():
+                    items.append(job.chunks.get_nowait())
+            except queue.Empty:
+                items = []
+            partials = [item for item in items if item is not _JOB_DONE]
+            # Only the newest accumulated text matters; skip stale ones
+            if partials and on_chunk is not None:
+                on_chunk(partials[-1])
+            if len(partials) < len(items):
+                return job.future.result()
+            if cancel_event is not None and cancel_event.is_set() and not job.cancelled:
+                job.cancelled = True
+                self._loop.call_soon_threadsafe(self._cancel, job)
+            if not job.started and on_wait is not None:
+                on_wait(*self.position(job))
+
+    def position(self, job: ScheduledJob = None) -> tuple:
+        """(jobs ahead of `job`, or all queued jobs if None; estimated wait in seconds)."""
+        with self._lock:
+            if job is None:
+                ahead = sum(len(q) for q in self._queues.values())
+                ahead_tokens = sum(j.estimated_tokens for q in self._queues.values() for j in q)
+            else:
+                # Round-robin: a job waits for up to its own index in every other session's queue
+                own_queue = self._queues.get(job.session_id, ())
+                index = next((i for i, j in enumerate(own_queue) if j is job), 0)
+                ahead, ahead_tokens = 0, 0
+                for q in self._queues.values():
+                    for j in list(q)[:index + (0 if q is own_queue else 1)]:
+                        ahead += 1
+                        ahead_tokens += j.estimated_tokens
+            in_flight = self._in_flight
+        return ahead, self._estimate_wait(ahead, ahead_tokens, in_flight)
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def stats(self) -> dict:
+        depth, wait = self.position()
+        return {
+            "queue_depth": depth,
+            "in_flight": self._in_flight,
+            "estimated_wait_seconds": wait,
+            "avg_latency_seconds": self._avg_latency,
+            "retries": self.retries,
+        }
+
+    # --- Event loop side ---
+
+    def _estimate_wait(self, ahead: int, ahead_tokens: int, in_flight: int) -> float:
+        concurrency_wait = (ahead + max(0, in_flight - self.max_concurrency + 1)) / self.max_concurrency * self._avg_latency
+        rpm_wait = self.request_bucket.wait_time(ahead + 1)
+        tpm_wait = self.token_bucket.wait_time(ahead_tokens)
+        return max(concurrency_wait, rpm_wait, tpm_wait)
+
+    async def _start(self):
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._loop.create_task(self._dispatch())
+
+    def _cancel(self, job: ScheduledJob):
+        with self._lock:
+            session_queue = self._queues.get(job.session_id)
+            if session_queue is not None and job in session_queue:
+                session_queue.remove(job)
+                if not session_queue:
+                    del self._queues[job.session_id]
+                job.future.set_exception(RequestCancelledError("Gemini request was cancelled."))
+                return
+        if job.task is not None:
+            job.task.cancel()
+        # Otherwise the dispatcher holds it between queue and start and will drop it
+
+    def _next_job(self):
+        with self._lock:
+            for session_id in list(self._queues):
+                session_queue = self._queues.pop(session_id)
+                job = session_queue.popleft()
+                if session_queue:
+                    # Session goes to the back of the round-robin order
+                    self._queues[session_id] = session_queue
+                return job
+        return None
+
+    async def _dispatch(self):
+        while True:
+            await self._slots.acquire()
+            job = self._next_job()
+            while job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                job = self._next_job()
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(job.estimated_tokens)
+            if job.cancelled:
+                job.future.set_exception(RequestCancelledError("Gemini request was cancelled."))
+                self._slots.release()
+                continue
+            with self._lock:
+                self._in_flight += 1
+            job.started = True
+            job.task = self._loop.create_task(self._run(job))
+
+    async def _run(self, job: ScheduledJob):
+        try:
+            while True:
+                job.attempts += 1
+                started = time.monotonic()
+                try:
+                    result, actual_tokens = await job.request(job.emit)
+                except Exception as e:
+                    if job.attempts > self.max_retries or not is_retryable(e):
+                        job.future.set_exception(e)
+                        return
+                    self.retries += 1
+                    # Exponential backoff with full jitter, then re-admit through the buckets
+                    cap = min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** (job.attempts - 1))
+                    await asyncio.sleep(random.uniform(0, cap))
+                    await self.request_bucket.acquire(1)
+                    await self.token_bucket.acquire(job.estimated_tokens)
+                    continue
+
+                self._avg_latency = 0.8 * self._avg_latency + 0.2 * (time.monotonic() - started)
+                if actual_tokens is not None:
+                    await self.token_bucket.charge(actual_tokens - job.estimated_tokens)
+                job.future.set_result(result)
+                return
+        finally:
+            if not job.future.done():
+                job.future.set_exception(RequestCancelledError("Gemini request was cancelled."))
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
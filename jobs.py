@@ -0,0 +1,350 @@
+"""
+Background jobs backed by a local SQLite job store.
+
+Summary (and DOCX) generation is submitted as a job and run by an in-process
+worker pool, independently of the Streamlit script run that submitted it.
+The UI polls a job by id and fetches the finished artifact, so results
+survive reruns and browser reconnects. Jobs left queued or running when the
+process stopped are picked up again on the next start.
+
+The store can also be shared by several processes (see broker.py): a worker
+claims a job with a lease it keeps renewing, and a running job whose lease
+ran out (its worker died) goes back to the queue.
+
+Payloads and results hold session notes, so they are encrypted with Fernet
+when an encryption key is configured; without a key the store is kept in
+memory only and nothing is written to disk.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+# The error of a job that was interrupted by restarts more than max_attempts times
+INTERRUPTED_JOB_ERROR = "Job was interrupted too many times."
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    session_id TEXT,
+    status TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    payload BLOB,
+    result BLOB,
+    artifact BLOB,
+    error TEXT,
+    worker TEXT,
+    lease_until REAL,
+    progress BLOB
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+"""
+# Columns added after the first release, for stores created by older versions
+LATER_COLUMNS = {"worker": "TEXT", "lease_until": "REAL", "progress": "BLOB"}
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    session_id: str
+    status: str
+    created: float
+    updated: float
+    attempts: int = 0
+    payload: dict = field(default_factory=dict)
+    result: dict = None
+    artifact: bytes = None
+    error: str = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+
+class JobStore:
+    """Thread-safe SQLite table of jobs; path None keeps it in memory."""
+
+    def __init__(self, path: str = None, encryption_key: str = None):
+        self._fernet = None
+        if path and encryption_key:
+            from cryptography.fernet import Fernet
+
+            self._fernet = Fernet(encryption_key)
+        else:
+            path = ":memory:"  # never write notes to disk unencrypted
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # Other processes may hold the write lock briefly; wait for it instead of failing
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in LATER_COLUMNS.items():
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _seal(self, data: bytes):
+        if data is None:
+            return None
+        return self._fernet.encrypt(data) if self._fernet else data
+
+    def _open(self, data: bytes):
+        if data is None:
+            return None
+        return self._fernet.decrypt(data) if self._fernet else data
+
+    def add(self, kind: str, payload: dict, session_id: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, session_id, status, created, updated, payload) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, session_id, QUEUED, now, now, self._seal(json.dumps(payload).encode("utf-8"))),
+            )
+        return job_id
+
+    def claim_next(self, worker: str = None, lease_seconds: float = 60.0):
+        """
+        Marks the oldest queued job as running, leased to worker for
+        lease_seconds, and returns it, or None. Safe across processes: the
+        write lock is taken before looking, so two workers never get the same job.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, updated = ?, attempts = attempts + 1, worker = ?, lease_until = ?"
+                        " WHERE id = ?", (RUNNING, now, worker, now + lease_seconds, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def renew(self, job_ids: list, lease_seconds: float = 60.0):
+        """Extends the lease of the given running jobs."""
+        if not job_ids:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?",
+                [(time.time() + lease_seconds, job_id, RUNNING) for job_id in job_ids],
+            )
+
+    def finish(self, job_id: str, result: dict, artifact: bytes = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, result = ?, artifact = ?, payload = NULL, progress = NULL"
+                " WHERE id = ?",
+                (DONE, time.time(), self._seal(json.dumps(result).encode("utf-8")), self._seal(artifact), job_id),
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, error = ?, payload = NULL, progress = NULL WHERE id = ?",
+                (FAILED, time.time(), error, job_id),
+            )
+
+    def set_progress(self, job_id: str, text: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET progress = ? WHERE id = ? AND status = ?",
+                             (self._seal(text.encode("utf-8")), job_id, RUNNING))
+
+    def progress(self, job_id: str) -> str:
+        """Latest partial output of a running job ("" if none)."""
+        with self._lock:
+            row = self._db.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._open(row[0]).decode("utf-8") if row and row[0] else ""
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, session_id, status, created, updated, attempts, payload, result, artifact, error "
+                "FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        payload, result, artifact = (self._open(blob) for blob in row[7:10])
+        return Job(
+            id=row[0], kind=row[1], session_id=row[2], status=row[3], created=row[4], updated=row[5],
+            attempts=row[6],
+            payload=json.loads(payload) if payload else {},
+            result=json.loads(result) if result else None,
+            artifact=artifact,
+            error=row[10],
+        )
+
+    def status(self, job_id: str):
+        """The job's status without loading its payload or artifact (None if unknown)."""
+        with self._lock:
+            row = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def position(self, job_id: str) -> int:
+        """Queued jobs ahead of this one."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < (SELECT created FROM jobs WHERE id = ?)",
+                (QUEUED, job_id),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def requeue_running(self) -> int:
+        """Puts jobs interrupted by a restart back in the queue."""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, progress = NULL WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            ).rowcount
+
+    def requeue_expired(self) -> int:
+        """Puts running jobs whose lease ran out (their worker stopped) back in the queue."""
+        now = time.time()
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = ?, updated = ?, progress = NULL WHERE status = ? AND COALESCE(lease_until, 0) < ?",
+                (QUEUED, now, RUNNING, now),
+            ).rowcount
+
+    def purge(self, older_than_seconds: float) -> int:
+        """Deletes finished and failed jobs last updated before the cutoff."""
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (DONE, FAILED, time.time() - older_than_seconds),
+            ).rowcount
+
+    def counts(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class JobQueue:
+    """
+    Worker threads running jobs from a JobStore. handlers maps a job kind to
+    handler(payload, on_progress) -> (result dict, artifact bytes or None);
+    on_progress(text) publishes partial output to the store, at most every
+    progress_interval seconds.
+
+    exclusive=True means this process is the store's only consumer, so jobs
+    left running by a previous run are requeued at start. With a store shared
+    by several processes (exclusive=False), workers poll the store every
+    poll_seconds, renew the leases of their running jobs, and requeue only jobs
+    whose lease expired. workers=0 gives a submit-only queue (a frontend).
+    """
+
+    def __init__(self, store, handlers: dict, workers: int = 4,
+                 retention_seconds: float = 24 * 3600, max_attempts: int = 2, exclusive: bool = True,
+                 lease_seconds: float = 60.0, poll_seconds: float = None, progress_interval: float = 0.5):
+        self.store = store
+        self.handlers = dict(handlers)
+        self.retention_seconds = retention_seconds
+        self.max_attempts = max_attempts
+        self.exclusive = exclusive
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds if poll_seconds is not None else (5.0 if exclusive else 0.2)
+        self.progress_interval = progress_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self.resumed = store.requeue_running() if exclusive and workers > 0 else 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True) for i in range(max(0, workers))
+        ]
+        if self._threads and not exclusive:
+            self._threads.append(threading.Thread(target=self._renew_leases, name="job-lease", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, kind: str, payload: dict, session_id: str = None) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'.")
+        job_id = self.store.add(kind, payload, session_id)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        return self.store.get(job_id)
+
+    def status(self, job_id: str):
+        return self.store.status(job_id)
+
+    def progress(self, job_id: str) -> str:
+        """Latest partial output of a running job ("" if none)."""
+        return self.store.progress(job_id)
+
+    def position(self, job_id: str) -> int:
+        return self.store.position(job_id)
+
+    def _renew_leases(self):
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._running_lock:
+                running = list(self._running)
+            try:
+                self.store.renew(running, self.lease_seconds)
+            except Exception:
+                # A broker hiccup; the next renewal is still well within the lease
+                pass
+
+    def _progress_publisher(self, job_id: str):
+        published_at = [0.0]
+
+        def publish(text):
+            now = time.monotonic()
+            if now - published_at[0] >= self.progress_interval:
+                published_at[0] = now
+                self.store.set_progress(job_id, text)
+
+        return publish
+
+    def _work(self):
+        last_purge = 0.0
+        last_requeue = 0.0
+        while True:
+            if not self.exclusive and time.time() - last_requeue > self.lease_seconds / 2:
+                last_requeue = time.time()
+                self.store.requeue_expired()
+            job = self.store.claim_next(self.worker_id, self.lease_seconds)
+            if job is None:
+                if time.time() - last_purge > 600:
+                    last_purge = time.time()
+                    self.store.purge(self.retention_seconds)
+                with self._wakeup:
+                    self._wakeup.wait(timeout=self.poll_seconds)
+                continue
+            if job.attempts > self.max_attempts:
+                # Interrupted by restarts too often; likely the job itself brings the process down
+                self.store.fail(job.id, INTERRUPTED_JOB_ERROR)
+                continue
+            with self._running_lock:
+                self._running.add(job.id)
+            try:
+                result, artifact = self.handlers[job.kind](job.payload, self._progress_publisher(job.id))
+                self.store.finish(job.id, result, artifact)
+            except Exception as e:
+                self.store.fail(job.id, f"{type(e).__name__}: {e}")
+            finally:
+                with self._running_lock:
+                    self._running.discard(job.id)
@@ -0,0 +1,103 @@
+"""
+Model routing and health tracking for Gemini requests.
+
+Short notes can go to a lighter, faster model and long ones to the stronger
+default. Every finished request is recorded per model in a rolling window,
+giving p95 latency and error rate; a model that keeps failing is demoted
+behind its backup, and the p95 time to first output decides how long to wait
+before a hedged request is fired at the backup model.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+
+class ModelStats:
+    """Rolling window of (timestamp, ok, latency, time to first output) for one model."""
+
+    def __init__(self, window: int = 200, max_age_seconds: float = 900):
+        self.max_age_seconds = max_age_seconds
+        self._samples = deque(maxlen=window)
+
+    def record(self, ok: bool, latency: float, first_output: float = None):
+        self._samples.append((time.time(), ok, latency, first_output if first_output is not None else latency))
+
+    def _recent(self):
+        cutoff = time.time() - self.max_age_seconds
+        return [sample for sample in self._samples if sample[0] >= cutoff]
+
+    @staticmethod
+    def _p95(values):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def snapshot(self) -> dict:
+        recent = self._recent()
+        successes = [s for s in recent if s[1]]
+        return {
+            "requests": len(recent),
+            "error_rate": (1 - len(successes) / len(recent)) if recent else 0.0,
+            "p95_latency_seconds": self._p95([s[2] for s in successes]),
+            "p95_first_output_seconds": self._p95([s[3] for s in successes]),
+        }
+
+
+class ModelRouter:
+    """
+    Picks (primary, backup) models for a request. Notes up to light_max_tokens
+    go to light_model when one is configured; everything else to strong_model,
+    backed by fallback_model. A primary whose recent error rate exceeds
+    max_error_rate (with at least min_samples requests) swaps with its backup.
+    """
+
+    def __init__(self, strong_model: str, light_model: str = None, fallback_model: str = None,
+                 light_max_tokens: int = 400, max_error_rate: float = 0.5, min_samples: int = 5,
+                 min_hedge_seconds: float = 2.0, default_hedge_seconds: float = 20.0):
+        self.strong_model = strong_model
+        self.light_model = light_model
+        self.fallback_model = fallback_model
+        self.light_max_tokens = light_max_tokens
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.min_hedge_seconds = min_hedge_seconds
+        self.default_hedge_seconds = default_hedge_seconds
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats(self, model_name: str) -> ModelStats:
+        with self._lock:
+            return self._stats.setdefault(model_name, ModelStats())
+
+    def record(self, model_name: str, ok: bool, latency: float, first_output: float = None):
+        self.stats(model_name).record(ok, latency, first_output)
+
+    def _unhealthy(self, model_name: str) -> bool:
+        snapshot = self.stats(model_name).snapshot()
+        return snapshot["requests"] >= self.min_samples and snapshot["error_rate"] > self.max_error_rate
+
+    def route(self, notes_tokens: int) -> tuple:
+        """(primary model, backup model or None) for notes of this size."""
+        if self.light_model and notes_tokens <= self.light_max_tokens:
+            primary, backup = self.light_model, self.strong_model
+        else:
+            primary, backup = self.strong_model, self.fallback_model or self.light_model
+        if backup == primary:
+            backup = None
+        if backup and self._unhealthy(primary) and not self._unhealthy(backup):
+            primary, backup = backup, primary
+        return primary, backup
+
+    def hedge_after(self, model_name: str) -> float:
+        """Seconds to wait for the model's first output before hedging: its recent p95, once known."""
+        snapshot = self.stats(model_name).snapshot()
+        if snapshot["requests"] < 2 * self.min_samples or snapshot["p95_first_output_seconds"] is None:
+            return self.default_hedge_seconds
+        return max(self.min_hedge_seconds, snapshot["p95_first_output_seconds"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            models = list(self._stats)
+        return {model_name: self.stats(model_name).snapshot() for model_name in models}
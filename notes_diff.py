@@ -0,0 +1,39 @@
+"""
+Sentence-level diff between two versions of session notes.
+
+Used by edit-aware regeneration: when the therapist adds or changes a few
+sentences, only those sentences are sent along with the previous summary.
+"""
+import difflib
+from dataclasses import dataclass, field
+
+from chunking import SENTENCE_END
+
+
+@dataclass
+class NotesDelta:
+    added: list = field(default_factory=list)  # sentences new or changed in the new notes
+    removed: list = field(default_factory=list)  # sentences no longer in the notes
+    changed_ratio: float = 0.0  # changed characters relative to the new notes' length
+
+    @property
+    def empty(self) -> bool:
+        return not self.added and not self.removed
+
+
+def split_sentences(text: str) -> list:
+    return [" ".join(sentence.split()) for sentence in SENTENCE_END.split(text) if sentence.strip()]
+
+
+def diff_notes(previous: str, current: str) -> NotesDelta:
+    """Sentences added and removed between previous and current notes, ignoring whitespace changes."""
+    old, new = split_sentences(previous), split_sentences(current)
+    delta = NotesDelta()
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(a=old, b=new, autojunk=False).get_opcodes():
+        if tag in ("delete", "replace"):
+            delta.removed.extend(old[i1:i2])
+        if tag in ("insert", "replace"):
+            delta.added.extend(new[j1:j2])
+    changed_chars = sum(map(len, delta.added)) + sum(map(len, delta.removed))
+    delta.changed_ratio = changed_chars / max(1, sum(map(len, new)))
+    return delta
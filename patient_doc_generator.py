@@ -1,132 +1,202 @@
 import streamlit as st
-from google import genai
-from google.genai import types as genai_types
-import json
-from io import BytesIO
-from docxtpl import DocxTemplate
+import functools
+import hashlib
+import html
+from docx_templates import TEMPLATE_ENGINE, DEFAULT_TEMPLATE_NAME
 import os
 import datetime
+import uuid
+import time
+import telemetry
+from auth import AUTH_COOKIE, issue_token, password_matches, sign_value, unsign_value, verify_token
+from prompts import pick_prompt_version
+from archive import parse_tags
+from batch import BatchItem, parse_batch_file, iter_batch, build_zip, DEFAULT_MAX_WORKERS
+from exporters import FORMATS as EXPORT_FORMATS, bundle
+from jobs import INTERRUPTED_JOB_ERROR
+from transcription import AUDIO_TYPES
+from summary_core import (
+    EmptySummaryError,
+    add_settings_source,
+    archive_summary,
+    export_formats,
+    generate_narrative_summary,
+    generate_structured_summary,
+    generate_updated_summary,
+    get_artifact_store,
+    get_broker,
+    get_gemini_client,
+    get_gemini_scheduler,
+    get_job_queue,
+    get_setting,
+    get_speculative_summaries,
+    get_summary_archive,
+    get_summary_cache,
+    get_telemetry,
+    get_transcriber,
+    plan_request,
+    publish_templates,
+    render_summary_docx,
+    render_summary_exports,
+    summary_basename,
+)
+
+# Optional settings (cache, rate limits, ...) are read from Streamlit secrets first
+add_settings_source(st.secrets)
+
 
 # --- Gemini API Function (Revised for Narrative Summary) ---
-def get_narrative_summary_from_gemini(api_key: str, user_input_text: str) -> str:
+def get_narrative_summary_from_gemini(api_key: str, user_input_text: str, on_chunk=None,
+                                      prompt_version: str = None, session_id: str = None, on_wait=None,
+                                      previous_notes: str = None, previous_summary: str = None,
+                                      structured: bool = False, on_sections=None) -> str:
     """
     Processes natural language patient session notes using Gemini API
     and returns a flowing narrative summary in Hebrew.
+    prompt_version selects a variant from prompts.PROMPT_REGISTRY (default if None).
+    If on_chunk is given, the response is streamed and on_chunk is called
+    with the accumulated text after every chunk that arrives.
+    With previous_notes and previous_summary, a small edit only revises the
+    previous summary (see summary_core.generate_updated_summary).
+    With structured=True the summary is written per key topic in one request
+    (see summary_core.generate_structured_summary) and on_sections is called
+    with its sections; the narrative is still returned.
     """
-    # client = genai.Client(api_key=api_key) # REMOVE THIS LINE
-
-    # Using the model name from your latest snippet
-    model_name = "gemini-2.5-flash-preview-05-20"
-
-    key_topics_to_cover = [
-        "פרטי המטופל (גיל, מצב משפחתי, רקע רלוונטי)",
-        "סיבת הפניה או נושא מרכזי של הפגישה",
-        "תיאור המצב הנוכחי של המטופל (תסמינים, תחושות, תפקוד)",
-        "מידע סובייקטיבי עיקרי (מה שהמטופל מדווח)",
-        "מידע אובייקטיבי או תצפיות רלוונטיות (אם צוין)",
-        "הערכה כללית של המצב (התרשמות)",
-        "תכנית התערבות או המלצות עיקריות להמשך",
-        "רקע ביו-פסיכו-סוציאלי רלוונטי (משפחה, עבודה, תמיכה)",
-        "אירועים משמעותיים בעבר ובהווה",
-        "ציפיות מהטיפול (אם צוין)"
-    ]
-
-    system_prompt_text = f"""
-אתה עוזר AI מומחה לכתיבת סיכומי פגישות טיפוליות עבור מטפלים רגשיים.
-המשימה שלך היא לקרוא את רשימות המטפל (שיינתנו בעברית) ולכתוב סיכום פגישה קוהרנטי ומקיף בעברית, בפסקאות רציפות.
-הסיכום צריך להיות כתוב בשפה מקצועית אך קריאה, כאילו נכתב על ידי המטפל עצמו.
-
-**מבנה ותוכן הסיכום:**
-על הסיכום לשלב באופן טבעי מידע מהתחומים הבאים לפי הסדר שלהם, ככל שהוא מופיע ברשימות המטפל:
-{', '.join(key_topics_to_cover)}
-
-**סגנון הכתיבה:**
-- כתוב בפסקאות רציפות, לא בנקודות או רשימות.
-- שמור על זרימה לוגית בין חלקי הסיכום.
-- השתמש בדוגמאות שניתנו לך כמודל לסגנון ולרמת הפירוט.
-- אם מידע מסוים חסר ברשימות המטפל, אל תמציא אותו. התמקד במה שסופק.
-- הימנע משימוש ישיר בכותרות סעיפים (כמו "S", "O", "A", "P") בתוך הטקסט הרציף.
-- זכור כי המבנה של הטקסט שלך צריך לעקוב אחרי השלבים שצירפתי ולא בהכרח לפי הסדר שהמשתמש העלה 
-
-**פלט:**
-הפלט שלך צריך להיות טקסט אחד רציף בעברית, המהווה את סיכום הפגישה.
-
-אנא עבד את הרשימות הבאות של המטפל וצור את סיכום הפגישה הנרטיבי:
-"""
-
-    # Enhanced Few-Shot Examples for Narrative
-    contents = [
-        genai_types.Content(
-            role="user",
-            parts=[
-                genai_types.Part.from_text(text="""מטופל, גבר כבן 80, אלמן, אב לשניים. מתמודד עם COPD, מונשם כרונית בבית מזה שנתיים. גר כעת בדירה שכורה מונגשת, אמור לעבור בקרוב חזרה לדירתו הקבועה בקומה 3 ללא מעלית. לאחרונה התגלה גידול בערמונית בבירור, הוא עוד לא יודע. הבת גרה קרוב ותומכת עיקרית, הבן השני רחוק ופחות מעורב. סיעודי, זקוק לעזרה מלאה בפעולות יומיום, מקבל עזרה ממטפל זר. המשפחה מיצתה זכויות בביטוח לאומי. מביע מצוקה רגשית גדולה מהניתוק מהסביבה המוכרת ובדידות בדירה השכורה. רוצה מאוד לחזור הביתה למרות הקושי בנגישות בגלל השכנים והקשר למקום. צריך זחליל ליציאה לבדיקות ומעקב רפואי, וגם לנפש ולאיכות חיים. על הבת עומס טיפולי ורגשי גדול כמתכללת הטיפול, מצריך התייחסות. המלצות: סיוע בהגשת בקשה לזחליל ממשרד הבריאות, מפגשי תמיכה והדרכה לבת אחת לחודש להקלה על העומס, מעקב רפואי גידול בערמונית, בחינת שירותים תומכים נוספים בקהילה. התכנית היא לשיפור איכות חייו, מענה לניידות ורווחה נפשית, ותמיכה במשפחה בדגש על הבת."""),
-            ],
-        ),
-        genai_types.Content(
-            role="model",
-            parts=[
-                genai_types.Part.from_text(text="""התקיים ביקור בית אצל מטופל בן 80, אלמן ואב לשניים, המתמודד עם מחלת COPD ומונשם כרונית בביתו מזה כשנתיים. המטופל מתגורר כעת בדירה שכורה מונגשת ועתיד לעבור בימים הקרובים חזרה לדירתו הקבועה בקומה שלישית ללא מעלית. לאחרונה התגלה אצלו גידול בערמונית הנמצא בבירור, מידע שטרם נמסר לו. בתו מתגוררת בסמיכות אליו ומהווה את התומכת העיקרית, בעוד בנו השני מתגורר במרחק ופחות מעורב בטיפול היומיומי. המטופל סיעודי וזקוק לעזרה בכל פעולות היומיום, עזרה המסופקת כיום על ידי מטפל זר. המשפחה מיצתה את זכויותיהם בביטוח לאומי.
-המטופל מביע מצוקה רגשית ניכרת בשל הניתוק מסביבתו המוכרת והבדידות החברתית בדירה השכורה. קיים רצון עז מצדו לחזור לביתו הקבוע, למרות אתגרי הנגישות, בשל היכרותו את השכנים והקשר הרגשי למקום. זקוק למכשיר זחליל לצורך יציאה מהבית לבדיקות ומעקב רפואי, וגם כחלק חיוני משמירה על רווחתו הנפשית ואיכות חייו. על הבת מוטל עומס טיפולי ורגשי משמעותי כמתכללת הטיפול באביה, דבר המצריך התייחסות והתערבות תומכת.
-המלצות ההתערבות כוללות: סיוע בהגשת בקשה למכשיר זחליל דרך משרד הבריאות, קביעת מפגשי תמיכה והדרכה לבת המטפלת אחת לחודש לצורך הקלה על העומס הטיפולי והרגשי, מעקב אחר התהליך הרפואי בנוגע לגידול בערמונית, ובחינת שירותים תומכים נוספים בקהילה. תכנית ההתערבות המוצעת מכוונת לשיפור איכות חייו של המטופל תוך מתן מענה לצרכי הניידות והרווחה הנפשית, ובמקביל תמיכה במערך המשפחתי, בדגש על הקלת העומס המוטל על הבת."""),
-            ],
-        ),
-        genai_types.Content(
-            role="user",
-            parts=[
-                genai_types.Part.from_text(text="""פגישה עם דנה, בת 32, רווקה. הגיעה עקב תחושות חרדה וקשיי הירדמות שהחמירו לאחר פרידה מבן זוג לפני חודשיים. מתארת דאגנות יתר לגבי העתיד, קושי להתרכז בעבודה (מנהלת חשבונות). בעבר חוותה אפיזודות דומות אך פחות אינטנסיביות. מצפה לקבל כלים לוויסות רגשי ולהפחית את החרדה. קופ"ח כללית. הפגישה התקיימה בזום."""),
-            ],
-        ),
-        genai_types.Content(
-            role="model",
-            parts=[
-                genai_types.Part.from_text(text="""דנה, רווקה בת 32, פנתה לטיפול בשל החמרה בתחושות חרדה וקשיי הירדמות, שהתעצמו בעקבות פרידה מבן זוגה לפני כחודשיים. היא מתארת דאגנות יתר לגבי העתיד וקושי בריכוז בעבודתה כמנהלת חשבונות. דנה מציינת כי חוותה בעבר אפיזודות דומות של חרדה, אך בעוצמה פחותה. ציפיותיה מהטיפול הן לרכוש כלים לוויסות רגשי ולהפחית את רמות החרדה. הפגישה התקיימה באמצעות זום, והיא חברה בקופת חולים כללית.
-במהלך הפגישה, נראה כי דנה מודעת לקשייה ומביעה מוטיבציה לשינוי. ההתמקדות הראשונית תהיה בהבנת דפוסי החשיבה המעוררים חרדה ובחינת טכניקות הרגעה והתמודדות מיידיות. כמו כן, ייבחנו הגורמים התורמים לקשיי ההירדמות.
-המלצות ראשוניות כוללות תרגול טכניקות נשימה והרפיה, וכן ניהול יומן מחשבות לזיהוי טריגרים לחרדה. בנוסף, נשקלת האפשרות להפניה להערכה פסיכיאטרית במידה והסימפטומים לא יראו שיפור או יחמירו, זאת בהתאם להתקדמות בטיפול."""),
-            ],
-        ),
-        genai_types.Content(
-            role="user",
-            parts=[
-                genai_types.Part.from_text(text=user_input_text),
-            ],
-        ),
-    ]
-
-    full_response_text = ""
     try:
-        # Use the correct method for the Google Generative AI SDK
-        response = client.models.generate_content(
-            model=model_name,
-            contents=contents,
-            config=genai_types.GenerateContentConfig(
-                temperature=0.6,
-                system_instruction=system_prompt_text,
-                response_mime_type="text/plain"
-            )
-        )
-        
-        # Extract text from response
-        if hasattr(response, 'text'):
-            full_response_text = response.text
-        elif hasattr(response, 'candidates') and response.candidates:
-            # Handle response with candidates
-            candidate = response.candidates[0]
-            if hasattr(candidate, 'content') and candidate.content.parts:
-                full_response_text = candidate.content.parts[0].text
-        
-        if not full_response_text.strip():
-            st.warning("ה-API של Gemini החזיר תגובה ריקה. ייתכן שהקלט לא היה מספיק מפורט או שיש בעיה זמנית.")
-            return ""
-
-        return full_response_text.strip()
+        if structured:
+            structured_summary = generate_structured_summary(api_key, user_input_text, on_chunk=on_chunk,
+                                                             prompt_version=prompt_version, session_id=session_id,
+                                                             on_wait=on_wait)
+            if on_sections is not None:
+                on_sections(structured_summary.sections)
+            return structured_summary.narrative
+        if previous_summary:
+            return generate_updated_summary(api_key, previous_notes, previous_summary, user_input_text,
+                                            on_chunk=on_chunk, prompt_version=prompt_version,
+                                            session_id=session_id, on_wait=on_wait)
+        return generate_narrative_summary(api_key, user_input_text, on_chunk=on_chunk,
+                                          prompt_version=prompt_version, session_id=session_id, on_wait=on_wait)
+
+    except EmptySummaryError:
+        st.warning(EMPTY_SUMMARY_WARNING)
+        return ""
 
     except Exception as e:
-        error_msg = f"שגיאה בקריאה ל-Gemini API: {type(e).__name__} - {e}. מודל: {model_name}."
-        st.error(error_msg)
+        # models_tried is set by the router when the request reached a model
+        st.error(gemini_error_message(type(e).__name__, e, getattr(e, "models_tried", None)))
         if hasattr(e, 'response') and e.response:
             st.error(f"פרטי תגובת API: {e.response}")
         return ""
 
+
+EMPTY_SUMMARY_WARNING = "ה-API של Gemini החזיר תגובה ריקה. ייתכן שהקלט לא היה מספיק מפורט או שיש בעיה זמנית."
+
+
+def gemini_error_message(error_type: str, error, models_tried: list = None) -> str:
+    message = f"שגיאה בקריאה ל-Gemini API: {error_type} - {error}."
+    if models_tried:
+        message += f" {'מודל' if len(models_tried) == 1 else 'מודלים'}: {', '.join(models_tried)}."
+    return message
+
+
+def summary_box_html(text: str, sections: list = None) -> str:
+    """
+    Wraps summary text (or structured-output sections, under their headings)
+    in the styled summary-box div. The text is model output, so it is escaped:
+    markup in it is shown as text and never runs in the page.
+    """
+    if sections:
+        text = "\n\n".join(f"<strong>{html.escape(section['title'])}</strong>\n{html.escape(section['text'])}"
+                           for section in sections)
+    else:
+        text = html.escape(text)
+    html_text = text.replace('\n', '<br>')
+    return f"""
+                <div class="summary-box">
+                    {html_text}
+                </div>
+            """
+
+# --- Static Markup ---
+# Markup that never changes is built once per process; static/ is served by
+# Streamlit (server.enableStaticServing) with ETag/Last-Modified validation.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"
+
+PRIVACY_WARNING_HTML = """
+    <div class="privacy-warning-box">
+        <h4 style="color: #92400E; margin-bottom: 0.5rem; font-weight: 600;">
+            ⚠️ אזהרת פרטיות חשובה
+        </h4>
+        <p style="margin: 0;">
+            נא <strong>לא</strong> להזין מידע אישי מזהה על מטופלים שעלול לחשוף את זהותם.<br>
+            שמות פרטיים, מספרי זהות, טלפונים וכתובות מוסתרים אוטומטית לפני השליחה, אך זיהוי זה אינו מושלם;<br>
+            מומלץ להשתמש בראשי תיבות, שמות בדויים או תיאורים כלליים.
+        </p>
+    </div>
+"""
+
+FOOTER_ICON_STYLE = (
+    "transition: transform 0.2s ease; border-radius: 8px; opacity: 0.7; filter: grayscale(30%);"
+)
+FOOTER_ICON_HOVER = (
+    "onmouseover=\"this.style.opacity=1; this.style.transform='scale(1.1)'; this.style.filter='grayscale(0%)';\" "
+    "onmouseout=\"this.style.opacity=0.7; this.style.transform='scale(1)'; this.style.filter='grayscale(30%)';\""
+)
+
+
+@functools.lru_cache(maxsize=1)
+def page_header_html() -> str:
+    """
+    A link to the app's stylesheet (static/app.css, with the Rubik @font-face
+    rules) and the page title. The browser caches the stylesheet and fonts,
+    so reruns only resend this short markup; the ?v= content hash makes a
+    changed stylesheet load fresh.
+    """
+    with open(os.path.join(STATIC_DIR, "app.css"), "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:12]
+    return f"""<link rel="stylesheet" href="{STATIC_URL}/app.css?v={version}">
+<h1 style="text-align: center; color: #2E3A4D; font-size: 2.5rem; font-weight: 600; margin-bottom: 1.5rem;">
+    <span class="icon">📝</span>
+    מחולל סיכומי פגישות טיפוליות
+</h1>"""
+
+
+@functools.lru_cache(maxsize=2)
+def footer_html(year: int) -> str:
+    icons = "".join(
+        f"""<a href='{url}'{target} style="text-decoration: none; margin: 0 0.5rem;">"""
+        f"""<img src='{STATIC_URL}/icons/{icon}' width='40' height='40' alt='{alt}' style="{FOOTER_ICON_STYLE}" """
+        f"""{FOOTER_ICON_HOVER}></a>"""
+        for url, target, icon, alt in (
+            ("mailto:yehudayu@gmail.com", "", "mail.svg", "Email"),
+            ("https://www.linkedin.com/in/yehuda-yungstein/", " target='_blank'", "linkedin.svg", "LinkedIn"),
+        )
+    )
+    return f"""
+        <div style="margin-top: 3rem; padding: 1.5rem; text-align: center;">
+            <p style="font-size: 1.1rem; color: #525F6C; margin-bottom: 1.5rem;">
+                 פותח על ידי יהודה יונגשטיין עבור אנשי מקצוע בתחום הטיפול
+            </p>
+            <div style="text-align: center;">{icons}</div>
+        </div>
+        <div style="text-align: center; margin-top: 1rem; padding: 0.8rem;">
+            <p style="font-size: 0.85rem; color: #8A94A0;">
+                © {year} | נבנה עם Streamlit
+            </p>
+        </div>
+    """
+
+
+def download_label(formats: list) -> str:
+    if len(formats) == 1:
+        return f"📥 הורידי סיכום פגישה ({EXPORT_FORMATS[formats[0]].label})"
+    return f"📥 הורידי סיכום פגישה ({len(formats)} פורמטים, ZIP)"
+
+
+def export_timings_caption(export_ms: dict) -> str:
+    return " | ".join(f"{EXPORT_FORMATS[key].label}: {ms:.0f} מ\"ש" for key, ms in export_ms.items())
+
 # Rest of your Streamlit app code remains the same
 # --- Password Protection ---
 def check_password():
@@ -143,12 +213,18 @@ def check_password():
     if st.session_state.password_correct:
         return True
 
+    # כניסה חוזרת: אסימון חתום בעוגייה פוטר מהזנת הסיסמה עד שיפוג תוקפו
+    if auth_token_ttl_seconds() and verify_token(st.context.cookies.get(AUTH_COOKIE), auth_secret()):
+        st.session_state.password_correct = True
+        return True
+
     st.markdown("<div dir='rtl'>", unsafe_allow_html=True) 
     password_input = st.text_input("הזן סיסמה כדי לגשת לאפליקציה:", type="password", key="password_field")
 
     if st.button("התחבר", key="login_button"):
-        if password_input == app_password:
+        if password_matches(password_input, app_password):
             st.session_state.password_correct = True
+            st.session_state.remember_login = True
             st.markdown("</div>", unsafe_allow_html=True) 
             st.rerun()
         else:
@@ -157,6 +233,329 @@ def check_password():
     st.markdown("</div>", unsafe_allow_html=True) 
     return False
 
+def auth_secret() -> str:
+    """Signing secret for login tokens; changing APP_PASSWORD (or AUTH_TOKEN_SECRET) revokes them."""
+    return st.secrets["APP_PASSWORD"] + str(get_setting("AUTH_TOKEN_SECRET", ""))
+
+
+def auth_token_ttl_seconds() -> float:
+    """How long a login is remembered in the browser: AUTH_TOKEN_TTL_HOURS (default 4, 0 disables)."""
+    return float(get_setting("AUTH_TOKEN_TTL_HOURS", 4)) * 3600
+
+
+def remember_login():
+    """
+    Stores a signed, expiring login token in a browser cookie. Streamlit gives
+    the script no way to set response headers, so the cookie is written by a
+    script in the page and can't be HttpOnly: a script injected into the page
+    could read it. Model output is escaped (summary_box_html) and the default
+    lifetime is short for that reason.
+    """
+    ttl_seconds = int(auth_token_ttl_seconds())
+    if not ttl_seconds:
+        return
+    token = issue_token(auth_secret(), ttl_seconds)
+    st.session_state.auth_token = token  # the cookie only reaches the server from the next connection on
+    st.html(f"""<script>
+        const secure = location.protocol === "https:" ? "; Secure" : "";
+        document.cookie = "{AUTH_COOKIE}={token}; Max-Age={ttl_seconds}; Path=/; SameSite=Strict" + secure;
+    </script>""", unsafe_allow_javascript=True)
+
+# --- Speculative Pre-generation ---
+SPECULATION_MIN_CHARS = 40
+
+
+@st.fragment(run_every=1.0)
+def render_speculation_watcher(gemini_api_key: str):
+    """
+    Polls the notes box every second; once the notes have stayed unchanged for
+    SPECULATIVE_DEBOUNCE_SECONDS, a summary is prepared in the background so
+    "generate" can show it immediately. Changed notes cancel the stale request.
+    """
+    notes = st.session_state.get("session_input_area", "")
+    session_id = st.session_state.session_id
+    speculative = get_speculative_summaries(gemini_api_key)
+    now = time.monotonic()
+
+    if notes != st.session_state.get("speculation_notes"):
+        st.session_state.speculation_notes = notes
+        st.session_state.speculation_stable_since = now
+        speculative.cancel_stale(session_id, notes)
+    elif len(notes.strip()) >= SPECULATION_MIN_CHARS and \
+            now - st.session_state.speculation_stable_since >= float(get_setting("SPECULATIVE_DEBOUNCE_SECONDS", 3)):
+        speculative.submit(session_id, notes, st.session_state.prompt_version)
+
+    status = speculative.status(session_id, notes)
+    if status["state"] == "running":
+        st.caption("🔮 מכין סיכום מראש ברקע...")
+    elif status["state"] == "ready":
+        st.caption("🔮 סיכום מוכן מראש - לחיצה על הפקה תציג אותו מיד")
+    elif not status["remaining"] and notes.strip():
+        st.caption("🔮 הגעת למכסת ההכנות מראש בסשן זה; הסיכום יופק בלחיצה על הכפתור")
+
+
+# --- Background Jobs ---
+@st.fragment(run_every=1.0)
+def render_job_progress(gemini_api_key: str, job_id: str):
+    """Polls a background job every second and reruns the page once it has finished."""
+    job_queue = get_job_queue(gemini_api_key)
+    status = job_queue.status(job_id)
+    if status not in ("queued", "running"):
+        st.rerun()
+    if status == "queued":
+        st.info(f"⏳ הבקשה ממתינה בתור ({job_queue.position(job_id)} בקשות לפנייך). אפשר לרענן את הדף, התוצאה תישמר.")
+    else:
+        st.info("🔄 הסיכום מופק ברקע. אפשר לרענן את הדף או לחזור מאוחר יותר, התוצאה תישמר.")
+        partial_text = job_queue.progress(job_id)
+        if partial_text:
+            st.markdown(summary_box_html(partial_text + " ▌"), unsafe_allow_html=True)
+
+
+def clear_active_job():
+    st.session_state.pop("active_job_id", None)
+    st.query_params.pop("job", None)
+
+
+def job_link_secret() -> str:
+    """
+    Signs the job id kept in the URL. It is bound to this browser's login
+    token (or, without one, to this session), so a shared or guessed link
+    doesn't open another user's job.
+    """
+    browser = st.session_state.get("auth_token") or st.context.cookies.get(AUTH_COOKIE) or st.session_state.session_id
+    return f"{auth_secret()}:job-link:{browser}"
+
+
+def show_job_error(error: str):
+    """A failed job's error, with the same messages as a summary generated in the page."""
+    error_type, _, message = (error or "").partition(": ")
+    if error == INTERRUPTED_JOB_ERROR:
+        st.error("❌ ההפקה ברקע נקטעה שוב ושוב ולא הושלמה. אנא הפיקי את הסיכום מחדש.")
+    elif error_type == EmptySummaryError.__name__:
+        st.warning(EMPTY_SUMMARY_WARNING)
+    else:
+        st.error(f"❌ ההפקה ברקע נכשלה. {gemini_error_message(error_type, message)}")
+
+
+def render_job_section(gemini_api_key: str):
+    """Shows the session's background job: progress while it runs, then the summary and DOCX download."""
+    # מזהה המשימה נשמר גם בכתובת הדף, חתום לדפדפן הזה, כך שהתוצאה זמינה גם אחרי התחברות מחדש
+    job_id = st.session_state.get("active_job_id")
+    if not job_id:
+        job_link = st.query_params.get("job")
+        if not job_link:
+            return
+        job_id = unsign_value(job_link, job_link_secret())
+        if job_id is None:
+            st.warning("⚠️ הקישור למשימה ברקע אינו תקף בדפדפן זה. אנא הפיקי את הסיכום מחדש.")
+            clear_active_job()
+            return
+        st.session_state.active_job_id = job_id
+    job_queue = get_job_queue(gemini_api_key)
+    status = job_queue.status(job_id)
+    if status is None:
+        st.warning("⚠️ המשימה ברקע לא נמצאה (ייתכן שפג תוקפה). אנא הפיקי את הסיכום מחדש.")
+        clear_active_job()
+        return
+
+    st.markdown("""
+        <div class="step-card" style="margin-top: 1.5rem;">
+            <h3>
+                <span class="step-number">2</span>
+                סיכום הפגישה הנרטיבי
+            </h3>
+        </div>
+    """, unsafe_allow_html=True)
+    if status in ("queued", "running"):
+        render_job_progress(gemini_api_key, job_id)
+        return
+
+    job = job_queue.get(job_id)
+    if job.status == "failed":
+        show_job_error(job.error)
+        return
+
+    result = job.result
+    st.markdown(summary_box_html(result["summary"], result.get("sections")), unsafe_allow_html=True)
+    # הגרסה שסוכמה נרשמת פעם אחת לכל משימה, מהרשימות שנשלחו אליה ולא מהתיבה (שאולי נערכה מאז)
+    if st.session_state.get("summarized_job_id") != job_id:
+        st.session_state.summarized_job_id = job_id
+        st.session_state.last_summarized_notes = result.get("notes", "")
+        st.session_state.last_summary = result["summary"]
+    export_ms = result.get("export_ms") or {"docx": result["render_ms"]}
+    st.caption(f"⏱️ הופק ברקע ב-{result['seconds']:.1f} שניות | 📄 תבנית: {result['template_name']}"
+               f" | {export_timings_caption(export_ms)}")
+    col_dl1, col_dl2, col_dl3, col_dl4 = st.columns([0.5, 2, 2, 0.5])
+    with col_dl2:
+        st.download_button(
+            label=download_label(list(export_ms)),
+            data=lambda: job_queue.get(job_id).artifact,
+            file_name=result["filename"],
+            mime=result.get("mime", EXPORT_FORMATS["docx"].mime),
+            use_container_width=True,
+            key="job_download_button",
+        )
+    with col_dl3:
+        if st.button("🔄 התחילי מחדש", key="new_session_after_job", use_container_width=True):
+            clear_active_job()
+            if "session_input_area" in st.session_state:
+                st.session_state.session_input_area = ""
+            st.rerun()
+
+
+# --- Batch Mode ---
+def render_batch_section(gemini_api_key: str, template_name: str):
+    """Expander for summarizing many sessions at once into a single ZIP of DOCX files."""
+    with st.expander("📚 סיכום מרובה - כמה פגישות בבת אחת"):
+        notes_count = st.number_input("מספר פגישות להזנה ידנית:", min_value=0, max_value=15, value=2, key="batch_notes_count")
+        batch_items = []
+        for i in range(int(notes_count)):
+            notes = st.text_area(f"רשימות פגישה {i + 1}:", height=120, key=f"batch_notes_{i}")
+            if notes.strip():
+                batch_items.append(BatchItem(name=f"פגישה_{i + 1}", notes=notes.strip()))
+
+        uploaded_files = st.file_uploader(
+            "או העלי קבצי רשימות (txt - פגישות מופרדות בשורת ---, csv עם עמודת notes, jsonl):",
+            type=["txt", "csv", "jsonl"],
+            accept_multiple_files=True,
+            key="batch_upload"
+        )
+        for uploaded in uploaded_files or []:
+            try:
+                batch_items.extend(parse_batch_file(uploaded.name, uploaded.getvalue()))
+            except ValueError as e:
+                st.error(f"❌ לא ניתן לקרוא את הקובץ {uploaded.name}: {e}")
+
+        max_workers = st.slider("מספר בקשות במקביל:", min_value=1, max_value=8, value=DEFAULT_MAX_WORKERS, key="batch_workers")
+
+        if not st.button(f"✨ הפיקי {len(batch_items)} סיכומים", key="batch_generate_button", disabled=not batch_items):
+            return
+
+        prompt_version = st.session_state.get("prompt_version")
+        session_id = st.session_state.get("session_id")
+        started = time.perf_counter()
+        progress = st.progress(0.0, text="מתחיל...")
+        status_rows = [st.empty() for _ in batch_items]
+        for row, item in zip(status_rows, batch_items):
+            row.markdown(f"⏳ {item.name}")
+
+        results = [None] * len(batch_items)
+        done = 0
+        for index, result in iter_batch(
+            batch_items,
+            summarize=lambda notes: generate_narrative_summary(gemini_api_key, notes, prompt_version=prompt_version,
+                                                               session_id=session_id),
+            render=lambda summary: render_summary_docx(summary, template_name).data,
+            max_workers=max_workers,
+        ):
+            results[index] = result
+            done += 1
+            progress.progress(done / len(batch_items), text=f"{done}/{len(batch_items)} הושלמו")
+            if result.ok:
+                status_rows[index].markdown(f"✅ {result.item.name} ({result.seconds:.1f} שניות)")
+            else:
+                status_rows[index].markdown(f"❌ {result.item.name}: {result.error}")
+
+        failed = sum(1 for r in results if not r.ok)
+        st.caption(f"⏱️ זמן כולל: {time.perf_counter() - started:.1f} שניות | הצליחו: {len(results) - failed}, נכשלו: {failed}")
+        if failed < len(results):
+            artifact_store = get_artifact_store()
+            st.download_button(
+                label="📥 הורידי את כל הסיכומים (ZIP)",
+                data=artifact_store.reader(artifact_store.put(build_zip(results), session_id=session_id)),
+                file_name=f"סיכומי_פגישות_{datetime.date.today().isoformat()}.zip",
+                mime="application/zip",
+                key="batch_download"
+            )
+
+
+# --- Summary Archive ---
+def render_archive_section(summary_archive):
+    """Expander for searching archived summaries by text, tags and date, with instant re-download."""
+    with st.expander(f"🗄️ ארכיון סיכומים ({summary_archive.count():,})"):
+        query = st.text_input("חיפוש בסיכומים:", key="archive_query", placeholder="לדוגמה: חרדה בעבודה")
+        col_tags, col_from, col_to = st.columns([2, 1, 1])
+        with col_tags:
+            tags = st.multiselect("תגיות:", summary_archive.tags(), key="archive_tags_filter")
+        with col_from:
+            date_from = st.date_input("מתאריך:", value=None, key="archive_date_from")
+        with col_to:
+            date_to = st.date_input("עד תאריך:", value=None, key="archive_date_to")
+
+        started = time.perf_counter()
+        entries = summary_archive.search(query, tags, date_from=date_from and date_from.isoformat(),
+                                         date_to=date_to and date_to.isoformat(), limit=20)
+        st.caption(f"🔎 {len(entries)} תוצאות ({(time.perf_counter() - started) * 1000:.0f} מ\"ש)")
+        for entry in entries:
+            col_text, col_download = st.columns([4, 1])
+            with col_text:
+                tags_text = " ".join(f"`#{tag}`" for tag in entry.tags)
+                st.markdown(f"**{entry.session_date}** · {entry.title} {tags_text}")
+                st.caption(entry.excerpt)
+            with col_download:
+                if entry.artifact_bytes:
+                    # הקובץ מפוענח מהארכיון רק בלחיצה על ההורדה
+                    st.download_button("📥 הורדה", data=summary_archive.reader(entry.id), file_name=entry.filename,
+                                       mime=entry.mime, key=f"archive_download_{entry.id}", use_container_width=True)
+
+
+# --- Dictation ---
+def render_dictation_input():
+    """Expander for recording or uploading dictated notes; returns the audio when it hasn't been transcribed yet."""
+    with st.expander("🎙️ הכתבה קולית"):
+        recording = st.audio_input("הקליטי את הרשימות:", key="dictation_recording")
+        uploaded = st.file_uploader("או העלי קובץ שמע:", type=AUDIO_TYPES, key="dictation_upload")
+        st.toggle("הפקת סיכום אוטומטית בסיום התמלול", value=True, key="dictation_autogenerate")
+        st.caption("התמלול נעשה על השרת עצמו והשמע אינו נשלח לשום שירות חיצוני; הטקסט יתווסף לרשימות שבתיבה.")
+    for audio in (recording, uploaded):
+        if audio is not None and audio.file_id != st.session_state.get("dictated_file_id"):
+            return audio
+    return None
+
+
+def transcribe_dictation(transcriber, audio, notes_slot):
+    """Transcribes into the notes box, streaming the text as it comes, then reruns the page with the notes filled in."""
+    st.session_state.dictated_file_id = audio.file_id
+    existing_notes = st.session_state.get("session_input_area", "").strip()
+    prefix = existing_notes + "\n\n" if existing_notes else ""
+
+    def render_partial_transcript(partial_text):
+        notes_slot.markdown(summary_box_html(prefix + partial_text + " ▌"), unsafe_allow_html=True)
+
+    notes_slot.info("🎙️ מתמללת את ההקלטה...")
+    get_telemetry()
+    try:
+        transcript = transcriber.transcribe(audio, on_text=render_partial_transcript)
+    except ValueError as e:
+        st.error(f"❌ לא ניתן לקרוא את קובץ השמע {audio.name}: {e}")
+        return
+    except Exception as e:
+        st.error(f"❌ התמלול נכשל: {e}")
+        return
+    st.session_state.dictation_stats = dict(
+        audio_seconds=transcript.audio_seconds, seconds=transcript.seconds, load_seconds=transcript.load_seconds,
+        real_time_factor=transcript.real_time_factor, peak_rss_mb=transcript.peak_rss_mb,
+        added_rss_mb=transcript.added_rss_mb,
+    )
+    if not transcript.text:
+        st.warning("⚠️ לא זוהה דיבור בהקלטה.")
+        return
+    st.session_state.session_input_area = prefix + transcript.text
+    # הסיכום מתחיל מיד בהרצה הבאה, בלי לחיצה נוספת
+    if st.session_state.get("dictation_autogenerate", True):
+        st.session_state.generate_after_dictation = True
+    st.rerun()
+
+
+def dictation_caption(stats: dict) -> str:
+    load_note = f" | טעינת המודל {stats['load_seconds']:.1f} שניות" if stats["load_seconds"] >= 0.1 else ""
+    return (
+        f"🎙️ תומללו {stats['audio_seconds']:.0f} שניות שמע ב-{stats['seconds']:.1f} שניות"
+        f" (RTF {stats['real_time_factor']:.2f}) | זיכרון שיא {stats['peak_rss_mb']:,.0f}MB"
+        f" (+{stats['added_rss_mb']:,.0f}MB בזמן התמלול)" + load_note
+    )
+
+
 # --- Main App ---
 def main():
     st.set_page_config(
@@ -166,269 +565,13 @@ def main():
         initial_sidebar_state="collapsed"
     )
     
-    # CSS מעוצב ומקצועי יותר
-    st.markdown("""
-        <style>
-            /* כיוון RTL וגופנים */
-            @import url('https://fonts.googleapis.com/css2?family=Rubik:wght@300;400;500;600;700&display=swap');
-            
-            * {
-                direction: rtl !important;
-                font-family: 'Rubik', 'Arial Hebrew', Arial, sans-serif !important;
-            }
-            
-            /* רקע ראשי */
-            .stApp {
-                background-color: #F4F6F8; /* אפור כחלחל בהיר מאוד */
-                min-height: 100vh;
-            }
-            
-            /* יישור לימין לכל האלמנטים */
-            .stApp, .stApp header, .main, section[data-testid="st.main"],
-            .stMarkdown, .stMarkdown p, .stMarkdown div, .stMarkdown li,
-            /* .stAlert, */ /* ניתן להם טיפול ספציפי */
-            .stButton > button, .stDownloadButton > button,
-            .stSpinner > div, .stTextInput > label, .stTextArea > label,
-            h1, h2, h3, h4, h5, h6, p, div, span, label, li {
-                text-align: right !important;
-            }
-            
-            /* כותרת ראשית (כללית של Streamlit, אם מופיעה) */
-            h1[data-testid="stHeading"] {
-                color: #2E3A4D; /* כחול כהה אפרפר */
-                font-size: 2.6rem; 
-                font-weight: 600;
-                margin-bottom: 1.5rem;
-                text-align: center !important;
-                padding: 0.5rem;
-            }
-            
-            /* כותרות משנה */
-            h2[data-testid="stHeading"], h3[data-testid="stHeading"] {
-                color: #3B4A61; /* כחול אפרפר בינוני */
-                font-weight: 600;
-                margin-top: 1.8rem;
-                margin-bottom: 0.8rem;
-                padding-right: 0.8rem;
-                border-right: 3px solid #4A90E2; /* כחול נעים */
-            }
-            
-            /* אזור הטקסט */
-            .stTextArea > div > div > textarea {
-                text-align: right !important;
-                direction: rtl !important;
-                font-size: 1rem; /* 16px */
-                line-height: 1.7;
-                border-radius: 8px; /* פחות עגול */
-                border: 1px solid #D1D5DB; /* אפור בהיר */
-                padding: 0.8rem 1rem;
-                background-color: #ffffff;
-                box-shadow: 0 1px 3px rgba(0, 0, 0, 0.05); /* צל עדין */
-                transition: border-color 0.2s ease, box-shadow 0.2s ease;
-            }
-            
-            .stTextArea > div > div > textarea:focus {
-                border-color: #4A90E2; /* כחול נעים בפוקוס */
-                box-shadow: 0 0 0 2.5px rgba(74, 144, 226, 0.25); /* אפקט פוקוס עדין */
-            }
-            
-            /* כפתורים */
-            .stButton > button, .stDownloadButton > button {
-                background-color: #4A90E2; /* כחול נעים */
-                color: white;
-                border: none;
-                border-radius: 8px; /* פחות עגול */
-                padding: 0.65rem 1.6rem;
-                font-size: 1rem;
-                font-weight: 500;
-                box-shadow: 0 2px 4px rgba(74, 144, 226, 0.2); /* צל עדין */
-                transition: background-color 0.2s ease, transform 0.2s ease, box-shadow 0.2s ease;
-                margin: 0.8rem 0;
-                width: auto;
-                min-width: 180px;
-            }
-            
-            .stButton > button:hover, .stDownloadButton > button:hover {
-                background-color: #357ABD; /* כחול מעט כהה יותר */
-                transform: translateY(-1px);
-                box-shadow: 0 3px 6px rgba(74, 144, 226, 0.3);
-            }
-
-            /* כללי להתראות Streamlit */
-            div[data-testid="stNotification"] {
-                border-radius: 8px !important;
-                padding: 1.1rem 1.3rem !important;
-                margin: 1rem 0 !important;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.05) !important;
-                border-right-width: 3px !important;
-                border-right-style: solid !important;
-                text-align: right !important; /* לוודא שהטקסט בפנים מיושר */
-            }
-            div[data-testid="stNotification"] [data-testid="stMarkdownContainer"] p {
-                 text-align: right !important;
-            }
-
-
-            /* הודעת שגיאה (st.error) */
-            div[data-testid="stNotification"][role="alert"] {
-                background-color: #FEE2E2 !important; /* רקע אדום בהיר */
-                border-right-color: #EF4444 !important; /* גבול אדום */
-            }
-            div[data-testid="stNotification"][role="alert"] div[data-testid="stMarkdownContainer"] p {
-                color: #B91C1C !important; /* טקסט אדום כהה */
-            }
-
-            /* הודעת אזהרה (st.warning) */
-            div[data-testid="stNotification"]:has(div[data-testid="stNotificationContentWarning"]) {
-                background-color: #FEF3C7 !important; /* רקע צהוב בהיר */
-                border-right-color: #F59E0B !important; /* גבול צהוב */
-            }
-            div[data-testid="stNotification"]:has(div[data-testid="stNotificationContentWarning"]) div[data-testid="stMarkdownContainer"] p {
-                color: #92400E !important; /* טקסט צהוב כהה */
-            }
-            
-            /* הודעת הצלחה (st.success) */
-            div[data-testid="stNotification"]:has(div[data-testid="stNotificationContentSuccess"]) {
-                background-color: #D1FAE5 !important; /* רקע ירוק בהיר */
-                border-right-color: #10B981 !important; /* גבול ירוק */
-            }
-            div[data-testid="stNotification"]:has(div[data-testid="stNotificationContentSuccess"]) div[data-testid="stMarkdownContainer"] p {
-                color: #065F46 !important; /* טקסט ירוק כהה */
-            }
-
-            /* אזהרת פרטיות מותאמת אישית */
-            .privacy-warning-box {
-                background-color: #FEF3C7; /* רקע צהוב בהיר */
-                border-right: 3px solid #F59E0B; /* גבול צהוב */
-                border-radius: 8px;
-                padding: 1.1rem 1.3rem;
-                margin: 1rem 0;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.05);
-            }
-            .privacy-warning-box h4, .privacy-warning-box p {
-                color: #92400E !important; /* טקסט צהוב כהה */
-            }
-            
-            /* ספינר */
-            .stSpinner > div > div { /* התאמה לסלקטור של Streamlit */
-                text-align: center !important;
-                color: #4A90E2; /* כחול נעים */
-                font-size: 1rem;
-            }
-            
-            /* תיבת הסיכום */
-            .summary-box {
-                background: white;
-                border-radius: 8px;
-                padding: 1.5rem 2rem;
-                margin: 1rem 0;
-                box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08); /* צל עדין ומורם */
-                border: 1px solid #E5E7EB; /* אפור בהיר מאוד */
-                line-height: 1.7;
-                font-size: 1rem; /* 16px */
-                position: relative;
-                overflow: hidden;
-            }
-            
-            .summary-box:before {
-                content: '';
-                position: absolute;
-                top: 0;
-                right: 0;
-                width: 3px;
-                height: 100%;
-                background: #4A90E2; /* כחול נעים */
-            }
-            
-            /* כרטיסיות שלבים */
-            .step-card {
-                background: white;
-                border-radius: 8px;
-                padding: 1rem 1.2rem;
-                margin: 1rem 0;
-                box-shadow: 0 2px 6px rgba(0, 0, 0, 0.06);
-                border-right: 3px solid #4A90E2; /* כחול נעים */
-            }
-            .step-card h3 { /* כותרת בתוך כרטיסיית שלב */
-                color: #2E3A4D; /* כחול כהה אפרפר */
-                border-right: none !important; /* הסרת גבול כפול אפשרי */
-                padding-right: 0 !important;
-                margin-top: 0.3rem !important;
-                margin-bottom: 0.3rem !important;
-                font-size: 1.4rem; /* התאמת גודל */
-            }
-            
-            /* מספור שלבים */
-            .step-number {
-                display: inline-block;
-                width: 32px;
-                height: 32px;
-                background: #4A90E2; /* כחול נעים */
-                color: white;
-                border-radius: 50%;
-                text-align: center !important; /* חשוב ליישור המספר */
-                line-height: 32px;
-                font-weight: bold;
-                font-size: 0.85rem;
-                margin-left: 10px; /* מרווח מהטקסט */
-            }
-            
-            /* אייקונים */
-            .icon { /* אייקון בכותרת הראשית */
-                font-size: 2.2rem; /* התאמה לגודל הכותרת */
-                margin-left: 10px;
-                vertical-align: middle;
-                color: #4A90E2; /* כחול נעים */
-            }
-            
-            /* אנימציה לכניסה */
-            @keyframes fadeIn {
-                from {
-                    opacity: 0;
-                    transform: translateY(15px);
-                }
-                to {
-                    opacity: 1;
-                    transform: translateY(0);
-                }
-            }
-            
-            .main > div { /* החלת האנימציה על האלמנטים הראשיים */
-                animation: fadeIn 0.4s ease-out;
-            }
-            
-            /* רספונסיב */
-            @media (max-width: 768px) {
-                /* הכותרת הראשית המותאמת אישית */
-                 h1[style*="color: #2E3A4D"] { /* סלקטור לכותרת המותאמת */
-                    font-size: 2rem !important;
-                }
-                h1[data-testid="stHeading"] { /* כותרת כללית של Streamlit */
-                    font-size: 2rem;
-                }
-                
-                .stButton > button, .stDownloadButton > button {
-                    width: 100%;
-                    margin: 0.5rem 0;
-                    padding: 0.7rem 1rem;
-                }
-                .summary-box {
-                    padding: 1rem 1.2rem;
-                }
-            }
-        </style>
-    """, unsafe_allow_html=True)
-
-    # כותרת מותאמת אישית עם אייקון
-    st.markdown("""
-        <h1 style="text-align: center; color: #2E3A4D; font-size: 2.5rem; font-weight: 600; margin-bottom: 1.5rem;">
-            <span class="icon">📝</span>
-            מחולל סיכומי פגישות טיפוליות
-        </h1>
-    """, unsafe_allow_html=True)
+    # קישור לגיליון הסגנונות (נשמר במטמון הדפדפן) וכותרת - נבנים פעם אחת בתהליך
+    st.markdown(page_header_html(), unsafe_allow_html=True)
 
     if not check_password():
         st.stop()
+    if st.session_state.pop("remember_login", False):
+        remember_login()
 
     try:
         gemini_api_key = st.secrets["GEMINI_API_KEY"]
@@ -437,18 +580,18 @@ def main():
         st.stop()
         return
 
+    # מזהה סשן - משמש לתור ההוגן של בקשות Gemini ולשיוך גרסת הפרומפט
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    # A/B של גרסאות פרומפט: כל סשן משויך פעם אחת לגרסה לפי PROMPT_AB_WEIGHTS בסודות
+    if "prompt_version" not in st.session_state:
+        st.session_state.prompt_version = pick_prompt_version(
+            st.session_state.session_id, dict(st.secrets.get("PROMPT_AB_WEIGHTS", {}))
+        )
+
     # אזהרת פרטיות מעוצבת (משתמשת במחלקה .privacy-warning-box)
-    st.markdown("""
-        <div class="privacy-warning-box">
-            <h4 style="color: #92400E; margin-bottom: 0.5rem; font-weight: 600;">
-                ⚠️ אזהרת פרטיות חשובה
-            </h4>
-            <p style="margin: 0;">
-                נא <strong>לא</strong> להזין מידע אישי מזהה על מטופלים שעלול לחשוף את זהותם.<br>
-                מומלץ להשתמש בראשי תיבות, שמות בדויים או תיאורים כלליים.
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
+    st.markdown(PRIVACY_WARNING_HTML, unsafe_allow_html=True)
 
     # שלב 1 - הזנת רשימות
     st.markdown("""
@@ -459,56 +602,231 @@ def main():
             </h3>
         </div>
     """, unsafe_allow_html=True)
-    
-    session_notes_natural = st.text_area(
-        "תארי את פרטי הפגישה, נקודות עיקריות, התרשמויות והחלטות:",
-        height=280, # גובה מעט מוקטן
-        key="session_input_area",
-        placeholder="לדוגמה: פגישה עם א.ב., דיברנו על החרדות מהעבודה החדשה..."
-    )
+
+    # הכתבה קולית - רק כש-faster-whisper מותקן בשרת; התמלול מוצג בזמן אמת במקום תיבת הרשימות
+    transcriber = get_transcriber()
+    dictated_audio = render_dictation_input() if transcriber is not None else None
+    notes_slot = st.empty()
+    if dictated_audio is not None:
+        transcribe_dictation(transcriber, dictated_audio, notes_slot)
+
+    with notes_slot:
+        session_notes_natural = st.text_area(
+            "תארי את פרטי הפגישה, נקודות עיקריות, התרשמויות והחלטות:",
+            height=280, # גובה מעט מוקטן
+            key="session_input_area",
+            placeholder="לדוגמה: פגישה עם א.ב., דיברנו על החרדות מהעבודה החדשה..."
+        )
+    if st.session_state.get("dictation_stats"):
+        st.caption(dictation_caption(st.session_state.dictation_stats))
+
+    # הערכה מקומית של טוקנים, עלות וזמן עוד לפני השליחה ל-Gemini; אף פעם לא ממתינים לספירה המדויקת
+    if session_notes_natural.strip():
+        request_plan = plan_request(gemini_api_key, session_notes_natural, st.session_state.prompt_version)
+        plan_note = {
+            "chunked": f" | רשימות ארוכות: יעובדו ב-{len(request_plan.chunks)} חלקים במקביל ויאוחדו לסיכום אחד",
+            "trimmed": " | רשימות ארוכות: יקוצרו לפני השליחה",
+        }.get(request_plan.mode, "")
+        st.caption(
+            f"🔢 הערכה: כ-{request_plan.input_tokens:,} טוקנים | עלות משוערת ${request_plan.cost_usd:.4f}"
+            f" | זמן משוער כ-{request_plan.seconds:.0f} שניות" + plan_note
+        )
 
     model_name_for_display = "Gemini 2.5 Flash" # עדכון שם התצוגה של המודל
 
+    stream_summary = st.toggle("הצגת הסיכום בזמן אמת (סטרימינג)", value=True, key="stream_summary_toggle")
+    speculative_mode = st.toggle("הכנת סיכום מראש ברקע בזמן העריכה", value=False, key="speculative_toggle",
+                                 help="הסיכום מוכן עוד לפני הלחיצה; כל שינוי ברשימות מבטל הכנה קודמת")
+    edit_aware_mode = st.toggle("עדכון הסיכום הקודם בלבד כשמוסיפים או משנים מעט ברשימות", value=False,
+                                key="edit_aware_toggle",
+                                help="שינוי קטן ברשימות ישלח רק את השינוי יחד עם הסיכום הקודם; שינוי גדול יפיק סיכום מלא מחדש")
+    structured_mode = st.toggle("סיכום מחולק לסעיפים לפי תחומים", value=False, key="structured_summary_toggle",
+                                help="כל תחום נכתב בשדה נפרד ומוצב בסעיף משלו במסמך; הסיכום מוצג בסיומו ולא תוך כדי כתיבה")
+    # עם JOB_BROKER_URL ההפקה נעשית תמיד בתהליכי worker נפרדים (python -m worker)
+    distributed = get_broker() is not None
+    background_jobs = st.toggle("הפקה ברקע (התוצאה נשמרת גם אם הדף נטען מחדש)", value=distributed,
+                                key="background_jobs_toggle", disabled=distributed,
+                                help="בשרת זה הסיכומים מופקים תמיד ברקע" if distributed else None)
+    # ארכיון מקומי מוצפן - רק כשהוא מופעל בהגדרות השרת (SUMMARY_ARCHIVE)
+    summary_archive = get_summary_archive()
+    archive_tags = None
+    if summary_archive is not None:
+        if st.toggle("שמירת הסיכום בארכיון המקומי המוצפן", value=True, key="archive_toggle"):
+            archive_tags = parse_tags(st.text_input("תגיות לארכיון (מופרדות בפסיקים):", key="archive_tags_input",
+                                                    placeholder="לדוגמה: חרדה, הדרכת הורים"))
+    # מצב עריכה: לחיצה תעדכן את הסיכום הקודם במקום להפיק סיכום מלא (לא במצב סעיפים)
+    edit_aware_active = edit_aware_mode and bool(st.session_state.get("last_summary")) and not structured_mode
+    # ההכנה מראש מפיקה סיכום רציף מלא, ולכן היא פעילה רק כשזו הבקשה שהלחיצה תשלח
+    speculate = speculative_mode and not structured_mode and not edit_aware_active
+    if speculate:
+        render_speculation_watcher(gemini_api_key)
+    else:
+        get_speculative_summaries(gemini_api_key).cancel_stale(st.session_state.session_id)
+        if speculative_mode:
+            st.caption("🔮 ההכנה מראש אינה פעילה במצב סעיפים או בעדכון הסיכום הקודם")
+
+    # תבניות DOCX נוספות (למשל לפי מרפאה או סוג פגישה) מוגדרות ב-DOCX_TEMPLATES בסודות
+    for extra_template_name, extra_template_path in dict(st.secrets.get("DOCX_TEMPLATES", {})).items():
+        TEMPLATE_ENGINE.register(extra_template_name, extra_template_path)
+    publish_templates()
+    template_names = TEMPLATE_ENGINE.names()
+    template_name = DEFAULT_TEMPLATE_NAME
+    if len(template_names) > 1:
+        template_name = st.selectbox("תבנית מסמך:", template_names, key="template_name_select")
+    selected_formats = st.multiselect(
+        "פורמטים להורדה (כמה פורמטים יורדו יחד כקובץ ZIP):", export_formats(), default=["docx"],
+        format_func=lambda key: EXPORT_FORMATS[key].label, key="export_formats_select",
+    ) or ["docx"]
+
     col1, col2, col3, col4 = st.columns([0.5, 2, 2, 0.5]) # התאמת רוחב עמודות
     with col2:
         generate_clicked = st.button("✨ הפיקי סיכום פגישה", key="generate_button", use_container_width=True)
+        generate_clicked = st.session_state.pop("generate_after_dictation", False) or generate_clicked
     with col3:
         if st.button("🔄 איפוס", key="reset_button", use_container_width=True):
             # Clear text area and any generated summary from session state if needed
+            st.session_state.pop("dictation_stats", None)
             if "session_input_area" in st.session_state:
                 st.session_state.session_input_area = ""
             # Potentially clear other relevant session state variables here
+            clear_active_job()
             st.rerun()
+
+    scheduler_stats = get_gemini_scheduler(gemini_api_key).stats()
+    if scheduler_stats["queue_depth"] or scheduler_stats["in_flight"]:
+        st.caption(
+            f"🚦 עומס נוכחי: {scheduler_stats['queue_depth']} בקשות בתור, {scheduler_stats['in_flight']} בעיבוד"
+            f" | המתנה משוערת: {scheduler_stats['estimated_wait_seconds']:.0f} שניות"
+        )
     
     if generate_clicked:
+        clear_active_job()
+    if generate_clicked and background_jobs and session_notes_natural.strip():
+        job_payload = dict(notes=session_notes_natural, prompt_version=st.session_state.prompt_version,
+                           template_name=template_name, formats=selected_formats,
+                           structured=structured_mode, archive_tags=archive_tags,
+                           session_id=st.session_state.session_id)
+        if edit_aware_active:
+            job_payload.update(previous_notes=st.session_state.last_summarized_notes,
+                               previous_summary=st.session_state.last_summary)
+        st.session_state.active_job_id = get_job_queue(gemini_api_key).submit(
+            "summary", job_payload, session_id=st.session_state.session_id
+        )
+        st.query_params["job"] = sign_value(st.session_state.active_job_id, job_link_secret())
+    elif generate_clicked:
             if not session_notes_natural.strip():
                 st.warning("⚠️ אנא הזיני רשימות כלשהן מהפגישה.")
                 st.stop()
 
-            with st.spinner(f"🔄 מעבד את הרשימות ומכין סיכום נרטיבי באמצעות {model_name_for_display}... אנא המתיני."):
-                narrative_summary = get_narrative_summary_from_gemini(gemini_api_key, session_notes_natural)
-
-            if not narrative_summary: # הודעת שגיאה כבר מוצגת מתוך הפונקציה אם יש בעיה עם ה-API
-                if not any(msg.type == "error" for msg in st.session_state.get("streamlit_INTERNAL_messages", [])): # Check if an error was already shown
-                     st.error("❌ לא הצלחנו ליצור סיכום. אנא נסי שוב או בדקי את הרשימות שהזנת.")
-                st.stop()
-
-
-            # שלב 2 - הצגת הסיכום
-            st.markdown("""
+            step2_header = """
                 <div class="step-card" style="margin-top: 1.5rem;">
                     <h3>
                         <span class="step-number">2</span>
                         סיכום הפגישה הנרטיבי
                     </h3>
                 </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
-                <div class="summary-box">
-                    {narrative_summary.replace('\n', '<br>')}
-                </div>
-            """, unsafe_allow_html=True)
+            """
+            # Stage timings for this click go to the metrics endpoint and the JSONL log
+            get_telemetry()
+            ui_trace = telemetry.start_trace("ui_generate", session_id=st.session_state.session_id,
+                                             prompt_version=st.session_state.prompt_version,
+                                             streaming=stream_summary, template=template_name)
+            request_started = time.perf_counter()
+            queue_status = st.empty()
+
+            # סיכום שכבר מוכן ברקע עבור אותן רשימות: ממתינים לו במקום לשלוח בקשה כפולה
+            if speculate:
+                speculative = get_speculative_summaries(gemini_api_key)
+                if speculative.status(st.session_state.session_id, session_notes_natural)["state"] == "running":
+                    with st.spinner("🔮 הסיכום שהוכן מראש כמעט מוכן..."):
+                        speculative.wait(st.session_state.session_id, session_notes_natural,
+                                         st.session_state.prompt_version)
+
+            def show_queue_position(requests_ahead, estimated_wait):
+                queue_status.info(f"🚦 הבקשה ממתינה בתור: {requests_ahead} בקשות לפנייך, המתנה משוערת {estimated_wait:.0f} שניות")
+
+            # מצב עריכה: משווים לגרסה האחרונה שסוכמה בסשן זה
+            # מצב סעיפים מפיק תמיד סיכום מלא; העדכון לפי שינויים עובד רק על הסיכום הרציף
+            summary_sections = []
+            output_mode = dict(structured=structured_mode, on_sections=summary_sections.extend)
+            previous_version = {}
+            if edit_aware_active:
+                previous_version = dict(previous_notes=st.session_state.last_summarized_notes,
+                                        previous_summary=st.session_state.last_summary)
+
+            if stream_summary:
+                # שלב 2 מוצג מיד, והסיכום נכתב לתוכו תוך כדי קבלת התשובה
+                st.markdown(step2_header, unsafe_allow_html=True)
+                summary_placeholder = st.empty()
+                summary_placeholder.markdown(summary_box_html("⏳ ממתין לתחילת התשובה מ-" + model_name_for_display + "..."), unsafe_allow_html=True)
+                first_token_at = []
+
+                def render_partial_summary(partial_text):
+                    if not first_token_at:
+                        first_token_at.append(time.perf_counter())
+                    summary_placeholder.markdown(summary_box_html(partial_text + " ▌"), unsafe_allow_html=True)
+
+                narrative_summary = get_narrative_summary_from_gemini(gemini_api_key, session_notes_natural, on_chunk=render_partial_summary,
+                                                                     prompt_version=st.session_state.prompt_version,
+                                                                     session_id=st.session_state.session_id,
+                                                                     on_wait=show_queue_position,
+                                                                     **output_mode, **previous_version)
+                time_to_first_token = (first_token_at[0] - request_started) if first_token_at else None
+            else:
+                with st.spinner(f"🔄 מעבד את הרשימות ומכין סיכום נרטיבי באמצעות {model_name_for_display}... אנא המתיני."):
+                    narrative_summary = get_narrative_summary_from_gemini(gemini_api_key, session_notes_natural,
+                                                                         prompt_version=st.session_state.prompt_version,
+                                                                         session_id=st.session_state.session_id,
+                                                                         on_wait=show_queue_position,
+                                                                         **output_mode, **previous_version)
+                time_to_first_token = None
+            total_generation_time = time.perf_counter() - request_started
+            ui_trace.add_span("summarize", total_generation_time * 1000)
+            queue_status.empty()
+            served_from_cache = get_summary_cache().last_lookup_was_hit()
+            connection_info = None if served_from_cache else get_gemini_client(gemini_api_key).stats.last_request()
+
+            if not narrative_summary: # הודעת שגיאה כבר מוצגת מתוך הפונקציה אם יש בעיה עם ה-API
+                if stream_summary:
+                    summary_placeholder.empty()
+                if not any(msg.type == "error" for msg in st.session_state.get("streamlit_INTERNAL_messages", [])): # Check if an error was already shown
+                     st.error("❌ לא הצלחנו ליצור סיכום. אנא נסי שוב או בדקי את הרשימות שהזנת.")
+                telemetry.end_trace(ui_trace, outcome="failed")
+                st.stop()
+
+            st.session_state.last_summarized_notes = session_notes_natural
+            st.session_state.last_summary = narrative_summary
+
+            if stream_summary:
+                summary_placeholder.markdown(summary_box_html(narrative_summary, summary_sections), unsafe_allow_html=True)
+            else:
+                # שלב 2 - הצגת הסיכום
+                st.markdown(step2_header, unsafe_allow_html=True)
+                st.markdown(summary_box_html(narrative_summary, summary_sections), unsafe_allow_html=True)
+
+            timing_caption = f"⏱️ זמן כולל: {total_generation_time:.1f} שניות"
+            if served_from_cache:
+                cache_stats = get_summary_cache().stats()
+                timing_caption = (f"♻️ נשלף מהמטמון ללא קריאה ל-Gemini ({total_generation_time * 1000:.0f} מ\"ש)"
+                                  f" | פגיעות: {cache_stats['hits'] + cache_stats['disk_hits'] + cache_stats['shared_hits']},"
+                                  f" החטאות: {cache_stats['misses']}")
+            elif time_to_first_token is not None:
+                timing_caption = f"⚡ זמן עד תחילת התשובה: {time_to_first_token:.1f} שניות | " + timing_caption
+            if ui_trace.attributes.get("update_mode") == "incremental" and not served_from_cache:
+                timing_caption = (f"✏️ עודכן מהסיכום הקודם לפי השינויים בלבד"
+                                  f" ({ui_trace.attributes['changed_ratio']:.0%} מהרשימות השתנו) | " + timing_caption)
+            st.caption(timing_caption)
+            if ui_trace.attributes.get("structured_fallback"):
+                st.caption("ℹ️ התשובה לפי סעיפים לא הייתה תקינה, ולכן הופק סיכום רציף במקומה")
+            if ui_trace.attributes.get("pii_replaced"):
+                st.caption(f"🛡️ {ui_trace.attributes['pii_replaced']} פרטים מזהים (שמות, טלפונים, ת\"ז, כתובות) הוסתרו לפני השליחה ל-Gemini ושוחזרו בסיכום")
+
+            if connection_info:
+                pool_stats = get_gemini_client(gemini_api_key).stats.snapshot()
+                st.caption(
+                    f"חיבור ל-Gemini: {'חיבור קיים נוצל מחדש' if connection_info['connection_reused'] else 'חיבור חדש'}"
+                    f" | {pool_stats['reused_connections']}/{pool_stats['requests']} בקשות על חיבור קיים"
+                )
 
             # שלב 3 - הורדת הקובץ
             st.markdown("""
@@ -520,34 +838,34 @@ def main():
                 </div>
             """, unsafe_allow_html=True)
             
-            template_file = "patient_template.docx"
+            template_file = TEMPLATE_ENGINE.path(template_name)
 
             if not os.path.exists(template_file):
                 st.error(f"❌ שגיאה: קובץ התבנית DOCX '{template_file}' לא נמצא.")
                 st.info(f"💡 אנא צרי קובץ '{template_file}' פשוט באותה תיקייה, לדוגמה עם כותרת ומציין מקום יחיד כמו {{{{narrative_summary}}}}.")
+                telemetry.end_trace(ui_trace, outcome="template_missing")
                 st.stop()
 
             try:
-                doc = DocxTemplate(template_file)
-                context = {
-                    "narrative_summary": narrative_summary # Ensure this matches the placeholder in your docx
-                }
-                doc.render(context)
-
-                bio = BytesIO()
-                doc.save(bio)
-                bio.seek(0)
-                
-                first_words = " ".join(session_notes_natural.split()[:3]).replace('"', '').replace("'", "")
-                doc_filename = f"סיכום_פגישה_{first_words.replace(' ', '_')}.docx" if first_words else "סיכום_פגישה.docx"
+                base_name = summary_basename(session_notes_natural)
+                with ui_trace.span("export"):
+                    rendered_doc, exported_files = render_summary_exports(narrative_summary, template_name,
+                                                                          selected_formats, base_name, summary_sections)
+                for exported in exported_files:
+                    ui_trace.add_span(f"export_{exported.format}", exported.render_ms)
+                download_payload_started = time.perf_counter()
+                download_data, download_filename, download_mime = bundle(exported_files, base_name)
+                # הקובץ נשמר פעם אחת במאגר ונקרא ממנו רק בלחיצה על ההורדה
+                artifact_store = get_artifact_store()
+                artifact_id = artifact_store.put(download_data, session_id=st.session_state.session_id)
 
                 col_dl1, col_dl2, col_dl3, col_dl4 = st.columns([0.5, 2, 2, 0.5])
                 with col_dl2:
                     st.download_button(
-                        label="📥 הורידי סיכום פגישה (DOCX)",
-                        data=bio,
-                        file_name=doc_filename,
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                        label=download_label([exported.format for exported in exported_files]),
+                        data=artifact_store.reader(artifact_id),
+                        file_name=download_filename,
+                        mime=download_mime,
                         use_container_width=True
                     )
                 with col_dl3:
@@ -555,60 +873,37 @@ def main():
                         if "session_input_area" in st.session_state:
                              st.session_state.session_input_area = ""
                         st.rerun()
+                ui_trace.add_span("download_payload", (time.perf_counter() - download_payload_started) * 1000)
+                if archive_tags is not None:
+                    with ui_trace.span("archive"):
+                        archive_summary(narrative_summary, session_notes_natural, download_data,
+                                        download_filename, download_mime, archive_tags)
+                ui_trace.set(docx_bytes=len(rendered_doc.data), download_bytes=len(download_data),
+                             formats=",".join(exported.format for exported in exported_files),
+                             template_reloaded=rendered_doc.reloaded,
+                             session_artifact_bytes=artifact_store.session_bytes(st.session_state.session_id))
                 
                 st.success("✅ המסמך הופק בהצלחה ומוכן להורדה!")
+                st.caption(
+                    f"📄 תבנית: {rendered_doc.template_name} | טעינת תבנית: "
+                    + (f"{rendered_doc.parse_ms:.1f} מ\"ש" if rendered_doc.reloaded else "מהזיכרון")
+                    + f" | {export_timings_caption({f.format: f.render_ms for f in exported_files})}"
+                )
 
             except Exception as e:
+                ui_trace.set(outcome="error", error_type=type(e).__name__)
                 st.error(f"❌ שגיאה ביצירת קובץ DOCX: {e}")
                 st.error(f"הטקסט שנוסה להטמיע בתבנית (תחילתו): {narrative_summary[:200]}...")
+            telemetry.end_trace(ui_trace)
             
-    current_year = datetime.date.today().year
-    # פוטר עם פרטי קשר
-    st.markdown(f"""
-        <div style="margin-top: 3rem; padding: 1.5rem; text-align: center;">
-            <p style="font-size: 1.1rem; color: #525F6C; margin-bottom: 1.5rem;">
-                 פותח על ידי יהודה יונגשטיין עבור אנשי מקצוע בתחום הטיפול
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    col_foot1, col_foot_icons, col_foot3 = st.columns([2,1,2]) # Centering the icons a bit
-    with col_foot_icons:
-        subcol_icon1, subcol_icon2 = st.columns(2, gap="small")
-        with subcol_icon1:
-            image_url_mail = "https://img.icons8.com/fluency-systems-filled/48/new-post.png" # Alternative icon
-            mail_url = "mailto:yehudayu@gmail.com"
-            st.markdown(f"""
-                <div style="text-align: center;">
-                    <a href='{mail_url}' style="text-decoration: none;">
-                        <img src='{image_url_mail}' width='40' height='40' style="transition: transform 0.2s ease; border-radius: 8px; opacity: 0.7; filter: grayscale(30%);"
-                             onmouseover="this.style.opacity=1; this.style.transform='scale(1.1)'; this.style.filter='grayscale(0%)';"
-                             onmouseout="this.style.opacity=0.7; this.style.transform='scale(1)'; this.style.filter='grayscale(30%)';">
-                    </a>
-                </div>
-            """, unsafe_allow_html=True)
-            
-        with subcol_icon2:
-            image_url_linkedin = "https://img.icons8.com/fluency-systems-filled/48/linkedin.png" # Alternative icon
-            linkedin_url = "https://www.linkedin.com/in/yehuda-yungstein/"
-            st.markdown(f"""
-                <div style="text-align: center;">
-                    <a href='{linkedin_url}' target='_blank' style="text-decoration: none;">
-                        <img src='{image_url_linkedin}' width='40' height='40' style="transition: transform 0.2s ease; border-radius: 8px; opacity: 0.7; filter: grayscale(30%);"
-                             onmouseover="this.style.opacity=1; this.style.transform='scale(1.1)'; this.style.filter='grayscale(0%)';"
-                             onmouseout="this.style.opacity=0.7; this.style.transform='scale(1)'; this.style.filter='grayscale(30%)';">
-                    </a>
-                </div>
-            """, unsafe_allow_html=True)
-    
-    st.markdown(f"""
-        <div style="text-align: center; margin-top: 1rem; padding: 0.8rem;">
-            <p style="font-size: 0.85rem; color: #8A94A0;">
-                © {current_year} | נבנה עם Streamlit
-            </p>
-        </div>
-    """, unsafe_allow_html=True)
-   
+    render_job_section(gemini_api_key)
+    render_batch_section(gemini_api_key, template_name)
+    if summary_archive is not None:
+        render_archive_section(summary_archive)
+
+    # פוטר עם פרטי קשר; האייקונים מוגשים מקומית מ-static/icons
+    st.markdown(footer_html(datetime.date.today().year), unsafe_allow_html=True)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,208 @@
+"""
+Local de-identification of session notes before they are sent to Gemini.
+
+Identifiers (Hebrew first names, Israeli ID numbers, phone numbers, emails
+and street addresses) are replaced with placeholders such as [NAME_1] and
+[PHONE_1]; the model writes the summary around the placeholders and
+restore() puts the original values back. One Scrubber keeps the mapping, so
+the same value gets the same placeholder across several texts (notes,
+previous notes, previous summary).
+
+All patterns are compiled once into a single alternation and the notes are
+scanned in one pass by the regex engine. The first-name dictionary is
+compiled into a trie-shaped regex (names sharing a prefix share a branch),
+matched as whole words with up to two attached prefix letters such as
+ו/ה/ב/ל. Names that are also everyday words ("טובה", "אופק") are replaced
+too, except where they can only be words: with an attached definite article
+("האופק") or after a quantifier or degree word ("יותר טובה", "כל אופק").
+Deployments that prefer fewer false positives can opt in to replacing them
+only after a title ("מר", "גב'", "ד"ר") or right before a name from
+PII_EXTRA_NAMES, typically a surname.
+"""
+import re
+from functools import lru_cache
+
+# Common Israeli first names, replaced wherever they appear as a word. Add
+# names (or surnames) per deployment with PII_EXTRA_NAMES.
+HEBREW_FIRST_NAMES = frozenset("""
+אביגיל אביטל אביתר אברהם אהרון אודיה אודליה אופיר אורטל אורי אוריה אורית אורלי אושרת איילה איילת אילנה
+איתי איתמר אליאור אליהו אליעזר אלישבע אסנת אסתר אפרת אריאל אריאלה בנימין בתיה גאיה גדעון גלית דורית
+דורון דנית דניאל דניאלה דפנה הדסה זהבה חגית טליה טלי יגאל יהודה יהודית יהונתן יהושע יואב יואל יוחאי
+יונתן יוסי יעל יפית יצחק ירון ישי ישעיהו יששכר ליאור ליאורה ליאל ליהי ליה לימור לירון לירז ליאת מאיה
+מוריה מורן מיכאל מיכל מירי מרדכי משה נדב נועה נחום נחמיה נילי נירית נתנאל סיגל עידו עינב עינת ענבל
+עפרה עקיבא צביה רבקה רון רוני רונית רות רחל רני שגיא שולמית שמואל שמעון שמרית שרית תומר
+""".split())
+
+# First names that are also everyday words in session notes ("תחושה טובה",
+# "גילה לבעלה", "אופק טיפולי"). They are replaced like any name unless the
+# context makes them words (see _WORD_CONTEXT), or, with titled_word_names,
+# only after a title or right before one of PII_EXTRA_NAMES. Names that are
+# mostly words (חיים, שמחה, אור, גל, אבי...) are not listed at all.
+WORD_FIRST_NAMES = frozenset("""
+אוהד אופק אורן אילן איתן אלון אלמוג אסף ארז גיא גילה דבורה דליה דנה הדס הדר הילה הלל זיו חוה חנה חנן
+טובה יאיר יובל יונה יוסף ירדן ישראל כנרת לאורה מאיר מירב מרים נועם נטע ניר נתן סיון ספיר עדי עדן עומר
+ענבר פנינה צבי ציפורה צפורה קרן רינה רעות שושנה שלומי שקד שרה תהילה תמר
+""".split())
+
+# Titles that make the next word a name: מר, גב', גברת, ד"ר, דר', פרופ'
+_TITLE = r"(?:מר|גב['׳]|גברת|ד[\"״]ר|דר['׳]|פרופ['׳])"
+
+PREFIX_LETTERS = "ובהלמשכ"
+
+# Words after which a word-like name can only be a word: quantifiers and degree words,
+# which never come before a person's name ("כל אופק", "יותר טובה", "מאוד טובה")
+_WORD_CONTEXT = r"(?:כל|שום|איזה|איזו|הרבה|קצת|מעט|יותר|פחות|מאוד|כה|ממש|הכי)"
+
+PLACEHOLDER_KINDS = ("NAME", "ID", "PHONE", "EMAIL", "ADDRESS")
+
+_HEBREW_WORD = r"[א-ת]+(?:[־'׳\"״][א-ת]+)*"
+# Street addresses: a street marker, up to three words of street name and a house number
+_ADDRESS = (
+    r"(?P<street>(?<![א-ת])[ובלמ]?(?:רחוב|רח['׳]|שדרות|שד['׳]|סמטת))\s+"
+    rf"(?P<address>{_HEBREW_WORD}(?:\s+{_HEBREW_WORD}){{0,2}}\s+\d{{1,4}}(?:\s?[א-ת](?![א-ת]))?)"
+)
+_EMAIL = r"(?P<email>(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+# Mobile (05X), landline (0X / 07X) and +972 numbers, with optional dashes or spaces
+_PHONE = r"(?P<phone>(?<![\d+])(?:\+972[-\s]?|0)(?:5\d|7\d|[2-489])[-\s]?\d{3}[-\s]?\d{4}(?!\d))"
+_ID = r"(?P<id>(?<!\d)\d{8}-?\d(?!\d))"
+# Identifiers start a token (or digits glued to a Hebrew prefix, "ל0521234567"); checking
+# this once up front lets the scan skip positions inside words without trying every branch
+_TOKEN_START = r"(?:(?<![\w.])|(?<=[א-ת])(?=[\d+]))"
+
+PLACEHOLDER_PATTERN = re.compile(r"\[\s*(" + "|".join(PLACEHOLDER_KINDS) + r")_(\d+)\s*\]")
+# An unfinished placeholder at the end of a streamed partial answer ("...עם [NAM")
+PARTIAL_PLACEHOLDER_PATTERN = re.compile(r"\[[A-Z_\d\s]*$")
+
+
+def valid_israeli_id(digits: str) -> bool:
+    """Checks the ID number's check digit (Luhn-style weights 1,2,1,2...)."""
+    digits = digits.replace("-", "").zfill(9)
+    total = 0
+    for i, digit in enumerate(digits):
+        value = int(digit) * (1 + i % 2)
+        total += value - 9 if value > 9 else value
+    return total % 10 == 0
+
+
+def trie_pattern(words) -> str:
+    """
+    A regex matching any of the words, shaped as a trie: words sharing a
+    prefix share one branch, so a non-matching word is rejected after its
+    first letter or two instead of being compared with every name.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for letter in word:
+            node = node.setdefault(letter, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(letter) + build(child) for letter, child in sorted(node.items()) if letter]
+        if not branches:
+            return ""
+        ends_here = "" in node
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        return "(?:" + "|".join(branches) + ")" + ("?" if ends_here else "")
+
+    return build(trie)
+
+
+@lru_cache(maxsize=8)
+def identifier_pattern(extra_names: tuple = (), titled_word_names: bool = False):
+    """
+    All identifier patterns as one compiled alternation, for the names plus
+    extra_names. With titled_word_names, WORD_FIRST_NAMES are replaced only
+    after a title or right before one of extra_names.
+    """
+    extra = frozenset(name for name in extra_names if name)
+    names = HEBREW_FIRST_NAMES | extra
+    word_names = trie_pattern(WORD_FIRST_NAMES - extra)
+    # A word-like name with an attached definite article or after a quantifier is a word; it is
+    # matched here first so the name branch below never sees it, and left as it is
+    word = (
+        rf"(?P<word>(?<![א-ת])(?:{_WORD_CONTEXT}\s+[{PREFIX_LETTERS}]{{0,2}}?|[{PREFIX_LETTERS}]?ה)"
+        rf"(?:{word_names})(?![א-ת]))"
+    )
+    if titled_word_names:
+        untitled = trie_pattern(names)
+        if extra:
+            # Word-like names count only right before a name from extra_names, typically a surname
+            untitled += rf"|{word_names}(?=\s+{trie_pattern(extra)}(?![א-ת]))"
+        name_pattern = rf"(?(title){trie_pattern(names | WORD_FIRST_NAMES)}|(?:{untitled}))"
+    else:
+        name_pattern = trie_pattern(names | WORD_FIRST_NAMES)
+    name = (
+        rf"(?<![א-ת])(?P<prefix>[{PREFIX_LETTERS}]{{0,2}}?(?P<title>{_TITLE}\s+)?)"
+        rf"(?P<name>{name_pattern})(?![א-ת])"
+    )
+    return re.compile(_TOKEN_START + "(?:" + "|".join((_ADDRESS, word, name, _EMAIL, _PHONE, _ID)) + ")")
+
+
+def parse_name_list(value) -> tuple:
+    """Names from a comma/whitespace separated setting value (or a list of names)."""
+    if not value:
+        return ()
+    if isinstance(value, str):
+        value = re.split(r"[,\s]+", value)
+    return tuple(sorted({name.strip() for name in value if name.strip()}))
+
+
+class Scrubber:
+    """Replaces identifiers with numbered placeholders and restores them; not thread-safe."""
+
+    def __init__(self, extra_names: tuple = (), titled_word_names: bool = False):
+        self._pattern = identifier_pattern(tuple(extra_names), titled_word_names)
+        self._placeholders = {}  # (kind, value) -> placeholder
+        self._values = {}  # placeholder -> value
+        self._counts = dict.fromkeys(PLACEHOLDER_KINDS, 0)
+
+    @property
+    def replaced(self) -> int:
+        """Distinct identifiers replaced so far."""
+        return len(self._values)
+
+    def counts(self) -> dict:
+        return {kind.lower(): count for kind, count in self._counts.items() if count}
+
+    def _placeholder(self, kind: str, value: str) -> str:
+        placeholder = self._placeholders.get((kind, value))
+        if placeholder is None:
+            self._counts[kind] += 1
+            placeholder = f"[{kind}_{self._counts[kind]}]"
+            self._placeholders[(kind, value)] = placeholder
+            self._values[placeholder] = value
+        return placeholder
+
+    def _replace(self, match) -> str:
+        kind = match.lastgroup
+        text = match.group(0)
+        if kind == "name":
+            # Attached prefix letters ("ו", "ל", "מה") and a title stay outside the placeholder
+            return match.group("prefix") + self._placeholder("NAME", match.group("name"))
+        if kind == "address":
+            # The street marker ("רחוב", "ברח'") stays readable; the name and number are replaced
+            return text[:match.start("address") - match.start(0)] + self._placeholder("ADDRESS", match.group("address"))
+        if kind == "word" or (kind == "id" and not valid_israeli_id(text)):
+            return text
+        return self._placeholder({"email": "EMAIL", "phone": "PHONE", "id": "ID"}[kind], text)
+
+    def scrub(self, text: str) -> str:
+        if not text:
+            return text
+        return self._pattern.sub(self._replace, text)
+
+    def restore(self, text: str, partial: bool = False) -> str:
+        """
+        Puts the original values back in place of known placeholders. With
+        partial=True (a streamed answer so far) a trailing unfinished
+        placeholder is held back until the rest of it arrives.
+        """
+        if not text or not self._values:
+            return text
+        if partial:
+            text = PARTIAL_PLACEHOLDER_PATTERN.sub("", text)
+        return PLACEHOLDER_PATTERN.sub(
+            lambda m: self._values.get(f"[{m.group(1)}_{m.group(2)}]", m.group(0)), text
+        )
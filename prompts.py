@@ -0,0 +1,305 @@
+"""
+Prompt definitions for the session summary generator.
+
+Everything here is built once per process and treated as read-only:
+the system prompt, the few-shot example turns and a fingerprint of both.
+Variants are registered by version so they can be A/B tested side by side.
+The SDK Content objects are built on first use, so computing a cache key
+doesn't require importing google-genai.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from functools import cached_property
+
+KEY_TOPICS_TO_COVER = (
+    "פרטי המטופל (גיל, מצב משפחתי, רקע רלוונטי)",
+    "סיבת הפניה או נושא מרכזי של הפגישה",
+    "תיאור המצב הנוכחי של המטופל (תסמינים, תחושות, תפקוד)",
+    "מידע סובייקטיבי עיקרי (מה שהמטופל מדווח)",
+    "מידע אובייקטיבי או תצפיות רלוונטיות (אם צוין)",
+    "הערכה כללית של המצב (התרשמות)",
+    "תכנית התערבות או המלצות עיקריות להמשך",
+    "רקע ביו-פסיכו-סוציאלי רלוונטי (משפחה, עבודה, תמיכה)",
+    "אירועים משמעותיים בעבר ובהווה",
+    "ציפיות מהטיפול (אם צוין)",
+)
+
+# Structured-output mode: one JSON field (and DOCX placeholder) per key topic,
+# as (field name, section heading) pairs in the same order as the topics
+SUMMARY_SECTIONS = (
+    ("patient_details", "פרטי המטופל"),
+    ("referral_reason", "סיבת הפניה"),
+    ("current_state", "מצב נוכחי"),
+    ("subjective", "דיווח המטופל"),
+    ("objective", "תצפיות"),
+    ("assessment", "הערכה"),
+    ("plan", "תכנית התערבות והמלצות"),
+    ("background", "רקע ביו-פסיכו-סוציאלי"),
+    ("significant_events", "אירועים משמעותיים"),
+    ("expectations", "ציפיות מהטיפול"),
+)
+
+SYSTEM_PROMPT_TEMPLATE = """
+אתה עוזר AI מומחה לכתיבת סיכומי פגישות טיפוליות עבור מטפלים רגשיים.
+המשימה שלך היא לקרוא את רשימות המטפל (שיינתנו בעברית) ולכתוב סיכום פגישה קוהרנטי ומקיף בעברית, בפסקאות רציפות.
+הסיכום צריך להיות כתוב בשפה מקצועית אך קריאה, כאילו נכתב על ידי המטפל עצמו.
+
+**מבנה ותוכן הסיכום:**
+על הסיכום לשלב באופן טבעי מידע מהתחומים הבאים לפי הסדר שלהם, ככל שהוא מופיע ברשימות המטפל:
+{key_topics}
+
+**סגנון הכתיבה:**
+- כתוב בפסקאות רציפות, לא בנקודות או רשימות.
+- שמור על זרימה לוגית בין חלקי הסיכום.
+- השתמש בדוגמאות שניתנו לך כמודל לסגנון ולרמת הפירוט.
+- אם מידע מסוים חסר ברשימות המטפל, אל תמציא אותו. התמקד במה שסופק.
+- הימנע משימוש ישיר בכותרות סעיפים (כמו "S", "O", "A", "P") בתוך הטקסט הרציף.
+- פרטים מזהים הוחלפו בסימונים כמו [NAME_1], [PHONE_1] או [ADDRESS_1]. העתק כל סימון בדיוק כפי שהוא, בלי לתרגם, לשנות או להשמיט אותו.
+- זכור כי המבנה של הטקסט שלך צריך לעקוב אחרי השלבים שצירפתי ולא בהכרח לפי הסדר שהמשתמש העלה 
+
+**פלט:**
+הפלט שלך צריך להיות טקסט אחד רציף בעברית, המהווה את סיכום הפגישה.
+
+אנא עבד את הרשימות הבאות של המטפל וצור את סיכום הפגישה הנרטיבי:
+"""
+
+# Map step of long-input mode: each chunk of the notes is condensed into
+# topic-organized partial notes, which the regular prompt then turns into the narrative
+CHUNK_PROMPT_TEMPLATE = """
+אתה עוזר AI המסייע למטפלים רגשיים לסכם רשימות פגישה ארוכות.
+תקבל חלק אחד מתוך רשימות ארוכות של מטפל (בעברית). רשום בעברית, בקצרה ובנאמנות לטקסט, את כל המידע שמופיע בחלק זה, מאורגן לפי הנושאים הבאים:
+{key_topics}
+
+**הנחיות:**
+- כתוב כל נושא ככותרת קצרה ומתחתיה את המידע הרלוונטי מחלק זה בלבד.
+- השמט נושאים שאין עליהם מידע בחלק זה.
+- שמור על פרטים עובדתיים (גילאים, תאריכים, שמות תרופות, המלצות) כפי שנכתבו.
+- אל תמציא מידע ואל תוסיף פרשנות שאינה מופיעה ברשימות.
+- פרטים מזהים הוחלפו בסימונים כמו [NAME_1], [PHONE_1] או [ADDRESS_1]. העתק כל סימון בדיוק כפי שהוא, בלי לתרגם, לשנות או להשמיט אותו.
+"""
+
+CHUNK_INPUT_TEMPLATE = "חלק {index} מתוך {total} של רשימות המטפל:\n\n{notes}"
+
+REDUCE_INPUT_TEMPLATE = """הרשימות הארוכות של המטפל עובדו מראש ל-{total} חלקים, וכל חלק רוכז לפי נושאים. אחד את המידע מכל החלקים לסיכום פגישה נרטיבי אחד, ללא חזרות:
+
+{partials}"""
+
+# Structured-output mode: the same summary, returned as a JSON object with one
+# paragraph per key topic (the response schema is built from the key topics)
+STRUCTURED_PROMPT_TEMPLATE = """
+אתה עוזר AI מומחה לכתיבת סיכומי פגישות טיפוליות עבור מטפלים רגשיים.
+המשימה שלך היא לקרוא את רשימות המטפל (שיינתנו בעברית) ולכתוב סיכום פגישה מקצועי וקריא בעברית, מחולק לפי התחומים הבאים:
+{fields}
+
+**הנחיות:**
+- החזר אובייקט JSON בלבד, עם שדה אחד לכל תחום לפי שמות השדות שלמעלה.
+- כל שדה הוא פסקה רציפה בעברית, כאילו נכתבה על ידי המטפל עצמו, ללא כותרות, נקודות או רשימות.
+- אם אין ברשימות מידע על תחום מסוים, השאר את השדה שלו כמחרוזת ריקה. אל תמציא מידע.
+- אל תחזור על אותו מידע ביותר משדה אחד.
+- פרטים מזהים הוחלפו בסימונים כמו [NAME_1], [PHONE_1] או [ADDRESS_1]. העתק כל סימון בדיוק כפי שהוא, בלי לתרגם, לשנות או להשמיט אותו.
+"""
+
+# Edit-aware regeneration: the previous summary is revised for a small change
+# in the notes instead of being rewritten from the full notes
+UPDATE_PROMPT_TEMPLATE = """
+אתה עוזר AI מומחה לכתיבת סיכומי פגישות טיפוליות עבור מטפלים רגשיים.
+תקבל סיכום פגישה קיים, שנכתב בעברית על סמך רשימות המטפל, ואת השינויים שהמטפל הכניס ברשימות מאז.
+עדכן את הסיכום כך שישקף את השינויים:
+- שלב מידע שנוסף במקום המתאים בסיכום, לפי סדר התחומים הבאים:
+{key_topics}
+- הסר או תקן מידע שהוסר מהרשימות או שונה בהן.
+- השאר את שאר הסיכום כפי שהוא ככל האפשר, באותו סגנון: פסקאות רציפות בעברית, ללא כותרות או נקודות.
+- אל תמציא מידע שאינו מופיע בסיכום הקיים או בשינויים.
+- פרטים מזהים הוחלפו בסימונים כמו [NAME_1], [PHONE_1] או [ADDRESS_1]. העתק כל סימון בדיוק כפי שהוא, בלי לתרגם, לשנות או להשמיט אותו.
+
+**פלט:**
+הסיכום המעודכן המלא בלבד, כטקסט אחד רציף בעברית.
+"""
+
+UPDATE_INPUT_TEMPLATE = "הסיכום הקיים:\n{summary}"
+UPDATE_ADDED_TEMPLATE = "\n\nמשפטים שנוספו או שונו ברשימות:\n{sentences}"
+UPDATE_REMOVED_TEMPLATE = "\n\nמשפטים שהוסרו מהרשימות:\n{sentences}"
+
+# Enhanced Few-Shot Examples for Narrative: (therapist notes, model summary) pairs.
+# Names appear as placeholders, the way scrubbed notes reach the model (see pii_scrubber)
+FEW_SHOT_EXAMPLES = (
+    (
+        """מטופל, גבר כבן 80, אלמן, אב לשניים. מתמודד עם COPD, מונשם כרונית בבית מזה שנתיים. גר כעת בדירה שכורה מונגשת, אמור לעבור בקרוב חזרה לדירתו הקבועה בקומה 3 ללא מעלית. לאחרונה התגלה גידול בערמונית בבירור, הוא עוד לא יודע. הבת גרה קרוב ותומכת עיקרית, הבן השני רחוק ופחות מעורב. סיעודי, זקוק לעזרה מלאה בפעולות יומיום, מקבל עזרה ממטפל זר. המשפחה מיצתה זכויות בביטוח לאומי. מביע מצוקה רגשית גדולה מהניתוק מהסביבה המוכרת ובדידות בדירה השכורה. רוצה מאוד לחזור הביתה למרות הקושי בנגישות בגלל השכנים והקשר למקום. צריך זחליל ליציאה לבדיקות ומעקב רפואי, וגם לנפש ולאיכות חיים. על הבת עומס טיפולי ורגשי גדול כמתכללת הטיפול, מצריך התייחסות. המלצות: סיוע בהגשת בקשה לזחליל ממשרד הבריאות, מפגשי תמיכה והדרכה לבת אחת לחודש להקלה על העומס, מעקב רפואי גידול בערמונית, בחינת שירותים תומכים נוספים בקהילה. התכנית היא לשיפור איכות חייו, מענה לניידות ורווחה נפשית, ותמיכה במשפחה בדגש על הבת.""",
+        """התקיים ביקור בית אצל מטופל בן 80, אלמן ואב לשניים, המתמודד עם מחלת COPD ומונשם כרונית בביתו מזה כשנתיים. המטופל מתגורר כעת בדירה שכורה מונגשת ועתיד לעבור בימים הקרובים חזרה לדירתו הקבועה בקומה שלישית ללא מעלית. לאחרונה התגלה אצלו גידול בערמונית הנמצא בבירור, מידע שטרם נמסר לו. בתו מתגוררת בסמיכות אליו ומהווה את התומכת העיקרית, בעוד בנו השני מתגורר במרחק ופחות מעורב בטיפול היומיומי. המטופל סיעודי וזקוק לעזרה בכל פעולות היומיום, עזרה המסופקת כיום על ידי מטפל זר. המשפחה מיצתה את זכויותיהם בביטוח לאומי.
+המטופל מביע מצוקה רגשית ניכרת בשל הניתוק מסביבתו המוכרת והבדידות החברתית בדירה השכורה. קיים רצון עז מצדו לחזור לביתו הקבוע, למרות אתגרי הנגישות, בשל היכרותו את השכנים והקשר הרגשי למקום. זקוק למכשיר זחליל לצורך יציאה מהבית לבדיקות ומעקב רפואי, וגם כחלק חיוני משמירה על רווחתו הנפשית ואיכות חייו. על הבת מוטל עומס טיפולי ורגשי משמעותי כמתכללת הטיפול באביה, דבר המצריך התייחסות והתערבות תומכת.
+המלצות ההתערבות כוללות: סיוע בהגשת בקשה למכשיר זחליל דרך משרד הבריאות, קביעת מפגשי תמיכה והדרכה לבת המטפלת אחת לחודש לצורך הקלה על העומס הטיפולי והרגשי, מעקב אחר התהליך הרפואי בנוגע לגידול בערמונית, ובחינת שירותים תומכים נוספים בקהילה. תכנית ההתערבות המוצעת מכוונת לשיפור איכות חייו של המטופל תוך מתן מענה לצרכי הניידות והרווחה הנפשית, ובמקביל תמיכה במערך המשפחתי, בדגש על הקלת העומס המוטל על הבת.""",
+    ),
+    (
+        """פגישה עם [NAME_1], בת 32, רווקה. הגיעה עקב תחושות חרדה וקשיי הירדמות שהחמירו לאחר פרידה מבן זוג לפני חודשיים. מתארת דאגנות יתר לגבי העתיד, קושי להתרכז בעבודה (מנהלת חשבונות). בעבר חוותה אפיזודות דומות אך פחות אינטנסיביות. מצפה לקבל כלים לוויסות רגשי ולהפחית את החרדה. קופ"ח כללית. הפגישה התקיימה בזום.""",
+        """[NAME_1], רווקה בת 32, פנתה לטיפול בשל החמרה בתחושות חרדה וקשיי הירדמות, שהתעצמו בעקבות פרידה מבן זוגה לפני כחודשיים. היא מתארת דאגנות יתר לגבי העתיד וקושי בריכוז בעבודתה כמנהלת חשבונות. [NAME_1] מציינת כי חוותה בעבר אפיזודות דומות של חרדה, אך בעוצמה פחותה. ציפיותיה מהטיפול הן לרכוש כלים לוויסות רגשי ולהפחית את רמות החרדה. הפגישה התקיימה באמצעות זום, והיא חברה בקופת חולים כללית.
+במהלך הפגישה, נראה כי [NAME_1] מודעת לקשייה ומביעה מוטיבציה לשינוי. ההתמקדות הראשונית תהיה בהבנת דפוסי החשיבה המעוררים חרדה ובחינת טכניקות הרגעה והתמודדות מיידיות. כמו כן, ייבחנו הגורמים התורמים לקשיי ההירדמות.
+המלצות ראשוניות כוללות תרגול טכניקות נשימה והרפיה, וכן ניהול יומן מחשבות לזיהוי טריגרים לחרדה. בנוסף, נשקלת האפשרות להפניה להערכה פסיכיאטרית במידה והסימפטומים לא יראו שיפור או יחמירו, זאת בהתאם להתקדמות בטיפול.""",
+    ),
+)
+
+
+def build_few_shot_contents(examples) -> tuple:
+    """Turns (notes, summary) pairs into alternating user/model Content turns."""
+    from google.genai import types as genai_types
+
+    contents = []
+    for notes_text, summary_text in examples:
+        contents.append(genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=notes_text)]))
+        contents.append(genai_types.Content(role="model", parts=[genai_types.Part.from_text(text=summary_text)]))
+    return tuple(contents)
+
+
+@dataclass(frozen=True)
+class PromptVariant:
+    """A versioned system prompt plus few-shot turns, prebuilt for reuse on every request."""
+    version: str
+    system_prompt_text: str
+    few_shot_examples: tuple  # (therapist notes, model summary) pairs
+    key_topics: tuple = KEY_TOPICS_TO_COVER
+    sections: tuple = SUMMARY_SECTIONS  # (field name, heading) per key topic
+    fingerprint: str = field(init=False)
+
+    def __post_init__(self):
+        if len(self.sections) != len(self.key_topics):
+            raise ValueError(f"Prompt '{self.version}' needs one section per key topic.")
+        digest = hashlib.sha256(self.system_prompt_text.encode("utf-8"))
+        digest.update(json.dumps(self.few_shot_examples, ensure_ascii=False).encode("utf-8"))
+        object.__setattr__(self, "fingerprint", digest.hexdigest())
+
+    @cached_property
+    def few_shot_contents(self) -> tuple:
+        return build_few_shot_contents(self.few_shot_examples)
+
+    @cached_property
+    def chunk_prompt_text(self) -> str:
+        """System prompt of the map step of long-input mode, built from this variant's key topics."""
+        return CHUNK_PROMPT_TEMPLATE.format(key_topics="\n".join(f"- {topic}" for topic in self.key_topics))
+
+    def build_chunk_contents(self, chunk_text: str, index: int, total: int) -> list:
+        """A single user turn holding one chunk of long notes (no few-shot turns)."""
+        from google.genai import types as genai_types
+
+        text = CHUNK_INPUT_TEMPLATE.format(index=index, total=total, notes=chunk_text)
+        return [genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=text)])]
+
+    def reduce_input_text(self, partial_summaries: list) -> str:
+        """Joins the per-chunk partial summaries into the notes given to the final (reduce) request."""
+        partials = "\n\n".join(f"### חלק {i}\n{partial}" for i, partial in enumerate(partial_summaries, start=1))
+        return REDUCE_INPUT_TEMPLATE.format(total=len(partial_summaries), partials=partials)
+
+    @cached_property
+    def update_prompt_text(self) -> str:
+        """System prompt of edit-aware regeneration, built from this variant's key topics."""
+        return UPDATE_PROMPT_TEMPLATE.format(key_topics=", ".join(self.key_topics))
+
+    def update_input_text(self, previous_summary: str, added: list, removed: list) -> str:
+        """The previous summary plus the changed sentences, as the user turn of an update request."""
+        text = UPDATE_INPUT_TEMPLATE.format(summary=previous_summary)
+        if added:
+            text += UPDATE_ADDED_TEMPLATE.format(sentences="\n".join(f"- {s}" for s in added))
+        if removed:
+            text += UPDATE_REMOVED_TEMPLATE.format(sentences="\n".join(f"- {s}" for s in removed))
+        return text
+
+    @cached_property
+    def structured_prompt_text(self) -> str:
+        """System prompt of structured-output mode, listing the JSON fields and their topics."""
+        fields = "\n".join(f"- {key}: {topic}" for (key, _), topic in zip(self.sections, self.key_topics))
+        return STRUCTURED_PROMPT_TEMPLATE.format(fields=fields)
+
+    @cached_property
+    def response_schema(self) -> dict:
+        """Gemini response schema: an object with one string field per key topic, in topic order."""
+        keys = [key for key, _ in self.sections]
+        return {
+            "type": "OBJECT",
+            "properties": {
+                key: {"type": "STRING", "description": topic} for key, topic in zip(keys, self.key_topics)
+            },
+            "required": keys,
+            "property_ordering": keys,
+        }
+
+    @cached_property
+    def structured_fingerprint(self) -> str:
+        digest = hashlib.sha256(self.structured_prompt_text.encode("utf-8"))
+        digest.update(json.dumps(self.response_schema, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def parse_sections(self, response_text: str) -> list:
+        """
+        Validates a structured-output answer and returns its sections as
+        [{"key", "title", "text"}] in topic order, skipping empty ones. Raises
+        ValueError when the answer is not a JSON object of strings with at
+        least one non-empty known field.
+        """
+        try:
+            data = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Structured answer is not valid JSON: {e}") from None
+        if not isinstance(data, dict):
+            raise ValueError("Structured answer is not a JSON object.")
+        sections = []
+        for key, title in self.sections:
+            text = data.get(key) or ""
+            if not isinstance(text, str):
+                raise ValueError(f"Structured answer field '{key}' is not a string.")
+            if text.strip():
+                sections.append({"key": key, "title": title, "text": text.strip()})
+        if not sections:
+            raise ValueError("Structured answer has no non-empty section.")
+        return sections
+
+    def build_structured_contents(self, user_input_text: str) -> list:
+        """The therapist's notes as the only user turn; the schema replaces the few-shot examples."""
+        from google.genai import types as genai_types
+
+        return [genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=user_input_text)])]
+
+    def build_contents(self, user_input_text: str) -> list:
+        """Few-shot turns followed by the therapist's notes as the final user turn."""
+        from google.genai import types as genai_types
+
+        return [*self.few_shot_contents,
+                genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=user_input_text)])]
+
+
+PROMPT_REGISTRY = {}
+DEFAULT_PROMPT_VERSION = "v1"
+
+
+def register_prompt(variant: PromptVariant) -> PromptVariant:
+    if variant.version in PROMPT_REGISTRY:
+        raise ValueError(f"Prompt version '{variant.version}' is already registered.")
+    PROMPT_REGISTRY[variant.version] = variant
+    return variant
+
+
+def get_prompt(version: str = None) -> PromptVariant:
+    """Returns a registered prompt variant; unknown versions fall back to the default."""
+    return PROMPT_REGISTRY.get(version or DEFAULT_PROMPT_VERSION, PROMPT_REGISTRY[DEFAULT_PROMPT_VERSION])
+
+
+def pick_prompt_version(assignment_key: str, weights: dict) -> str:
+    """
+    Deterministically assigns a key (e.g. a session id) to a prompt version
+    according to weights such as {"v1": 50, "v2": 50}, so a session keeps
+    seeing the same variant across reruns.
+    """
+    weights = {v: w for v, w in weights.items() if v in PROMPT_REGISTRY and w > 0}
+    if not weights:
+        return DEFAULT_PROMPT_VERSION
+    bucket = int(hashlib.sha256(assignment_key.encode("utf-8")).hexdigest(), 16) % sum(weights.values())
+    for version, weight in sorted(weights.items()):
+        if bucket < weight:
+            return version
+        bucket -= weight
+    return DEFAULT_PROMPT_VERSION
+
+
+register_prompt(PromptVariant(
+    version="v1",
+    system_prompt_text=SYSTEM_PROMPT_TEMPLATE.format(key_topics=", ".join(KEY_TOPICS_TO_COVER)),
+    few_shot_examples=FEW_SHOT_EXAMPLES,
+))
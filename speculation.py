@@ -0,0 +1,108 @@
+"""
+Speculative pre-generation of summaries while the therapist is still editing.
+
+Once the notes have been stable for a debounce interval, the caller submits
+them here and a summary is generated in the background. The result lands in
+the regular summary cache, so pressing "generate" on unchanged notes is
+served immediately. Submitting newer notes for the same session cancels the
+stale in-flight request, and every session has a cap on speculative calls so
+API spend stays bounded.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_TRACKED_SESSIONS = 1024
+
+
+class _Speculation:
+    def __init__(self, notes: str, prompt_version: str):
+        self.notes = notes
+        self.prompt_version = prompt_version
+        self.cancel_event = threading.Event()
+        self.future = None
+
+
+class SpeculativeSummaries:
+    """
+    summarize(notes, prompt_version, session_id, cancel_event) -> str runs on a
+    small thread pool, at most one speculation per session at a time.
+    """
+
+    def __init__(self, summarize, max_per_session: int = 5, max_workers: int = 4):
+        self.summarize = summarize
+        self.max_per_session = max_per_session
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative")
+        self._lock = threading.Lock()
+        self._current = {}  # session_id -> _Speculation (latest submitted)
+        self._started = OrderedDict()  # session_id -> speculative calls started, LRU-bounded
+        self.cancelled = 0
+
+    def submit(self, session_id: str, notes: str, prompt_version: str = None) -> bool:
+        """
+        Starts a background summary of notes unless one for the same notes is
+        already running or done, or the session's cap is reached. Returns
+        whether a new speculative call was started.
+        """
+        with self._lock:
+            current = self._current.get(session_id)
+            if current is not None and current.notes == notes and current.prompt_version == prompt_version \
+                    and not current.cancel_event.is_set():
+                return False
+            if self._started.get(session_id, 0) >= self.max_per_session:
+                return False
+            if current is not None and not current.future.done():
+                current.cancel_event.set()
+                self.cancelled += 1
+            speculation = _Speculation(notes, prompt_version)
+            self._current[session_id] = speculation
+            self._started[session_id] = self._started.pop(session_id, 0) + 1
+            while len(self._started) > MAX_TRACKED_SESSIONS:
+                stale_session, _ = self._started.popitem(last=False)
+                self._current.pop(stale_session, None)
+            speculation.future = self._pool.submit(
+                self.summarize, notes, prompt_version, session_id, speculation.cancel_event
+            )
+        return True
+
+    def cancel_stale(self, session_id: str, notes: str = None):
+        """Cancels the session's in-flight speculation unless it is for these notes (None: cancel any)."""
+        with self._lock:
+            current = self._current.get(session_id)
+            if current is None or (notes is not None and current.notes == notes) or current.future.done():
+                return
+            current.cancel_event.set()
+            self.cancelled += 1
+            del self._current[session_id]
+
+    def wait(self, session_id: str, notes: str, prompt_version: str = None, timeout: float = None):
+        """
+        If a speculation for exactly these notes is running or finished, waits for
+        it and returns its summary (None if it failed or was cancelled), so a
+        click on "generate" doesn't pay for the same request twice. Returns None
+        right away when there's nothing to wait for.
+        """
+        with self._lock:
+            current = self._current.get(session_id)
+        if current is None or current.notes != notes or current.prompt_version != prompt_version \
+                or current.cancel_event.is_set():
+            return None
+        try:
+            return current.future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def status(self, session_id: str, notes: str) -> dict:
+        """State of the session's speculation for these notes: idle, running, ready or failed."""
+        with self._lock:
+            current = self._current.get(session_id)
+            state = "idle"
+            if current is not None and current.notes == notes and not current.cancel_event.is_set():
+                if not current.future.done():
+                    state = "running"
+                elif current.future.exception() is None:
+                    state = "ready"
+                else:
+                    state = "failed"
+            started = self._started.get(session_id, 0)
+            return {"state": state, "started": started, "remaining": max(0, self.max_per_session - started)}
@@ -0,0 +1,117 @@
+"""
+Command-line session summarizer, no Streamlit required.
+
+    python -m summarize notes.txt                # writes notes.docx next to the input
+    python -m summarize a.txt b.txt -o out/      # one .docx per file, in out/
+    cat notes.txt | python -m summarize -o summary.docx
+    python -m summarize notes.txt --print        # also print the summary to stdout
+    python -m summarize notes.txt --format pdf --format html   # notes.docx, notes.pdf, notes.html
+    python -m summarize notes.txt --sections     # one template section per key topic
+
+Each input file is one session. The API key is read from GEMINI_API_KEY.
+For files holding many sessions (.csv/.jsonl), use batch.py.
+"""
+import argparse
+import os
+import sys
+import time
+
+from batch import BatchItem, DEFAULT_MAX_WORKERS, iter_batch
+
+
+def output_path_for(input_path: str, output: str, multiple: bool) -> str:
+    if input_path == "-":
+        return output or "summary.docx"
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    if output and (multiple or os.path.isdir(output)):
+        return os.path.join(output, f"{stem}.docx")
+    if output:
+        return output
+    return os.path.splitext(input_path)[0] + ".docx"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m summarize",
+                                     description="Summarize therapy session notes into DOCX files.")
+    parser.add_argument("inputs", nargs="*", default=["-"], help="notes files (one session each); '-' or none for stdin")
+    parser.add_argument("-o", "--output", help="output .docx path, or a directory when given several inputs")
+    parser.add_argument("--template", default=None, help="DOCX template name (default template if omitted)")
+    parser.add_argument("--prompt-version", default=None, help="prompt variant from prompts.PROMPT_REGISTRY")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent Gemini requests")
+    parser.add_argument("--print", action="store_true", dest="print_summary", help="also print summaries to stdout")
+    parser.add_argument("--sections", action="store_true",
+                        help="structured-output mode: one section (and template field) per key topic")
+    parser.add_argument("--format", action="append", dest="formats", choices=["docx", "pdf", "html", "md"],
+                        help="extra output format next to each .docx (repeatable; pdf needs LibreOffice)")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        print("GEMINI_API_KEY is not set.", file=sys.stderr)
+        return 2
+
+    from summary_core import (export_formats, generate_narrative_summary, generate_structured_summary, get_setting,
+                              render_summary_docx)
+
+    extra_formats = [f for f in dict.fromkeys(args.formats or []) if f != "docx"]
+    unavailable = [f for f in extra_formats if f not in export_formats()]
+    if unavailable:
+        print(f"Format(s) not available here: {', '.join(unavailable)} (PDF needs LibreOffice).", file=sys.stderr)
+        return 2
+
+    items = []
+    for path in args.inputs:
+        if path == "-":
+            notes = sys.stdin.read()
+        else:
+            with open(path, encoding="utf-8-sig") as f:
+                notes = f.read()
+        if not notes.strip():
+            print(f"{path}: no notes, skipped.", file=sys.stderr)
+            continue
+        items.append(BatchItem(name=path, notes=notes))
+    if not items:
+        return 1
+
+    multiple = len(items) > 1
+    if multiple and args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    if args.sections:
+        summarize = lambda notes: generate_structured_summary(api_key, notes, prompt_version=args.prompt_version)
+        render = lambda summary: render_summary_docx(summary.narrative, args.template, summary.sections).data
+    else:
+        summarize = lambda notes: generate_narrative_summary(api_key, notes, prompt_version=args.prompt_version)
+        render = lambda summary: render_summary_docx(summary, args.template).data
+
+    started = time.perf_counter()
+    failed = 0
+    for _, result in iter_batch(items, summarize=summarize, render=render, max_workers=args.workers):
+        if not result.ok:
+            failed += 1
+            print(f"{result.item.name}: ERROR {result.error}", file=sys.stderr)
+            continue
+        out_path = output_path_for(result.item.name, args.output, multiple)
+        with open(out_path, "wb") as f:
+            f.write(result.docx)
+        print(f"{result.item.name} -> {out_path} ({result.seconds:.1f}s)", file=sys.stderr)
+        if extra_formats:
+            from exporters import export_document, find_soffice
+
+            stem = os.path.splitext(out_path)[0]
+            for exported in export_document(result.docx, extra_formats, os.path.basename(stem),
+                                             soffice=find_soffice(get_setting("SOFFICE_PATH"))):
+                export_path = os.path.join(os.path.dirname(out_path), exported.filename)
+                with open(export_path, "wb") as f:
+                    f.write(exported.data)
+                print(f"{result.item.name} -> {export_path} ({exported.render_ms:.0f} ms)", file=sys.stderr)
+        if args.print_summary:
+            print((result.summary.narrative if args.sections else result.summary) + "\n")
+
+    if multiple:
+        print(f"{len(items) - failed} ok, {failed} failed, {time.perf_counter() - started:.1f}s total", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1585 @@
+"""
+Summarization and DOCX rendering core, usable without Streamlit.
+
+The Streamlit app, the batch runner and the command line (python -m summarize)
+all call into this module. Heavy dependencies (google-genai, httpx, docxtpl,
+cryptography) are imported on first use, so importing this module is cheap and
+a cache hit never loads the Gemini SDK at all.
+
+Settings are read from registered sources (the app registers st.secrets)
+and fall back to environment variables.
+"""
+import contextvars
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# --- Settings ---
+_settings_sources = []
+
+
+def add_settings_source(source):
+    """
+    Registers a mapping (e.g. st.secrets) consulted before environment variables.
+    Lookups that raise KeyError or FileNotFoundError fall through to the next source.
+    """
+    if not any(existing is source for existing in _settings_sources):
+        _settings_sources.append(source)
+
+
+def get_setting(name: str, default=None):
+    """Reads an optional setting from the registered sources, falling back to environment variables."""
+    for source in _settings_sources:
+        try:
+            return source[name]
+        except (KeyError, FileNotFoundError):
+            continue  # FileNotFoundError: st.secrets without a secrets.toml
+    return os.environ.get(name, default)
+
+
+def get_flag(name: str, default: bool = False) -> bool:
+    value = get_setting(name, default)
+    return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+# --- Process-wide shared resources ---
+_shared_resources = {}
+_shared_resources_lock = threading.Lock()
+
+
+def _shared(kind: str, key, factory):
+    """Creates a resource once per (kind, key) for the whole process, thread-safely."""
+    with _shared_resources_lock:
+        if (kind, key) not in _shared_resources:
+            _shared_resources[(kind, key)] = factory()
+        return _shared_resources[(kind, key)]
+
+
+# --- Shared Gemini Client (process-wide connection pool) ---
+GEMINI_HTTP_LIMITS = dict(
+    max_connections=20,
+    max_keepalive_connections=10,
+    keepalive_expiry=120.0,
+)
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters of HTTP requests made through the shared Gemini client,
+    and whether each request reused a pooled connection or opened a new one.
+    Per-request info lives in context variables, so it is tracked separately
+    per thread and per asyncio task.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = contextvars.ContextVar("gemini_request_connection", default=None)
+        self._last = contextvars.ContextVar("gemini_last_connection", default=None)
+        self.requests = 0
+        self.new_connections = 0
+
+    def on_request(self, request):
+        # httpcore reports connection setup through the "trace" extension;
+        # a request that never reaches "connect_tcp" was served from the pool.
+        current = {"new_connection": False}
+        self._current.set(current)
+
+        def trace(event_name, info):
+            if event_name.startswith("connection.connect_tcp.started"):
+                current["new_connection"] = True
+
+        request.extensions["trace"] = trace
+
+    async def on_request_async(self, request):
+        current = {"new_connection": False}
+        self._current.set(current)
+
+        async def trace(event_name, info):
+            if event_name.startswith("connection.connect_tcp.started"):
+                current["new_connection"] = True
+
+        request.extensions["trace"] = trace
+
+    def on_response(self, response):
+        current = self._current.get() or {"new_connection": False}
+        self._last.set({"connection_reused": not current["new_connection"]})
+        with self._lock:
+            self.requests += 1
+            if current["new_connection"]:
+                self.new_connections += 1
+
+    async def on_response_async(self, response):
+        self.on_response(response)
+
+    def last_request(self) -> dict:
+        """Reuse info for the most recent request made in the calling thread or task."""
+        return dict(self._last.get() or {})
+
+    def set_last_request(self, info: dict):
+        """Hands reuse info gathered in another thread or task to the caller's context."""
+        self._last.set(dict(info) if info else None)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = self.requests - self.new_connections
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_ratio": (reused / self.requests) if self.requests else 0.0,
+            }
+
+
+class PooledGeminiClient:
+    """
+    A genai.Client bound to a keep-alive httpx pool, plus its connection stats.
+    A pre-built client with the same interface (e.g. the local stand-in used by
+    the benchmarks) can be passed in instead.
+    """
+
+    def __init__(self, api_key: str, client=None):
+        self.stats = ConnectionStats()
+        self._context_caches = {}  # (model_name, prompt fingerprint) -> (cache name or None, valid_until)
+        self._context_cache_lock = threading.Lock()
+        if client is not None:
+            self.client = client
+            return
+
+        import httpx
+        from google import genai
+        from google.genai import types as genai_types
+
+        limits = httpx.Limits(**GEMINI_HTTP_LIMITS)
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=genai_types.HttpOptions(
+                client_args={
+                    "limits": limits,
+                    "event_hooks": {
+                        "request": [self.stats.on_request],
+                        "response": [self.stats.on_response],
+                    },
+                },
+                # An explicit transport keeps the async client on httpx (not aiohttp)
+                # so it gets the same pool limits and connection-reuse hooks
+                async_client_args={
+                    "transport": httpx.AsyncHTTPTransport(limits=limits),
+                    "event_hooks": {
+                        "request": [self.stats.on_request_async],
+                        "response": [self.stats.on_response_async],
+                    },
+                },
+            ),
+        )
+
+    @property
+    def models(self):
+        return self.client.models
+
+    @property
+    def aio_models(self):
+        return self.client.aio.models
+
+    def context_cache_name(self, model_name: str, prompt, ttl_seconds: int = 3600):
+        """
+        Returns the name of a Gemini context cache holding the prompt's system
+        instruction and few-shot turns, (re)creating it when missing or about to
+        expire. Returns None when the cache can't be created, e.g. when the prompt
+        is below the model's minimum cacheable size; that result is remembered
+        for a few minutes so requests don't retry on every click.
+        """
+        from google.genai import types as genai_types
+
+        key = (model_name, prompt.fingerprint)
+        now = time.time()
+        with self._context_cache_lock:
+            name, valid_until = self._context_caches.get(key, (None, 0))
+            if valid_until > now:
+                return name
+            try:
+                cached = self.client.caches.create(
+                    model=model_name,
+                    config=genai_types.CreateCachedContentConfig(
+                        display_name=f"therapist-helper-prompt-{prompt.version}",
+                        system_instruction=prompt.system_prompt_text,
+                        contents=list(prompt.few_shot_contents),
+                        ttl=f"{ttl_seconds}s",
+                    ),
+                )
+                name, valid_until = cached.name, now + ttl_seconds - 60
+            except Exception:
+                name, valid_until = None, now + 300
+            self._context_caches[key] = (name, valid_until)
+            return name
+
+
+def get_gemini_client(api_key: str) -> PooledGeminiClient:
+    """
+    Returns one pooled Gemini client per API key for the whole process.
+    Construction is guarded by a lock, and httpx.Client itself is safe to
+    share between threads.
+    """
+    return _shared("gemini_client", api_key, lambda: PooledGeminiClient(api_key))
+
+
+def install_gemini_client(api_key: str, client) -> PooledGeminiClient:
+    """Makes get_gemini_client(api_key) return the given client, e.g. a local stand-in for benchmarks."""
+    pooled = PooledGeminiClient(api_key, client=client)
+    with _shared_resources_lock:
+        _shared_resources[("gemini_client", api_key)] = pooled
+    return pooled
+
+# --- Summary Cache (content-addressed, LRU/TTL, optional encrypted disk tier) ---
+def normalize_notes(text: str) -> str:
+    """Normalizes notes so whitespace-only edits map to the same cache entry."""
+    text = unicodedata.normalize("NFC", text)
+    lines = [" ".join(line.split()) for line in text.strip().splitlines()]
+    return "\n".join(line for line in lines if line)
+
+
+def summary_cache_key(user_input_text: str, prompt_fingerprint: str, model_name: str, temperature: float) -> str:
+    """
+    SHA-256 over everything that determines the model's answer. The prompt
+    fingerprint already covers the system prompt text and few-shot contents.
+    """
+    digest = hashlib.sha256()
+    for part in (normalize_notes(user_input_text), prompt_fingerprint, model_name, repr(float(temperature))):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    Thread-safe in-memory LRU cache of summaries, bounded by entry count, total
+    bytes and TTL. When disk_dir and encryption_key are set, entries are also
+    written to disk encrypted with Fernet so they survive restarts. With a
+    shared broker (broker.py) and encryption_key, the encrypted entries are
+    also shared with every other process using that broker.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024,
+                 ttl_seconds: float = 6 * 3600, disk_dir: str = None, encryption_key: str = None,
+                 shared=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (text, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+        self._fernet = None
+        self.disk_dir = None
+        self.shared = None
+        if encryption_key and (disk_dir or shared is not None):
+            from cryptography.fernet import Fernet  # only needed for the disk and shared tiers
+            self._fernet = Fernet(encryption_key)
+            self.shared = shared
+        if disk_dir and encryption_key:
+            self.disk_dir = disk_dir
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._local.last_hit = True
+                return entry[0]
+            if entry:
+                self._evict(key)
+
+        text = self._disk_get(key)
+        from_shared = False
+        if text is None:
+            text = self._shared_get(key)
+            from_shared = text is not None
+        with self._lock:
+            if text is not None:
+                if from_shared:
+                    self.shared_hits += 1
+                else:
+                    self.disk_hits += 1
+                self._local.last_hit = True
+                self._insert(key, text, now)
+            else:
+                self.misses += 1
+                self._local.last_hit = False
+        return text
+
+    def put(self, key: str, text: str):
+        with self._lock:
+            self._insert(key, text, time.time())
+        self._disk_put(key, text)
+        self._shared_put(key, text)
+
+    def last_lookup_was_hit(self) -> bool:
+        """Whether the most recent get() on the calling thread was served from cache."""
+        return getattr(self._local, "last_hit", False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "hit_ratio": ((self.hits + self.disk_hits + self.shared_hits) / lookups) if lookups else 0.0,
+            }
+
+    def _insert(self, key, text, now):
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (text, now + self.ttl_seconds, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.bin")
+
+    def _disk_get(self, key):
+        if self.disk_dir is None:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                token = f.read()
+            # Fernet tokens carry their creation time, so the TTL is enforced on decrypt
+            return self._fernet.decrypt(token, ttl=int(self.ttl_seconds)).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Expired, corrupted or encrypted with another key: drop it
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+            return None
+
+    def _disk_put(self, key, text):
+        if self.disk_dir is None:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(self._fernet.encrypt(text.encode("utf-8")))
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best-effort; the in-memory entry is already stored
+            pass
+
+    def _shared_get(self, key):
+        if self.shared is None:
+            return None
+        try:
+            token = self.shared.cache_get(key)
+            return self._fernet.decrypt(token, ttl=int(self.ttl_seconds)).decode("utf-8") if token else None
+        except Exception:
+            # Broker unreachable, expired, or encrypted with another key: a miss
+            return None
+
+    def _shared_put(self, key, text):
+        if self.shared is None:
+            return
+        try:
+            self.shared.cache_put(key, self._fernet.encrypt(text.encode("utf-8")), self.ttl_seconds)
+        except Exception:
+            # Best-effort, like the disk tier
+            pass
+
+
+def get_summary_cache() -> SummaryCache:
+    """
+    One summary cache per process. Limits are read from secrets (or environment):
+    SUMMARY_CACHE_MAX_ENTRIES, SUMMARY_CACHE_MAX_MB, SUMMARY_CACHE_TTL_SECONDS,
+    and for the encrypted disk tier SUMMARY_CACHE_DIR + SUMMARY_CACHE_KEY
+    (a Fernet key, e.g. from Fernet.generate_key()). With JOB_BROKER_URL and
+    SUMMARY_CACHE_KEY, entries are also shared through the broker.
+    """
+    broker = get_broker()  # resolved outside the factory: _shared() isn't reentrant
+    return _shared("summary_cache", None, lambda: SummaryCache(
+        max_entries=int(get_setting("SUMMARY_CACHE_MAX_ENTRIES", 256)),
+        max_bytes=int(float(get_setting("SUMMARY_CACHE_MAX_MB", 16)) * 1024 * 1024),
+        ttl_seconds=float(get_setting("SUMMARY_CACHE_TTL_SECONDS", 6 * 3600)),
+        disk_dir=get_setting("SUMMARY_CACHE_DIR"),
+        encryption_key=get_setting("SUMMARY_CACHE_KEY"),
+        shared=broker,
+    ))
+
+
+def get_broker():
+    """
+    The broker.SqliteBroker / RedisBroker for JOB_BROKER_URL, or None when the
+    app runs as a single process. Jobs and shared cache entries are encrypted
+    with JOB_STORE_KEY (or SUMMARY_CACHE_KEY), which is required.
+    """
+    url = get_setting("JOB_BROKER_URL")
+    if not url:
+        return None
+    from broker import open_broker
+
+    return _shared("broker", url, lambda: open_broker(
+        url, encryption_key=get_setting("JOB_STORE_KEY") or get_setting("SUMMARY_CACHE_KEY"),
+    ))
+
+
+# --- Gemini API Function (Revised for Narrative Summary) ---
+# Using the model name from your latest snippet
+GEMINI_MODEL_NAME = "gemini-2.5-flash-preview-05-20"
+GEMINI_FALLBACK_MODEL_NAME = "gemini-2.5-flash"  # backup for hedged and failed-over requests
+GEMINI_TEMPERATURE = 0.6
+GEMINI_EXPECTED_OUTPUT_TOKENS = 1024
+LONG_NOTES_CHUNK_TEMPERATURE = 0.2  # the map step extracts facts; keep it close to the notes
+
+
+def get_gemini_scheduler(api_key: str):
+    """
+    One request scheduler per API key (quotas are per key) for the whole process.
+    Limits come from secrets/environment: GEMINI_RPM, GEMINI_TPM,
+    GEMINI_MAX_CONCURRENCY and GEMINI_MAX_RETRIES. With JOB_BROKER_URL the
+    RPM/TPM buckets live in the broker, so they hold across all processes;
+    GEMINI_MAX_CONCURRENCY stays per process.
+    """
+    from gemini_scheduler import GeminiScheduler
+
+    broker = get_broker()
+    rpm = float(get_setting("GEMINI_RPM", 60))
+    tpm = float(get_setting("GEMINI_TPM", 250_000))
+    shared_buckets = {}
+    if broker is not None:
+        from broker import bucket_name
+
+        shared_buckets = dict(request_bucket=broker.token_bucket(bucket_name("rpm", api_key), rpm),
+                              token_bucket=broker.token_bucket(bucket_name("tpm", api_key), tpm))
+    return _shared("gemini_scheduler", api_key, lambda: GeminiScheduler(
+        requests_per_minute=rpm,
+        tokens_per_minute=tpm,
+        max_concurrency=int(get_setting("GEMINI_MAX_CONCURRENCY", 8)),
+        max_retries=int(get_setting("GEMINI_MAX_RETRIES", 4)),
+        **shared_buckets,
+    ))
+
+
+def get_telemetry():
+    """
+    The process-wide telemetry sink, configured once from secrets/environment:
+    TELEMETRY_LOG_PATH (rotating JSONL log, "" disables; default logs/telemetry.jsonl),
+    METRICS_PORT (serves /metrics on 127.0.0.1 when set) and the USD prices per
+    million tokens GEMINI_PRICE_INPUT_PER_M, GEMINI_PRICE_CACHED_PER_M and
+    GEMINI_PRICE_OUTPUT_PER_M.
+    """
+    import telemetry
+
+    def configure():
+        prices = {}
+        for price_type in ("input", "cached", "output"):
+            value = get_setting(f"GEMINI_PRICE_{price_type.upper()}_PER_M")
+            if value is not None:
+                prices[price_type] = float(value)
+        telemetry.TELEMETRY.configure(
+            log_path=get_setting("TELEMETRY_LOG_PATH", os.path.join("logs", "telemetry.jsonl")),
+            metrics_port=get_setting("METRICS_PORT"),
+            prices=prices,
+        )
+        return telemetry.TELEMETRY
+
+    return _shared("telemetry", None, configure)
+
+
+class EmptySummaryError(RuntimeError):
+    """Gemini answered, but with no text."""
+
+
+def rough_token_estimate(prompt, user_input_text: str) -> int:
+    """Cheap upper-bound guess of a request's tokens, used to admit it through the TPM bucket."""
+    prompt_chars = len(prompt.system_prompt_text) + sum(
+        len(notes) + len(summary) for notes, summary in prompt.few_shot_examples
+    )
+    return (prompt_chars + len(user_input_text)) // 3 + GEMINI_EXPECTED_OUTPUT_TOKENS
+
+
+def get_token_estimator():
+    """One calibrated TokenEstimator per process."""
+    from token_estimator import TokenEstimator
+
+    return _shared("token_estimator", None, lambda: TokenEstimator(expected_output_tokens=GEMINI_EXPECTED_OUTPUT_TOKENS))
+
+
+def fixed_prompt_tokens(api_key: str, prompt, model_name: str = GEMINI_MODEL_NAME, exact_only: bool = False):
+    """
+    Tokens of the prompt variant's system prompt and few-shot turns, counted
+    with Gemini's count_tokens once per process. Never blocks: the count runs
+    in the background, and until it is known the local estimate is returned
+    (or None with exact_only).
+    """
+    def count_exact():
+        from google.genai import types as genai_types
+
+        # count_tokens doesn't take a system instruction, so it is counted as a leading user turn
+        contents = [genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=prompt.system_prompt_text)]),
+                    *prompt.few_shot_contents]
+        return get_gemini_client(api_key).models.count_tokens(model=model_name, contents=contents).total_tokens
+
+    fallback_text = "\n".join([prompt.system_prompt_text, *(n + "\n" + s for n, s in prompt.few_shot_examples)])
+    return get_token_estimator().fixed_tokens((model_name, prompt.fingerprint), count_exact, fallback_text,
+                                              wait=False, exact_only=exact_only)
+
+
+def trim_notes(user_input_text: str, max_tokens: int) -> str:
+    """
+    Shortens notes to about max_tokens, keeping the opening (background,
+    reason for referral) and the end (assessment, plan) and cutting the
+    middle at sentence boundaries.
+    """
+    estimator = get_token_estimator()
+    keep_chars = estimator.chars_for_tokens(user_input_text, max_tokens)
+    if keep_chars >= len(user_input_text):
+        return user_input_text
+    from chunking import split_notes
+
+    sentences = split_notes(user_input_text, max(200, keep_chars // 20))
+    head, tail = [], []
+    head_budget, tail_budget = keep_chars * 2 // 3, keep_chars // 3
+    for sentence in sentences:
+        if len(sentence) > head_budget:
+            break
+        head.append(sentence)
+        head_budget -= len(sentence)
+    for sentence in reversed(sentences[len(head):]):
+        if len(sentence) > tail_budget:
+            break
+        tail.insert(0, sentence)
+        tail_budget -= len(sentence)
+    return "\n".join(head) + "\n[...]\n" + "\n".join(tail)
+
+
+@dataclass
+class RequestPlan:
+    """How a summary request will be sent, with its estimated tokens, cost and latency."""
+    mode: str  # "single", "chunked" or "trimmed"
+    notes_tokens: int
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+    seconds: float
+    notes: str  # the notes as they will be sent ("trimmed" mode shortens them)
+    chunks: list = field(default_factory=list)
+
+
+def plan_request(api_key: str, user_input_text: str, prompt_version: str = None) -> RequestPlan:
+    """
+    Estimates a request locally before anything is sent. Notes above
+    NOTES_TOKEN_BUDGET tokens (default 2000) are split into LONG_NOTES_CHUNK_CHARS
+    chunks for map-reduce summarization, or cut down to the budget when
+    LONG_NOTES_MODE is "trim"; LONG_NOTES_MODE = "off" always sends them whole.
+    It never waits on count_tokens, so it costs nothing on the request path
+    (see fixed_prompt_tokens()).
+    """
+    from prompts import get_prompt
+
+    prompt = get_prompt(prompt_version)
+    estimator = get_token_estimator()
+    fixed_tokens = fixed_prompt_tokens(api_key, prompt)
+    notes_tokens = estimator.estimate(user_input_text)
+    output_tokens = estimator.expected_output_tokens
+    budget = int(get_setting("NOTES_TOKEN_BUDGET", 2000))
+    mode = str(get_setting("LONG_NOTES_MODE", "auto")).strip().lower()
+
+    plan = RequestPlan(mode="single", notes_tokens=notes_tokens, input_tokens=fixed_tokens + notes_tokens,
+                       output_tokens=round(output_tokens), cost_usd=0.0,
+                       seconds=estimator.estimate_seconds(), notes=user_input_text)
+    if notes_tokens > budget and mode == "trim":
+        plan.mode = "trimmed"
+        plan.notes = trim_notes(user_input_text, budget)
+        plan.input_tokens = fixed_tokens + estimator.estimate(plan.notes)
+    elif notes_tokens > budget and mode != "off":
+        from chunking import split_notes
+
+        chunks = split_notes(user_input_text, int(get_setting("LONG_NOTES_CHUNK_CHARS", 3000)))
+        if len(chunks) > 1:
+            # Map: every chunk with the chunk prompt; reduce: the fixed prompt plus one partial per chunk
+            chunk_prompt_tokens = estimator.estimate(prompt.chunk_prompt_text)
+            partial_tokens = min(output_tokens, notes_tokens / len(chunks))
+            plan.mode = "chunked"
+            plan.chunks = chunks
+            plan.input_tokens = (len(chunks) * chunk_prompt_tokens + notes_tokens
+                                 + fixed_tokens + round(partial_tokens * len(chunks)))
+            plan.output_tokens = round(partial_tokens * len(chunks) + output_tokens)
+            plan.seconds = estimator.estimate_seconds(partial_tokens) + estimator.estimate_seconds()
+    plan.cost_usd = get_telemetry().cost_usd(prompt_tokens=plan.input_tokens, output_tokens=plan.output_tokens)
+    return plan
+
+
+class GeminiCall:
+    """Text, usage and scheduler timestamps of one request made through _call_gemini()."""
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name
+        self.routing = {}  # set by _call_routed: primary model, hedged, failed_over
+        self.text = ""
+        self.usage = None
+        self.connection_info = {}
+        self.attempts = 0
+        self.submitted = time.perf_counter()
+        self.dispatched = None
+        self.first_token = None
+        self.finished = None
+
+    def add_spans(self, request_trace, prefix: str = ""):
+        # queue_wait: scheduler admission; model_response: first attempt to last byte, retries included
+        dispatched = self.dispatched or self.submitted
+        request_trace.add_span(f"{prefix}queue_wait", (dispatched - self.submitted) * 1000)
+        if self.first_token is not None:
+            request_trace.add_span(f"{prefix}time_to_first_token", (self.first_token - dispatched) * 1000)
+        request_trace.add_span(f"{prefix}model_response", ((self.finished or dispatched) - dispatched) * 1000)
+
+
+def _call_gemini(api_key: str, client, model_name: str, contents, config, session_id: str,
+                 estimated_tokens: int, on_chunk=None, on_wait=None, cancel_event=None) -> GeminiCall:
+    """Sends one generate request through the shared scheduler, streaming to on_chunk if given."""
+    call = GeminiCall(model_name)
+
+    async def request(emit):
+        call.attempts += 1
+        if call.dispatched is None:
+            call.dispatched = time.perf_counter()
+        text = ""
+        usage = None
+        if on_chunk is not None:
+            # Streaming: hand every partial result to the caller as it arrives
+            async for chunk in await client.aio_models.generate_content_stream(
+                model=model_name,
+                contents=contents,
+                config=config
+            ):
+                if chunk.text:
+                    if call.first_token is None:
+                        call.first_token = time.perf_counter()
+                    text += chunk.text
+                    emit(text)
+                usage = chunk.usage_metadata or usage
+        else:
+            # Use the correct method for the Google Generative AI SDK
+            response = await client.aio_models.generate_content(
+                model=model_name,
+                contents=contents,
+                config=config
+            )
+            usage = response.usage_metadata
+
+            # Extract text from response
+            if hasattr(response, 'text') and response.text:
+                text = response.text
+            elif hasattr(response, 'candidates') and response.candidates:
+                # Handle response with candidates
+                candidate = response.candidates[0]
+                if hasattr(candidate, 'content') and candidate.content.parts:
+                    text = candidate.content.parts[0].text or ""
+        call.finished = time.perf_counter()
+
+        connection_info = client.stats.last_request()
+        return (text, connection_info, usage), getattr(usage, "total_token_count", None)
+
+    # All Gemini traffic goes through the shared scheduler (rate limits, retries, fair queueing)
+    call.text, call.connection_info, call.usage = get_gemini_scheduler(api_key).call(
+        session_id or "anonymous",
+        request,
+        estimated_tokens=estimated_tokens,
+        on_chunk=on_chunk,
+        on_wait=on_wait,
+        cancel_event=cancel_event,
+    )
+    client.stats.set_last_request(call.connection_info)
+    return call
+
+
+def get_model_router():
+    """
+    The process-wide model router. GEMINI_LIGHT_MODEL (unset by default) takes
+    notes up to ROUTER_LIGHT_MAX_TOKENS (default 400); GEMINI_FALLBACK_MODEL
+    (default gemini-2.5-flash, "" to disable) backs up the main model for hedged
+    and failed-over requests. GEMINI_HEDGE_AFTER_SECONDS (default 20) is the
+    hedge delay until a model's p95 time to first output is known.
+    """
+    from model_router import ModelRouter
+
+    return _shared("model_router", None, lambda: ModelRouter(
+        strong_model=GEMINI_MODEL_NAME,
+        light_model=get_setting("GEMINI_LIGHT_MODEL") or None,
+        fallback_model=get_setting("GEMINI_FALLBACK_MODEL", GEMINI_FALLBACK_MODEL_NAME) or None,
+        light_max_tokens=int(get_setting("ROUTER_LIGHT_MAX_TOKENS", 400)),
+        default_hedge_seconds=float(get_setting("GEMINI_HEDGE_AFTER_SECONDS", 20)),
+    ))
+
+
+def _record_model_result(router, call: GeminiCall, ok: bool):
+    dispatched = call.dispatched or call.submitted
+    finished = call.finished or time.perf_counter()
+    first_output = (call.first_token or finished) - dispatched
+    router.record(call.model_name, ok, finished - dispatched, first_output)
+
+
+def _routed_model(user_input_text: str) -> str:
+    """
+    The model the router sends these notes to now. Answers are cached under the
+    model that wrote them, so lookups use this one.
+    """
+    return get_model_router().route(get_token_estimator().estimate(user_input_text))[0]
+
+
+def _call_routed(api_key: str, client, notes_tokens: int, build, session_id: str, estimated_tokens: int,
+                 on_chunk=None, on_wait=None, cancel_event=None) -> GeminiCall:
+    """
+    Sends a request to the model the router picks for notes of this size;
+    build(model_name) returns its (contents, config). If a streamed request's
+    primary model has produced no output after its hedge delay (GEMINI_HEDGING,
+    on by default), the request is also sent to the backup model: the first to
+    produce output wins and the other is cancelled. Non-streamed requests (map
+    steps, structured output, batches) routinely run past the delay, so they
+    are never hedged. A failed or empty answer from one model fails over to the
+    other; the error raised when both fail lists them in models_tried.
+    Callbacks run on the calling thread.
+    """
+    import queue
+    from gemini_scheduler import RequestCancelledError
+
+    router = get_model_router()
+    primary, backup = router.route(notes_tokens)
+    events = queue.Queue()
+    cancel_events = {}
+
+    def attempt(model_name):
+        call = None
+        started = time.perf_counter()
+        try:
+            contents, config = build(model_name)
+            call = _call_gemini(
+                api_key, client, model_name, contents, config, session_id, estimated_tokens,
+                on_chunk=(lambda text: events.put(("chunk", model_name, text))) if on_chunk is not None else None,
+                on_wait=lambda *position: events.put(("wait", model_name, position)),
+                cancel_event=cancel_events[model_name],
+            )
+        except RequestCancelledError as e:
+            events.put(("cancelled", model_name, e))
+            return
+        except Exception as e:
+            router.record(model_name, False, time.perf_counter() - started)
+            events.put(("error", model_name, e))
+            return
+        _record_model_result(router, call, ok=bool(call.text.strip()))
+        if call.text.strip():
+            events.put(("done", model_name, call))
+        else:
+            events.put(("error", model_name, EmptySummaryError(f"{model_name} returned an empty response.")))
+
+    def start(model_name):
+        cancel_events[model_name] = threading.Event()
+        threading.Thread(target=attempt, args=(model_name,), name=f"gemini-{model_name}", daemon=True).start()
+
+    def cancel_others(winner):
+        for model_name, event in cancel_events.items():
+            if model_name != winner:
+                event.set()
+
+    start(primary)
+    hedge_at = None
+    if backup and on_chunk is not None and get_flag("GEMINI_HEDGING", True):
+        # Time spent in our own queue isn't the model being slow, so it doesn't count toward the delay
+        queue_wait = get_gemini_scheduler(api_key).stats()["estimated_wait_seconds"]
+        hedge_at = time.perf_counter() + queue_wait + router.hedge_after(primary)
+    running, errors, committed, hedged = {primary}, [], None, False
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            cancel_others(None)
+            raise RequestCancelledError("Gemini request was cancelled.")
+        timeout = 0.25
+        if hedge_at is not None and committed is None and backup not in cancel_events:
+            timeout = max(0.0, min(timeout, hedge_at - time.perf_counter()))
+        try:
+            kind, model_name, value = events.get(timeout=timeout)
+        except queue.Empty:
+            if hedge_at is not None and committed is None and backup not in cancel_events \
+                    and time.perf_counter() >= hedge_at:
+                start(backup)
+                running.add(backup)
+                hedged = True
+            continue
+
+        if kind == "wait":
+            if on_wait is not None and model_name == primary and committed is None:
+                on_wait(*value)
+        elif kind == "chunk":
+            if committed is None:
+                committed = model_name
+                cancel_others(model_name)
+            if model_name == committed:
+                on_chunk(value)
+        elif kind == "done":
+            if committed in (None, model_name):
+                cancel_others(model_name)
+                value.routing = {"primary_model": primary, "hedged": hedged, "failed_over": bool(errors)}
+                return value
+        else:  # "error" or "cancelled"
+            running.discard(model_name)
+            if kind == "error":
+                errors.append(value)
+            if committed == model_name:
+                committed = None
+            if not running:
+                if backup and backup not in cancel_events:
+                    start(backup)
+                    running.add(backup)
+                    continue
+                error = errors[0] if errors else value
+                error.models_tried = list(cancel_events)
+                raise error
+
+
+def _summary_request(client, prompt, model_name: str, temperature: float, user_input_text: str):
+    """contents and config of a narrative-summary request for the given prompt variant."""
+    import telemetry
+    from google.genai import types as genai_types
+
+    # With context caching the fixed system prompt and few-shot turns live on
+    # Gemini's side, so each request sends (and is billed for) only the notes
+    cached_content = None
+    if get_flag("GEMINI_CONTEXT_CACHING"):
+        with telemetry.span("context_cache"):
+            cached_content = client.context_cache_name(model_name, prompt)
+
+    if cached_content:
+        contents = prompt.build_contents(user_input_text)[-1:]
+        config = genai_types.GenerateContentConfig(
+            temperature=temperature,
+            cached_content=cached_content,
+            response_mime_type="text/plain"
+        )
+    else:
+        contents = prompt.build_contents(user_input_text)
+        config = genai_types.GenerateContentConfig(
+            temperature=temperature,
+            system_instruction=prompt.system_prompt_text,
+            response_mime_type="text/plain"
+        )
+    return contents, config
+
+
+def _calibrate_estimator(api_key: str, prompt, notes: str, call: GeminiCall):
+    """Feeds a finished request's real prompt tokens and timings back into the token estimator."""
+    estimator = get_token_estimator()
+    prompt_tokens = getattr(call.usage, "prompt_token_count", None)
+    # Calibrating against an estimated fixed part would only teach the estimator its own guess
+    fixed_tokens = fixed_prompt_tokens(api_key, prompt, exact_only=True) if prompt_tokens else None
+    if fixed_tokens is not None:
+        estimator.observe(notes, prompt_tokens - fixed_tokens)
+    if call.first_token is not None and call.dispatched is not None:
+        estimator.observe_latency(
+            time_to_first_token_seconds=call.first_token - call.dispatched,
+            output_tokens=getattr(call.usage, "candidates_token_count", None),
+            generation_seconds=(call.finished or call.first_token) - call.first_token,
+        )
+
+
+def _sum_usage(calls) -> dict:
+    import telemetry
+
+    totals = {}
+    for call in calls:
+        for name, count in telemetry.usage_fields(call.usage).items():
+            totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def _summarize_chunks(api_key: str, client, prompt, notes_tokens: int, chunks: list, session_id: str,
+                      on_wait, cancel_event, request_trace) -> tuple:
+    """
+    Map step of long-input mode: condenses every chunk into topic-organized
+    partial notes, concurrently. Each chunk is routed like the whole request
+    (notes_tokens), with the same hedging and failover. Partials are cached
+    per chunk and model, so editing or extending long notes only re-sends the
+    chunks that changed.
+    Returns (partial summaries in chunk order, GeminiCalls made).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from google.genai import types as genai_types
+
+    summary_cache = get_summary_cache()
+    chunk_fingerprint = hashlib.sha256(prompt.chunk_prompt_text.encode("utf-8")).hexdigest()
+    config = genai_types.GenerateContentConfig(
+        temperature=LONG_NOTES_CHUNK_TEMPERATURE,
+        system_instruction=prompt.chunk_prompt_text,
+        response_mime_type="text/plain"
+    )
+    model_name = get_model_router().route(notes_tokens)[0]
+
+    def summarize_chunk(index: int):
+        cached = summary_cache.get(summary_cache_key(chunks[index], chunk_fingerprint, model_name,
+                                                     LONG_NOTES_CHUNK_TEMPERATURE))
+        if cached is not None:
+            return cached, None
+        contents = prompt.build_chunk_contents(chunks[index], index + 1, len(chunks))
+        try:
+            call = _call_routed(
+                api_key, client, notes_tokens, lambda routed_model: (contents, config), session_id,
+                estimated_tokens=(len(prompt.chunk_prompt_text) + len(chunks[index])) // 3
+                + GEMINI_EXPECTED_OUTPUT_TOKENS,
+                on_wait=on_wait if index == 0 else None,
+                cancel_event=cancel_event,
+            )
+        except EmptySummaryError:
+            return "", None  # both models answered empty; the reduce step works with the other partials
+        partial = call.text.strip()
+        summary_cache.put(summary_cache_key(chunks[index], chunk_fingerprint, call.model_name,
+                                            LONG_NOTES_CHUNK_TEMPERATURE), partial)
+        return partial, call
+
+    max_workers = max(1, min(len(chunks), int(get_setting("LONG_NOTES_MAX_PARALLEL", 6))))
+    with request_trace.span("map"):
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chunk") as pool:
+            results = list(pool.map(summarize_chunk, range(len(chunks))))
+
+    calls = [call for _, call in results if call is not None]
+    for call in calls:
+        call.add_spans(request_trace, prefix="map_")
+    request_trace.set(chunks=len(chunks), chunks_from_cache=len(chunks) - len(calls))
+    return [partial for partial, _ in results if partial], calls
+
+
+def new_pii_scrubber():
+    """
+    A pii_scrubber.Scrubber for one request, or None when PII_SCRUBBING is
+    turned off (it is on by default). PII_EXTRA_NAMES adds comma-separated
+    names (e.g. surnames) to the built-in first-name dictionary, and
+    PII_TITLED_WORD_NAMES replaces names that are also everyday words only
+    after a title or before one of those names.
+    """
+    if not get_flag("PII_SCRUBBING", True):
+        return None
+    from pii_scrubber import Scrubber, parse_name_list
+
+    return Scrubber(parse_name_list(get_setting("PII_EXTRA_NAMES")),
+                    titled_word_names=get_flag("PII_TITLED_WORD_NAMES"))
+
+
+def _restoring_on_chunk(scrubber, on_chunk):
+    """Wraps a streaming callback so partial answers are shown with the original identifiers."""
+    if on_chunk is None:
+        return None
+    return lambda text: on_chunk(scrubber.restore(text, partial=True))
+
+
+def generate_narrative_summary(api_key: str, user_input_text: str, on_chunk=None,
+                               prompt_version: str = None, session_id: str = None, on_wait=None,
+                               cancel_event=None) -> str:
+    """
+    Processes natural language patient session notes using Gemini API and
+    returns a flowing narrative summary in Hebrew, without any UI side effects:
+    returns the summary text, raises EmptySummaryError on an empty answer and
+    lets API errors propagate. Safe to call from worker threads.
+    The request is queued on the shared GeminiScheduler under session_id;
+    while it waits, on_wait is called with (requests ahead, estimated wait seconds).
+    Setting cancel_event (a threading.Event) abandons the request with
+    gemini_scheduler.RequestCancelledError.
+    Long notes (see plan_request) are summarized map-reduce style: chunks
+    are condensed in parallel, then one request writes the narrative from the
+    condensed notes, so latency stays roughly flat as the notes grow.
+    Identifiers in the notes are replaced with placeholders before anything
+    is sent or cached, and restored in the returned (and streamed) summary;
+    see new_pii_scrubber.
+    Stage timings and token usage are recorded on the active telemetry trace
+    (a new one if the caller didn't open one).
+    """
+    import telemetry
+    from prompts import get_prompt
+
+    get_telemetry()
+    with telemetry.trace("summary", session_id=session_id, notes_chars=len(user_input_text),
+                         streaming=on_chunk is not None) as request_trace:
+        temperature = GEMINI_TEMPERATURE
+        scrubber = new_pii_scrubber()
+        if scrubber is not None:
+            with request_trace.span("pii_scrub"):
+                user_input_text = scrubber.scrub(user_input_text)
+            request_trace.set(pii_replaced=scrubber.replaced)
+            on_chunk = _restoring_on_chunk(scrubber, on_chunk)
+        restore = scrubber.restore if scrubber is not None else (lambda text: text)
+
+        with request_trace.span("prompt_build"):
+            prompt = get_prompt(prompt_version)
+        model_name = _routed_model(user_input_text)
+        request_trace.set(model=model_name, prompt_version=prompt.version)
+
+        with request_trace.span("cache_lookup"):
+            summary_cache = get_summary_cache()
+            cache_key = summary_cache_key(user_input_text, prompt.fingerprint, model_name, temperature)
+            cached_summary = summary_cache.get(cache_key)
+        request_trace.set(cache_hit=cached_summary is not None)
+        if cached_summary is not None:
+            if on_chunk is not None:
+                on_chunk(cached_summary)
+            request_trace.set(summary_chars=len(cached_summary))
+            return restore(cached_summary)
+
+        with request_trace.span("client_setup"):
+            client = get_gemini_client(api_key)
+
+        with request_trace.span("estimate"):
+            plan = plan_request(api_key, user_input_text, prompt.version)
+        request_trace.set(plan_mode=plan.mode, estimated_input_tokens=plan.input_tokens,
+                          estimated_cost_usd=round(plan.cost_usd, 8))
+
+        calls = []
+        narrative_input = plan.notes
+        chunks = plan.chunks
+        if chunks:
+            partials, calls = _summarize_chunks(api_key, client, prompt, plan.notes_tokens, chunks,
+                                                session_id, on_wait, cancel_event, request_trace)
+            if not partials:
+                raise EmptySummaryError("Gemini returned empty partial summaries for every chunk.")
+            narrative_input = prompt.reduce_input_text(partials)
+            on_wait = None  # the reduce request is queued only after the map step
+
+        call = _call_routed(
+            api_key, client, plan.notes_tokens,
+            lambda routed_model: _summary_request(client, prompt, routed_model, temperature, narrative_input),
+            session_id, estimated_tokens=rough_token_estimate(prompt, narrative_input),
+            on_chunk=on_chunk, on_wait=on_wait, cancel_event=cancel_event,
+        )
+        calls.append(call)
+        call.add_spans(request_trace, prefix="reduce_" if chunks else "")
+        _calibrate_estimator(api_key, prompt, narrative_input, call)
+        full_response_text = call.text
+        request_trace.set(attempts=sum(c.attempts for c in calls), summary_chars=len(full_response_text.strip()),
+                          model=call.model_name, **call.routing, **_sum_usage(calls), **call.connection_info)
+
+        if not full_response_text.strip():
+            raise EmptySummaryError("Gemini returned an empty response.")
+
+        # Keyed by the model that actually answered: a light or fallback answer isn't the main model's
+        summary_cache.put(summary_cache_key(user_input_text, prompt.fingerprint, call.model_name, temperature),
+                          full_response_text.strip())
+        return restore(full_response_text.strip())
+
+
+def generate_updated_summary(api_key: str, previous_notes: str, previous_summary: str, user_input_text: str,
+                             on_chunk=None, prompt_version: str = None, session_id: str = None,
+                             on_wait=None, cancel_event=None) -> str:
+    """
+    Edit-aware regeneration: when the notes differ from previous_notes by a small
+    edit, sends only the changed sentences plus previous_summary and asks for
+    the revised narrative, skipping the few-shot turns and the unchanged notes.
+    Falls back to generate_narrative_summary when there is no previous summary,
+    nothing changed, or more than EDIT_MODE_MAX_CHANGE_RATIO (default 0.3) of
+    the notes changed. Same errors and callbacks as generate_narrative_summary.
+    """
+    import telemetry
+    from notes_diff import diff_notes
+    from prompts import get_prompt
+
+    delta = diff_notes(previous_notes or "", user_input_text)
+    if not previous_summary or delta.empty or \
+            delta.changed_ratio > float(get_setting("EDIT_MODE_MAX_CHANGE_RATIO", 0.3)):
+        with telemetry.trace("summary", update_mode="full", changed_ratio=round(delta.changed_ratio, 3)):
+            return generate_narrative_summary(api_key, user_input_text, on_chunk=on_chunk,
+                                              prompt_version=prompt_version, session_id=session_id,
+                                              on_wait=on_wait, cancel_event=cancel_event)
+
+    get_telemetry()
+    with telemetry.trace("summary", session_id=session_id, notes_chars=len(user_input_text),
+                         streaming=on_chunk is not None, update_mode="incremental",
+                         changed_ratio=round(delta.changed_ratio, 3)) as request_trace:
+        temperature = GEMINI_TEMPERATURE
+        added, removed = delta.added, delta.removed
+        scrubber = new_pii_scrubber()
+        if scrubber is not None:
+            # One mapping for the summary and both sides of the diff, so a name keeps its placeholder
+            with request_trace.span("pii_scrub"):
+                previous_summary = scrubber.scrub(previous_summary)
+                added = [scrubber.scrub(sentence) for sentence in added]
+                removed = [scrubber.scrub(sentence) for sentence in removed]
+            request_trace.set(pii_replaced=scrubber.replaced)
+            on_chunk = _restoring_on_chunk(scrubber, on_chunk)
+        restore = scrubber.restore if scrubber is not None else (lambda text: text)
+
+        with request_trace.span("prompt_build"):
+            prompt = get_prompt(prompt_version)
+            update_text = prompt.update_input_text(previous_summary, added, removed)
+        model_name = _routed_model(user_input_text)
+        request_trace.set(model=model_name, prompt_version=prompt.version)
+
+        with request_trace.span("cache_lookup"):
+            summary_cache = get_summary_cache()
+            update_fingerprint = hashlib.sha256(prompt.update_prompt_text.encode("utf-8")).hexdigest()
+            cache_key = summary_cache_key(update_text, update_fingerprint, model_name, temperature)
+            cached_summary = summary_cache.get(cache_key)
+        request_trace.set(cache_hit=cached_summary is not None)
+        if cached_summary is not None:
+            if on_chunk is not None:
+                on_chunk(cached_summary)
+            return restore(cached_summary)
+
+        with request_trace.span("client_setup"):
+            from google.genai import types as genai_types
+
+            client = get_gemini_client(api_key)
+        contents = [genai_types.Content(role="user", parts=[genai_types.Part.from_text(text=update_text)])]
+        config = genai_types.GenerateContentConfig(
+            temperature=temperature,
+            system_instruction=prompt.update_prompt_text,
+            response_mime_type="text/plain"
+        )
+        call = _call_routed(
+            api_key, client, get_token_estimator().estimate(user_input_text), lambda routed_model: (contents, config),
+            session_id,
+            estimated_tokens=(len(prompt.update_prompt_text) + len(update_text)) // 3 + GEMINI_EXPECTED_OUTPUT_TOKENS,
+            on_chunk=on_chunk, on_wait=on_wait, cancel_event=cancel_event,
+        )
+        call.add_spans(request_trace)
+        full_response_text = call.text
+        request_trace.set(attempts=call.attempts, summary_chars=len(full_response_text.strip()),
+                          model=call.model_name, **call.routing, **_sum_usage([call]), **call.connection_info)
+
+        if not full_response_text.strip():
+            raise EmptySummaryError("Gemini returned an empty response.")
+
+        summary_cache.put(summary_cache_key(update_text, update_fingerprint, call.model_name, temperature),
+                          full_response_text.strip())
+        return restore(full_response_text.strip())
+
+
+@dataclass
+class StructuredSummary:
+    """A summary split into per-topic sections, plus the same text as one narrative."""
+    narrative: str
+    sections: list = field(default_factory=list)  # [{"key", "title", "text"}]; empty after a fallback
+
+
+def _structured_request(prompt, temperature: float, user_input_text: str):
+    """contents and config of a structured-output request (JSON object with one field per key topic)."""
+    from google.genai import types as genai_types
+
+    config = genai_types.GenerateContentConfig(
+        temperature=temperature,
+        system_instruction=prompt.structured_prompt_text,
+        response_mime_type="application/json",
+        response_schema=prompt.response_schema,
+    )
+    return prompt.build_structured_contents(user_input_text), config
+
+
+def generate_structured_summary(api_key: str, user_input_text: str, on_chunk=None,
+                                prompt_version: str = None, session_id: str = None, on_wait=None,
+                                cancel_event=None) -> StructuredSummary:
+    """
+    Structured-output mode: one request returns a JSON object with a paragraph
+    per key topic (see prompts.PromptVariant.response_schema), so templates can
+    place every section in its own placeholder. The answer is validated with
+    PromptVariant.parse_sections; an invalid one falls back to
+    generate_narrative_summary, returning a StructuredSummary without sections.
+    The JSON itself is not streamed: on_chunk is called once with the
+    finished narrative. Otherwise the same errors, callbacks, scrubbing,
+    caching and long-notes handling as generate_narrative_summary.
+    """
+    import telemetry
+    from prompts import get_prompt
+
+    original_notes, original_on_chunk = user_input_text, on_chunk
+    get_telemetry()
+    with telemetry.trace("summary", session_id=session_id, notes_chars=len(user_input_text),
+                         streaming=False, output_mode="structured") as request_trace:
+        temperature = GEMINI_TEMPERATURE
+        scrubber = new_pii_scrubber()
+        if scrubber is not None:
+            with request_trace.span("pii_scrub"):
+                user_input_text = scrubber.scrub(user_input_text)
+            request_trace.set(pii_replaced=scrubber.replaced)
+        restore = scrubber.restore if scrubber is not None else (lambda text: text)
+
+        with request_trace.span("prompt_build"):
+            prompt = get_prompt(prompt_version)
+        model_name = _routed_model(user_input_text)
+        request_trace.set(model=model_name, prompt_version=prompt.version)
+
+        def finish(sections: list) -> StructuredSummary:
+            for section in sections:
+                section["text"] = restore(section["text"])
+            summary = StructuredSummary("\n".join(section["text"] for section in sections), sections)
+            if on_chunk is not None:
+                on_chunk(summary.narrative)
+            request_trace.set(summary_chars=len(summary.narrative), sections=len(sections))
+            return summary
+
+        with request_trace.span("cache_lookup"):
+            summary_cache = get_summary_cache()
+            cache_key = summary_cache_key(user_input_text, prompt.structured_fingerprint, model_name, temperature)
+            cached_answer = summary_cache.get(cache_key)
+        request_trace.set(cache_hit=cached_answer is not None)
+        if cached_answer is not None:
+            return finish(prompt.parse_sections(cached_answer))
+
+        with request_trace.span("client_setup"):
+            client = get_gemini_client(api_key)
+
+        with request_trace.span("estimate"):
+            plan = plan_request(api_key, user_input_text, prompt.version)
+        request_trace.set(plan_mode=plan.mode, estimated_input_tokens=plan.input_tokens,
+                          estimated_cost_usd=round(plan.cost_usd, 8))
+
+        calls = []
+        structured_input = plan.notes
+        if plan.chunks:
+            partials, calls = _summarize_chunks(api_key, client, prompt, plan.notes_tokens, plan.chunks,
+                                                session_id, on_wait, cancel_event, request_trace)
+            if not partials:
+                raise EmptySummaryError("Gemini returned empty partial summaries for every chunk.")
+            structured_input = prompt.reduce_input_text(partials)
+            on_wait = None  # the reduce request is queued only after the map step
+
+        call = _call_routed(
+            api_key, client, plan.notes_tokens,
+            lambda routed_model: _structured_request(prompt, temperature, structured_input),
+            session_id,
+            estimated_tokens=(len(prompt.structured_prompt_text) + len(structured_input)) // 3
+            + GEMINI_EXPECTED_OUTPUT_TOKENS,
+            on_wait=on_wait, cancel_event=cancel_event,
+        )
+        calls.append(call)
+        call.add_spans(request_trace, prefix="reduce_" if plan.chunks else "")
+        request_trace.set(attempts=sum(c.attempts for c in calls), model=call.model_name, **call.routing,
+                          **_sum_usage(calls), **call.connection_info)
+
+        with request_trace.span("parse"):
+            try:
+                sections = prompt.parse_sections(call.text)
+            except ValueError as e:
+                sections = None
+                request_trace.set(structured_fallback=True, structured_error=str(e)[:200])
+        if sections is None:
+            # The request (and its cost) is spent; the narrative request is the reliable path
+            return StructuredSummary(generate_narrative_summary(
+                api_key, original_notes, on_chunk=original_on_chunk, prompt_version=prompt_version,
+                session_id=session_id, on_wait=on_wait, cancel_event=cancel_event,
+            ))
+
+        summary_cache.put(summary_cache_key(user_input_text, prompt.structured_fingerprint, call.model_name,
+                                            temperature), call.text)
+        return finish(sections)
+
+
+def get_speculative_summaries(api_key: str):
+    """
+    One speculative.SpeculativeSummaries per API key. Speculative requests are
+    queued under "<session id>:speculative" so they never hold up the session's
+    own requests; SPECULATIVE_MAX_PER_SESSION (default 5) caps them per session.
+    """
+    import telemetry
+    from speculation import SpeculativeSummaries
+
+    def summarize(notes, prompt_version, session_id, cancel_event):
+        with telemetry.trace("speculative"):
+            return generate_narrative_summary(api_key, notes, prompt_version=prompt_version,
+                                              session_id=f"{session_id}:speculative", cancel_event=cancel_event)
+
+    return _shared("speculative_summaries", api_key, lambda: SpeculativeSummaries(
+        summarize, max_per_session=int(get_setting("SPECULATIVE_MAX_PER_SESSION", 5)),
+    ))
+
+
+# --- Background Jobs ---
+def run_summary_job(api_key: str, payload: dict, on_progress=None) -> tuple:
+    """
+    Job handler: summarizes payload["notes"] (per section with payload["structured"],
+    else revising payload["previous_summary"] for small edits when given) and
+    renders it in payload["formats"] (default DOCX). With payload["archive_tags"]
+    (a list, possibly empty) the result is also archived. Returns (result,
+    download bytes: the file itself or a ZIP of formats).
+    """
+    import telemetry
+    from exporters import bundle
+
+    notes = payload["notes"]
+    sections = None
+    resolve_shared_template(payload.get("template_name"))
+    with telemetry.trace("job", session_id=payload.get("session_id"), template=payload.get("template_name")) as job_trace:
+        if payload.get("structured"):
+            structured = generate_structured_summary(api_key, notes, on_chunk=on_progress,
+                                                     prompt_version=payload.get("prompt_version"),
+                                                     session_id=payload.get("session_id"))
+            summary, sections = structured.narrative, structured.sections
+        elif payload.get("previous_summary"):
+            summary = generate_updated_summary(api_key, payload.get("previous_notes"), payload["previous_summary"],
+                                               notes, on_chunk=on_progress, prompt_version=payload.get("prompt_version"),
+                                               session_id=payload.get("session_id"))
+        else:
+            summary = generate_narrative_summary(api_key, notes, on_chunk=on_progress,
+                                                 prompt_version=payload.get("prompt_version"),
+                                                 session_id=payload.get("session_id"))
+        base_name = summary_basename(notes)
+        with job_trace.span("export"):
+            rendered, files = render_summary_exports(summary, payload.get("template_name"), payload.get("formats"),
+                                                     base_name, sections)
+        for exported in files:
+            job_trace.add_span(f"export_{exported.format}", exported.render_ms)
+        data, filename, mime = bundle(files, base_name)
+        archive_id = None
+        if payload.get("archive_tags") is not None:
+            with job_trace.span("archive"):
+                archive_id = archive_summary(summary, notes, data, filename, mime, payload["archive_tags"])
+    result = {
+        "summary": summary,
+        "notes": payload["notes"],  # what was summarized; the payload itself is dropped once the job finishes
+        "sections": sections or [],
+        "filename": filename,
+        "mime": mime,
+        "template_name": rendered.template_name,
+        "render_ms": rendered.render_ms,
+        "export_ms": {exported.format: exported.render_ms for exported in files},
+        "update_mode": job_trace.attributes.get("update_mode"),
+        "archive_id": archive_id,
+        "seconds": job_trace.duration_ms / 1000,
+    }
+    return result, data
+
+
+def get_job_queue(api_key: str, workers: int = None):
+    """
+    One background job queue per API key. JOB_WORKERS (default 4) worker threads;
+    jobs are kept on disk at JOB_STORE_PATH (default data/jobs.sqlite3), encrypted
+    with JOB_STORE_KEY (or SUMMARY_CACHE_KEY), and resumed after a restart. Without
+    a key the store lives in memory. Finished jobs are kept JOB_RETENTION_SECONDS.
+
+    With JOB_BROKER_URL the queue lives in the broker and is shared by every
+    process: JOB_WORKERS then defaults to 0 (the Streamlit app only submits),
+    and worker processes (python -m worker) pass their own thread count.
+    """
+    from jobs import JobQueue, JobStore
+
+    broker = get_broker()
+
+    def create():
+        if broker is not None:
+            store = broker.job_store()
+        else:
+            store = JobStore(
+                path=get_setting("JOB_STORE_PATH", os.path.join("data", "jobs.sqlite3")),
+                encryption_key=get_setting("JOB_STORE_KEY") or get_setting("SUMMARY_CACHE_KEY"),
+            )
+        return JobQueue(
+            store,
+            handlers={"summary": lambda payload, on_progress: run_summary_job(api_key, payload, on_progress)},
+            workers=workers if workers is not None else int(get_setting("JOB_WORKERS", 0 if broker else 4)),
+            retention_seconds=float(get_setting("JOB_RETENTION_SECONDS", 24 * 3600)),
+            exclusive=broker is None,
+            lease_seconds=float(get_setting("JOB_LEASE_SECONDS", 60)),
+        )
+
+    return _shared("job_queue", api_key, create)
+
+
+# --- Download Artifacts ---
+def get_artifact_store():
+    """
+    The process-wide artifact_store.ArtifactStore for rendered downloads. Artifacts
+    are written encrypted to ARTIFACT_STORE_DIR (default data/artifacts) with
+    ARTIFACT_STORE_KEY (or SUMMARY_CACHE_KEY), or kept in memory without a key;
+    they expire ARTIFACT_TTL_SECONDS (default 3600) after last use, and a session
+    may hold at most ARTIFACT_SESSION_MAX_MB (default 20). Live bytes are exported
+    as the therapist_helper_artifact_bytes gauge.
+    """
+    from artifact_store import ArtifactStore
+
+    metrics = get_telemetry().metrics  # resolved outside create(): _shared() isn't reentrant
+
+    def create():
+        store = ArtifactStore(
+            directory=get_setting("ARTIFACT_STORE_DIR", os.path.join("data", "artifacts")),
+            encryption_key=get_setting("ARTIFACT_STORE_KEY") or get_setting("SUMMARY_CACHE_KEY"),
+            ttl_seconds=float(get_setting("ARTIFACT_TTL_SECONDS", 3600)),
+            session_max_bytes=int(float(get_setting("ARTIFACT_SESSION_MAX_MB", 20)) * 1024 * 1024),
+        )
+        metrics.describe("therapist_helper_artifact_bytes", "gauge", "Bytes of rendered downloads currently stored.")
+        metrics.gauge("therapist_helper_artifact_bytes", store.live_bytes)
+        return store
+
+    return _shared("artifact_store", None, create)
+
+
+# --- Summary Archive ---
+def get_summary_archive():
+    """
+    The process-wide archive.SummaryArchive, or None unless SUMMARY_ARCHIVE is
+    enabled. Summaries and their downloads are kept encrypted at
+    ARCHIVE_PATH (default data/archive.sqlite3) with ARCHIVE_KEY (or
+    SUMMARY_CACHE_KEY); without a key the archive lasts only while the
+    server runs.
+    """
+    if not get_flag("SUMMARY_ARCHIVE"):
+        return None
+    from archive import SummaryArchive
+
+    return _shared("summary_archive", None, lambda: SummaryArchive(
+        path=get_setting("ARCHIVE_PATH", os.path.join("data", "archive.sqlite3")),
+        encryption_key=get_setting("ARCHIVE_KEY") or get_setting("SUMMARY_CACHE_KEY"),
+    ))
+
+
+def archive_summary(summary: str, notes: str, download: bytes, filename: str, mime: str, tags=()):
+    """Keeps a generated summary and its download in the archive; returns the entry id (None if disabled)."""
+    archive = get_summary_archive()
+    if archive is None:
+        return None
+    title = " ".join(notes.split()[:8])
+    return archive.add(summary, download, filename=filename, mime=mime, title=title, tags=tags)
+
+
+def get_transcriber():
+    """
+    The process-wide transcription.Transcriber for dictated notes, or None
+    when faster-whisper isn't installed or DICTATION is turned off. The model
+    (TRANSCRIPTION_MODEL) is loaded on first use and runs on the CPU.
+    """
+    from transcription import DEFAULT_MODEL, Transcriber, transcription_available
+
+    if not transcription_available() or not get_flag("DICTATION", True):
+        return None
+    model_name = get_setting("TRANSCRIPTION_MODEL", DEFAULT_MODEL)
+    return _shared("transcriber", model_name, lambda: Transcriber(
+        model_name=model_name,
+        compute_type=get_setting("TRANSCRIPTION_COMPUTE_TYPE", "int8"),
+        cpu_threads=int(get_setting("TRANSCRIPTION_THREADS", 0)),
+        beam_size=int(get_setting("TRANSCRIPTION_BEAM_SIZE", 1)),
+    ))
+
+
+# --- Shared Templates ---
+_published_templates = {}  # name -> (path, mtime_ns, size) last published by this process
+
+
+def publish_templates():
+    """
+    With a broker, publishes every registered DOCX template whose file changed
+    since the last call, so worker processes render with the same files.
+    Cheap to call on every page run: unchanged files are only stat()ed.
+    """
+    broker = get_broker()
+    if broker is None:
+        return
+    from docx_templates import TEMPLATE_ENGINE
+
+    for name in TEMPLATE_ENGINE.names():
+        path = TEMPLATE_ENGINE.path(name)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            continue
+        version = (path, stat_result.st_mtime_ns, stat_result.st_size)
+        if _published_templates.get(name) == version:
+            continue
+        with open(path, "rb") as f:
+            broker.put_template(name, f.read())
+        _published_templates[name] = version
+
+
+def resolve_shared_template(name: str = None):
+    """
+    In a worker, makes the template published under name (default template if
+    None) available locally: it is written once per content hash to
+    TEMPLATE_CACHE_DIR (default data/templates) and registered under its
+    name, after which the template engine's parse cache applies as usual.
+    Without a broker, or for a template nobody published, nothing changes.
+    """
+    broker = get_broker()
+    if broker is None:
+        return
+    from docx_templates import DEFAULT_TEMPLATE_NAME, TEMPLATE_ENGINE
+
+    name = name or DEFAULT_TEMPLATE_NAME
+    content_hash = broker.template_hash(name)
+    if content_hash is None:
+        return
+    path = os.path.join(get_setting("TEMPLATE_CACHE_DIR", os.path.join("data", "templates")), f"{content_hash}.docx")
+    if not os.path.exists(path):
+        data = broker.get_template(name)
+        if data is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    TEMPLATE_ENGINE.register(name, path)
+
+
+# --- DOCX Rendering ---
+def render_summary_docx(narrative_summary: str, template_name: str = None, sections: list = None):
+    """
+    Renders the summary into a DOCX template (the default template if None)
+    and returns a docx_templates.RenderedDocument. With sections from
+    structured-output mode, templates also get a "sections" list (key, title,
+    text) and every section text under its own field name, e.g. {{assessment}}.
+    """
+    from docx_templates import TEMPLATE_ENGINE, DEFAULT_TEMPLATE_NAME
+
+    context = {
+        "narrative_summary": narrative_summary, # Ensure this matches the placeholder in your docx
+        "sections": sections or [],
+    }
+    context.update({section["key"]: section["text"] for section in sections or []})
+    return TEMPLATE_ENGINE.render(context, name=template_name or DEFAULT_TEMPLATE_NAME)
+
+
+def summary_basename(notes: str) -> str:
+    """Download name (without extension) for a summary, built from the first words of the notes."""
+    first_words = " ".join(notes.split()[:3]).replace('"', '').replace("'", "")
+    return f"סיכום_פגישה_{first_words.replace(' ', '_')}" if first_words else "סיכום_פגישה"
+
+
+def docx_filename(notes: str) -> str:
+    return summary_basename(notes) + ".docx"
+
+
+# --- Export Formats ---
+def export_formats() -> list:
+    """Formats the summary can be exported to here; PDF needs LibreOffice (SOFFICE_PATH or on PATH)."""
+    from exporters import available_formats, find_soffice
+
+    return available_formats(find_soffice(get_setting("SOFFICE_PATH")))
+
+
+def render_summary_exports(narrative_summary: str, template_name: str, formats: list, base_name: str,
+                           sections: list = None) -> tuple:
+    """
+    Renders the summary DOCX (with structured-output sections, if given) and
+    converts it to the other requested formats concurrently.
+    Returns (docx_templates.RenderedDocument, [exporters.ExportedFile]).
+    """
+    from exporters import export_document, find_soffice
+
+    rendered = render_summary_docx(narrative_summary, template_name, sections)
+    files = export_document(
+        rendered.data, formats or ["docx"], base_name, soffice=find_soffice(get_setting("SOFFICE_PATH")),
+        docx_render_ms=rendered.render_ms,
+    )
+    return rendered, files
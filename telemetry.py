@@ -0,0 +1,327 @@
+"""
+Per-request timing spans, token usage and cost, without any note content.
+
+A trace covers one summary request. Code inside it opens spans around each
+stage; when the outermost trace ends it is recorded into process-wide
+Prometheus-style metrics and, when a log path is configured, appended as one
+line to a rotating JSONL log:
+
+    with telemetry.trace("ui_generate", session_id=session_id) as request_trace:
+        with telemetry.span("docx_render"):
+            ...
+
+Nested trace() calls join the active trace, so the app, the batch runner and
+summary_core can all instrument the same request. Only ids, timings, lengths,
+token counts, cost and error types are recorded.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import uuid
+
+# Gemini 2.5 Flash list prices, USD per million tokens (override via settings)
+DEFAULT_PRICES_PER_MILLION = {
+    "input": 0.30,
+    "cached": 0.075,
+    "output": 2.50,
+}
+
+STAGE_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class RequestTrace:
+    """Timing spans and attributes of a single request."""
+
+    def __init__(self, kind: str, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []  # (name, duration_ms) in completion order
+        self.attributes = {"outcome": "ok"}
+        self.attributes.update(attributes)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_span(self, name: str, duration_ms: float):
+        self.spans.append((name, float(duration_ms)))
+
+    @contextlib.contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, (time.perf_counter() - started) * 1000)
+
+    def span_ms(self, name: str) -> float:
+        """Total time spent in spans with this name."""
+        return sum(ms for span_name, ms in self.spans if span_name == name)
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self.started) * 1000
+
+    def to_record(self) -> dict:
+        return {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.timestamp)),
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "duration_ms": round(self.duration_ms or 0.0, 2),
+            "spans": {name: round(self.span_ms(name), 2) for name, _ in self.spans},
+            **self.attributes,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=STAGE_BUCKETS_SECONDS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._gauges = {}  # (name, labels) -> callable read when rendering
+        self._help = {}
+
+    def describe(self, name: str, kind: str, help_text: str):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def gauge(self, name: str, read, **labels):
+        """Registers read() as the current value of a gauge, evaluated on every scrape."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = read
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render_prometheus(self) -> str:
+        def label_text(labels, extra=()):
+            pairs = [f'{k}="{v}"' for k, v in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+
+        lines, described = [], set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{label_text(labels)} {value:g}")
+        for (name, labels), read in gauges:
+            header(name)
+            lines.append(f"{name}{label_text(labels)} {read():g}")
+        for (name, labels), series in histograms:
+            header(name)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{name}_bucket{label_text(labels, (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{name}_bucket{label_text(labels, (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{name}_sum{label_text(labels)} {series[-2]:.6f}")
+            lines.append(f"{name}_count{label_text(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def usage_fields(usage) -> dict:
+    """Token counts from a Gemini usage_metadata object (missing counts are 0)."""
+    if usage is None:
+        return {}
+    output_tokens = (getattr(usage, "candidates_token_count", None) or 0) + \
+        (getattr(usage, "thoughts_token_count", None) or 0)  # thinking tokens are billed as output
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", None) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+        "output_tokens": output_tokens,
+    }
+
+
+class Telemetry:
+    """Process-wide sink for finished traces: metrics, JSONL log and cost accounting."""
+
+    def __init__(self):
+        self.metrics = MetricsRegistry()
+        self.prices = dict(DEFAULT_PRICES_PER_MILLION)
+        self._logger = None
+        self._server = None
+        self.metrics.describe("therapist_helper_stage_duration_seconds", "histogram",
+                              "Time spent in each stage of a summary request.")
+        self.metrics.describe("therapist_helper_request_duration_seconds", "histogram",
+                              "End-to-end time of a summary request.")
+        self.metrics.describe("therapist_helper_requests_total", "counter",
+                              "Summary requests by kind and outcome.")
+        self.metrics.describe("therapist_helper_tokens_total", "counter",
+                              "Gemini tokens by type (prompt, cached, output).")
+        self.metrics.describe("therapist_helper_cost_usd_total", "counter",
+                              "Estimated Gemini cost in USD.")
+        self.metrics.describe("therapist_helper_transcription_real_time_factor", "histogram",
+                              "Transcription time per second of dictated audio.")
+        self.metrics.describe("therapist_helper_transcribed_audio_seconds_total", "counter",
+                              "Seconds of dictated audio transcribed.")
+
+    def configure(self, log_path: str = None, log_max_bytes: int = 5 * 1024 * 1024, log_backups: int = 5,
+                  metrics_port: int = None, prices: dict = None):
+        if prices:
+            self.prices.update(prices)
+        if log_path and self._logger is None:
+            os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=log_max_bytes, backupCount=log_backups, encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"therapist_helper.telemetry.{id(self)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            self._logger = logger
+        if metrics_port and self._server is None:
+            self._server = start_metrics_server(self.metrics, int(metrics_port))
+
+    def cost_usd(self, prompt_tokens: int = 0, cached_tokens: int = 0, output_tokens: int = 0) -> float:
+        uncached = max(0, prompt_tokens - cached_tokens)
+        return (uncached * self.prices["input"]
+                + cached_tokens * self.prices["cached"]
+                + output_tokens * self.prices["output"]) / 1_000_000
+
+    def record(self, request_trace: RequestTrace):
+        request_trace.finish()
+        attributes = request_trace.attributes
+        if "prompt_tokens" in attributes and "cost_usd" not in attributes:
+            attributes["cost_usd"] = round(self.cost_usd(
+                attributes.get("prompt_tokens", 0), attributes.get("cached_tokens", 0),
+                attributes.get("output_tokens", 0),
+            ), 8)
+
+        metrics = self.metrics
+        metrics.inc("therapist_helper_requests_total", kind=request_trace.kind, outcome=attributes["outcome"])
+        metrics.observe("therapist_helper_request_duration_seconds", request_trace.duration_ms / 1000,
+                        kind=request_trace.kind)
+        for name, duration_ms in request_trace.spans:
+            metrics.observe("therapist_helper_stage_duration_seconds", duration_ms / 1000, stage=name)
+        for token_type in ("prompt", "cached", "output"):
+            if attributes.get(f"{token_type}_tokens"):
+                metrics.inc("therapist_helper_tokens_total", attributes[f"{token_type}_tokens"], type=token_type)
+        if attributes.get("cost_usd"):
+            metrics.inc("therapist_helper_cost_usd_total", attributes["cost_usd"])
+        if attributes.get("real_time_factor") is not None:
+            metrics.observe("therapist_helper_transcription_real_time_factor", attributes["real_time_factor"])
+            metrics.inc("therapist_helper_transcribed_audio_seconds_total", attributes["audio_seconds"])
+
+        if self._logger is not None:
+            self._logger.info(json.dumps(request_trace.to_record(), ensure_ascii=False, default=str))
+
+
+def start_metrics_server(metrics: MetricsRegistry, port: int, host: str = "127.0.0.1"):
+    """Serves GET /metrics in the Prometheus text format from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes are not worth a stderr line each
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError:
+        return None  # port taken, e.g. by another app process already serving metrics
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+TELEMETRY = Telemetry()
+_current_trace = contextvars.ContextVar("therapist_helper_trace", default=None)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_trace(kind: str, **attributes) -> RequestTrace:
+    """
+    Makes a new trace the active one in the calling thread or task, for code
+    that can't wrap the request in a with-block (e.g. a Streamlit script that
+    may st.stop() midway). Pair with end_trace().
+    """
+    request_trace = RequestTrace(kind, **attributes)
+    _current_trace.set(request_trace)
+    return request_trace
+
+
+def end_trace(request_trace: RequestTrace, **attributes):
+    """Deactivates and records a trace from start_trace(); later calls are no-ops."""
+    if request_trace.duration_ms is not None:
+        return
+    request_trace.set(**attributes)
+    if _current_trace.get() is request_trace:
+        _current_trace.set(None)
+    TELEMETRY.record(request_trace)
+
+
+@contextlib.contextmanager
+def trace(kind: str, **attributes):
+    """
+    Opens a request trace, or joins the active one (adding the attributes to it).
+    Only the outermost trace is recorded; an exception escaping any level marks
+    the trace with outcome "error" and the exception type.
+    """
+    existing = _current_trace.get()
+    request_trace = existing or RequestTrace(kind)
+    request_trace.set(**attributes)
+    token = None if existing else _current_trace.set(request_trace)
+    try:
+        yield request_trace
+    except Exception as e:
+        request_trace.set(outcome="error", error_type=type(e).__name__)
+        raise
+    finally:
+        if token is not None:
+            _current_trace.reset(token)
+            TELEMETRY.record(request_trace)
+
+
+@contextlib.contextmanager
+def span(name: str):
+    """Times a stage of the active trace; a no-op outside of a trace."""
+    request_trace = _current_trace.get()
+    if request_trace is None:
+        yield
+        return
+    with request_trace.span(name):
+        yield
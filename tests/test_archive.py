@@ -0,0 +1,95 @@
+import sqlite3
+
+import pytest
+from cryptography.fernet import Fernet
+
+from archive import SummaryArchive, parse_tags, word_forms
+
+
+@pytest.fixture
+def open_archive(tmp_path):
+    path, key = str(tmp_path / "archive.sqlite3"), Fernet.generate_key().decode("ascii")
+    return lambda: SummaryArchive(path, key)
+
+
+@pytest.fixture
+def archive(open_archive):
+    archive = open_archive()
+    archive.add("פגישה עם דנה על חרדה בעבודה.", b"docx-1", "dana.docx", title="דנה", tags=["חרדה"],
+                session_date="2026-01-10")
+    archive.add("המטופל סיפר ולדנה הוא כתב מכתב. קשיי שינה.", None, title="יוסי", tags=["שינה", "חרדה"],
+                session_date="2026-02-01")
+    archive.add("Follow-up on SLEEP hygiene, עם נִקּוּד: שֵׁינָה", None, tags=["שינה"], session_date="2026-03-05")
+    return archive
+
+
+def titles(entries):
+    return [entry.title for entry in entries]
+
+
+def test_word_forms_strip_up_to_two_prefix_letters():
+    assert word_forms("ולדנה") == ["ולדנה", "לדנה", "דנה"]
+    assert word_forms("בית") == ["בית"]  # the stem would be too short
+    assert word_forms("סיפר") == ["סיפר"]
+
+
+def test_search_matches_prefixed_words_both_ways(archive):
+    assert sorted(titles(archive.search("דנה"))) == ["דנה", "יוסי"]  # "ולדנה" matches "דנה"
+    assert sorted(titles(archive.search("ודנה"))) == ["דנה", "יוסי"]  # and the query's own prefix is stripped
+
+
+def test_every_query_word_must_match(archive):
+    assert titles(archive.search("דנה חרדה")) == ["דנה"]
+    assert archive.search("דנה מכתב שינה")[0].title == "יוסי"
+    assert archive.search("דנה כלב") == []
+
+
+def test_search_ignores_case_and_niqqud(archive):
+    assert titles(archive.search("sleep")) == [""]
+    assert sorted(titles(archive.search("שינה"))) == ["", "יוסי"]  # "שֵׁינָה" matches without its niqqud
+    assert titles(archive.search("נקוד")) == [""]
+
+
+def test_tags_and_dates_filter(archive):
+    assert sorted(titles(archive.search(tags=["חרדה"]))) == ["דנה", "יוסי"]
+    assert titles(archive.search(tags=["חרדה", "שינה"])) == ["יוסי"]
+    assert titles(archive.search(date_from="2026-02-01", date_to="2026-02-28")) == ["יוסי"]
+    assert titles(archive.search(date_from="2026-02-01")) == ["", "יוסי"]  # newest first without a query
+    assert archive.tags() == ["חרדה", "שינה"]
+
+
+def test_excerpt_starts_near_the_match(archive):
+    entry = archive.add("הקדמה " * 60 + "המטופלת תיארה פחד גבהים.", title="ארוך")
+    excerpt = archive.search("גבהים")[0].excerpt
+    assert excerpt.startswith("…") and "גבהים" in excerpt
+    assert archive.get(entry).summary.endswith("פחד גבהים.")
+
+
+def test_index_and_rows_hold_no_plain_words(archive):
+    db = sqlite3.connect(archive.path)
+    terms = " ".join(row[0] for row in db.execute("SELECT terms FROM summaries_index"))
+    assert "דנה" not in terms and "sleep" not in terms
+    summaries = b"".join(row[0] for row in db.execute("SELECT summary FROM summaries"))
+    assert "דנה".encode("utf-8") not in summaries
+
+
+def test_archive_reopens_with_its_key(archive, open_archive):
+    reopened = open_archive()
+    entry = reopened.search("דנה חרדה")[0]
+    assert (entry.filename, entry.artifact_bytes) == ("dana.docx", len(b"docx-1"))
+    assert reopened.artifact(entry.id) == b"docx-1"
+
+
+def test_delete_removes_the_entry_from_search(archive):
+    entry_id = archive.search("דנה חרדה")[0].id
+    assert archive.delete(entry_id)
+    assert titles(archive.search("דנה")) == ["יוסי"]
+    assert archive.get(entry_id) is None
+    with pytest.raises(KeyError):
+        archive.artifact(entry_id)
+    assert archive.count() == 2
+
+
+def test_parse_tags():
+    assert parse_tags(" חרדה, שינה ,, חרדה ") == ["חרדה", "שינה"]
+    assert parse_tags(None) == []
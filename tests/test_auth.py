@@ -0,0 +1,42 @@
+from auth import issue_token, password_matches, sign_value, unsign_value, verify_token
+
+SECRET = "app-password"
+
+
+def test_token_is_valid_until_it_expires():
+    token = issue_token(SECRET, ttl_seconds=3600, now=1_000_000)
+    assert verify_token(token, SECRET, now=1_000_000)
+    assert verify_token(token, SECRET, now=1_003_600)
+    assert not verify_token(token, SECRET, now=1_003_601)
+
+
+def test_tampered_tokens_are_rejected():
+    token = issue_token(SECRET, ttl_seconds=3600, now=1_000_000)
+    expires, signature = token.split(".")
+    assert not verify_token(token, "other-password", now=1_000_000)
+    assert not verify_token(f"{int(expires) + 86400}.{signature}", SECRET, now=1_000_000)  # extended expiry
+    flipped = signature[:-1] + ("1" if signature[-1] == "0" else "0")
+    assert not verify_token(f"{expires}.{flipped}", SECRET, now=1_000_000)
+    for bad in (None, "", expires, f"{expires}.", f"x{expires}.{signature}", 42):
+        assert not verify_token(bad, SECRET, now=1_000_000)
+
+
+def test_signed_values_round_trip():
+    signed = sign_value("job-1234", SECRET)
+    assert signed.startswith("job-1234.")
+    assert unsign_value(signed, SECRET) == "job-1234"
+    assert unsign_value(sign_value("a.b", SECRET), SECRET) == "a.b"
+
+
+def test_tampered_signed_values_are_rejected():
+    signed = sign_value("job-1234", SECRET)
+    assert unsign_value(signed, "other-password") is None
+    assert unsign_value(signed.replace("job-1234", "job-5678"), SECRET) is None
+    assert unsign_value("job-1234", SECRET) is None
+    for bad in (None, "", ".abc", "job-1234."):
+        assert unsign_value(bad, SECRET) is None
+
+
+def test_password_matches():
+    assert password_matches("סיסמה", "סיסמה")
+    assert not password_matches("סיסמה", "סיסמא")
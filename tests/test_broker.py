@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from broker import SqliteBroker, bucket_name
+from gemini_scheduler import TokenBucket
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return SqliteBroker(str(tmp_path / "broker.sqlite3"), Fernet.generate_key().decode("ascii"))
+
+
+def test_sqlite_bucket_is_shared_between_brokers(broker):
+    other = SqliteBroker(broker.path, broker._encryption_key)
+    first = broker.token_bucket("rpm", 60)
+    second = other.token_bucket("rpm", 60)
+    assert first.try_take(50) == 0.0
+    assert second.try_take(20) == pytest.approx(10.0, abs=0.1)  # 10 left, refilled at 1/s
+    second.adjust(-30)  # a refund shows in the other process
+    assert first.try_take(35) == 0.0
+
+
+def test_shared_bucket_take_does_not_block_the_event_loop(broker):
+    bucket = broker.token_bucket("rpm", 60)
+    # Another process holds the database write lock for a while
+    holder = sqlite3.connect(broker.path, isolation_level=None, check_same_thread=False)
+    holder.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, lambda: holder.execute("COMMIT")).start()
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        started = time.monotonic()
+        await bucket.acquire(1)
+        waited = time.monotonic() - started
+        ticking.cancel()
+        return waited, ticks
+
+    waited, ticks = asyncio.run(main())
+    assert waited >= 0.25
+    assert ticks >= 10  # the loop kept running while the take waited for the lock
+
+
+def test_in_process_bucket_take_matches_try_take():
+    bucket = TokenBucket(60)
+    assert asyncio.run(bucket.take(60)) == 0.0
+    assert asyncio.run(bucket.take(1)) == pytest.approx(1.0, abs=0.05)
+
+
+def test_bucket_name_hides_the_api_key():
+    name = bucket_name("tpm", "AIza-secret")
+    assert name.startswith("tpm:") and "secret" not in name
+    assert name == bucket_name("tpm", "AIza-secret") != bucket_name("tpm", "AIza-other")
@@ -0,0 +1,52 @@
+import pytest
+
+from chunking import split_notes
+
+
+def test_empty_and_short_notes():
+    assert split_notes("", 100) == []
+    assert split_notes("  \n\n ", 100) == []
+    assert split_notes("  קצר.  ", 100) == ["קצר."]
+    assert split_notes("x" * 100, 100) == ["x" * 100]
+
+
+def test_whole_paragraphs_are_packed_together():
+    paragraphs = ["א" * 30, "ב" * 30, "ג" * 30]
+    chunks = split_notes("\n\n".join(paragraphs), 70)
+    assert chunks == [paragraphs[0] + "\n" + paragraphs[1], paragraphs[2]]
+
+
+def test_a_paragraph_exactly_at_the_limit_gets_its_own_chunk():
+    chunks = split_notes("א" * 50 + "\n\n" + "ב" * 50, 50)
+    assert chunks == ["א" * 50, "ב" * 50]
+
+
+def test_oversized_paragraph_splits_between_sentences():
+    sentences = ["המטופלת דיווחה על חרדה.", "היא ישנה מעט!", "האם זה קשור לעבודה?", "נמשיך בשבוע הבא׃"]
+    chunks = split_notes(" ".join(sentences), 45)
+    assert all(len(chunk) <= 45 for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(sentences)
+    for chunk in chunks:
+        assert chunk.endswith((".", "!", "?", "׃"))
+
+
+def test_oversized_sentence_splits_between_words():
+    sentence = " ".join(["מילה"] * 30)
+    chunks = split_notes(sentence, 24)
+    assert all(len(chunk) <= 24 for chunk in chunks)
+    assert " ".join(chunks).split() == sentence.split()
+
+
+def test_oversized_word_is_cut():
+    url = "https://example.com/" + "a" * 50
+    chunks = split_notes(f"ראו {url} שם", 20)
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks).replace("\n", "").replace(" ", "") == f"ראו{url}שם"
+
+
+@pytest.mark.parametrize("max_chars", [40, 80, 200])
+def test_appending_keeps_the_earlier_chunks(max_chars):
+    notes = "\n\n".join(f"פסקה {i}: המטופל סיפר על השבוע שלו." for i in range(12))
+    before = split_notes(notes, max_chars)
+    after = split_notes(notes + "\n\nפסקה חדשה בסוף.", max_chars)
+    assert after[:len(before) - 1] == before[:-1]
@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.genai import errors as genai_errors
+
+from fake_gemini import FakeGeminiClient, FakeGeminiConfig
+from gemini_scheduler import GeminiScheduler, RequestCancelledError, TokenBucket, is_retryable
+
+FAST = dict(time_to_first_token_ms=0, inter_chunk_ms=0, latency_jitter=0, output_chars=240, chunk_chars=60)
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = GeminiScheduler(requests_per_minute=100_000, tokens_per_minute=100_000_000, max_concurrency=1,
+                                max_retries=3, backoff_base_seconds=0.01, backoff_max_seconds=0.02)
+    yield scheduler
+    scheduler.close()
+
+
+@pytest.fixture
+def callers():
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        yield pool
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def contents(notes: str):
+    return [types.SimpleNamespace(parts=[types.SimpleNamespace(text=notes)])]
+
+
+def fake_request(client, notes: str = "פגישה"):
+    """A scheduler request running one generate_content call on the fake client."""
+    async def request(emit):
+        response = await client.aio.models.generate_content(model="fake", contents=contents(notes))
+        return response.text, response.usage_metadata.total_token_count
+    return request
+
+
+def fake_stream_request(client, notes: str = "פגישה"):
+    async def request(emit):
+        text = ""
+        async for chunk in await client.aio.models.generate_content_stream(model="fake", contents=contents(notes)):
+            text += chunk.text
+            emit(text)
+        return text, None
+    return request
+
+
+def blocking_request(gate: threading.Event, started: threading.Event = None):
+    """A request that holds its concurrency slot until gate is set."""
+    async def request(emit):
+        if started is not None:
+            started.set()
+        while not gate.is_set():
+            await asyncio.sleep(0.01)
+        return "blocker", None
+    return request
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    assert bucket.try_take(60) == 0.0
+    assert bucket.try_take(30) == pytest.approx(30.0, abs=0.1)
+    bucket.updated -= 15  # 15 seconds pass: 15 tokens back
+    assert bucket.try_take(30) == pytest.approx(15.0, abs=0.1)
+    bucket.updated -= 15
+    assert bucket.try_take(30) == 0.0
+
+
+def test_token_bucket_holds_at_most_one_minute():
+    bucket = TokenBucket(60)
+    bucket.updated -= 600
+    assert bucket.wait_time(60) == 0.0
+    assert bucket.try_take(1000) == 0.0  # larger requests are capped at the capacity
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_adjust_charges_and_refunds():
+    bucket = TokenBucket(60)
+    bucket.adjust(30)
+    assert bucket.wait_time(60) == pytest.approx(30.0, abs=0.1)
+    bucket.adjust(-100)  # a refund never overfills the bucket
+    assert bucket.try_take(60) == 0.0
+    assert bucket.wait_time(1) > 0
+
+
+def test_sessions_are_served_round_robin(scheduler, callers):
+    gate, started, order = threading.Event(), threading.Event(), []
+
+    def recording(name):
+        async def request(emit):
+            order.append(name)
+            return name, None
+        return request
+
+    blocker = callers.submit(scheduler.call, "other", blocking_request(gate, started), 1)
+    assert started.wait(5)
+    futures = []
+    for session_id, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        futures.append(callers.submit(scheduler.call, session_id, recording(name), 1))
+        wait_until(lambda: scheduler.queue_depth() == len(futures))
+    gate.set()
+    assert [future.result(timeout=5) for future in futures] == ["a1", "a2", "a3", "b1"]
+    assert blocker.result(timeout=5) == "blocker"
+    # b's only request doesn't wait behind a's whole batch
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_queue_position_counts_other_sessions_round_robin(scheduler, callers):
+    gate, started, positions = threading.Event(), threading.Event(), []
+    callers.submit(scheduler.call, "other", blocking_request(gate, started), 1)
+    assert started.wait(5)
+    for i in range(3):
+        callers.submit(scheduler.call, "a", blocking_request(gate), 1)
+        wait_until(lambda: scheduler.queue_depth() == i + 1)
+    waiting = callers.submit(scheduler.call, "b", blocking_request(gate), 1,
+                             on_wait=lambda ahead, wait: positions.append(ahead), poll_interval=0.01)
+    wait_until(lambda: positions)
+    gate.set()
+    waiting.result(timeout=5)
+    assert positions[0] == 1  # only a's first request goes before b's
+
+
+def test_retryable_errors_are_retried(scheduler):
+    client = FakeGeminiClient(FakeGeminiConfig(**FAST, failure_rate=0.5, seed=3))
+    for i in range(5):
+        text = scheduler.call("s", fake_request(client, f"פגישה {i}"), estimated_tokens=100)
+        assert text.startswith(f"פגישה {i}")
+    assert client.stats["failures"] > 0
+    assert scheduler.retries == client.stats["failures"]
+    assert client.stats["calls"] == 5 + client.stats["failures"]
+
+
+def test_retries_stop_after_max_retries(scheduler):
+    client = FakeGeminiClient(FakeGeminiConfig(**FAST, failure_rate=1.0))
+    with pytest.raises(genai_errors.APIError) as raised:
+        scheduler.call("s", fake_request(client), estimated_tokens=100)
+    assert raised.value.code == 503
+    assert client.stats["calls"] == scheduler.max_retries + 1
+
+
+def test_non_retryable_errors_fail_at_once(scheduler):
+    client = FakeGeminiClient(FakeGeminiConfig(**FAST, failure_rate=1.0, failure_status=400))
+    with pytest.raises(genai_errors.APIError):
+        scheduler.call("s", fake_request(client), estimated_tokens=100)
+    assert client.stats["calls"] == 1
+    assert scheduler.retries == 0
+
+
+def test_is_retryable():
+    assert is_retryable(genai_errors.APIError(429, {"error": {"code": 429}}))
+    assert is_retryable(genai_errors.APIError(503, {"error": {"code": 503}}))
+    assert not is_retryable(genai_errors.APIError(400, {"error": {"code": 400}}))
+    assert is_retryable(TimeoutError())
+    assert not is_retryable(ValueError())
+
+
+def test_streamed_chunks_reach_the_caller(scheduler):
+    client = FakeGeminiClient(FakeGeminiConfig(**FAST))
+    partials = []
+    text = scheduler.call("s", fake_stream_request(client), estimated_tokens=100, on_chunk=partials.append,
+                          poll_interval=0.01)
+    assert len(text) == FAST["output_chars"]
+    assert partials and text.startswith(partials[-1])
+
+
+def test_cancel_drops_a_queued_request(scheduler, callers):
+    gate, started, ran = threading.Event(), threading.Event(), []
+
+    async def request(emit):
+        ran.append(True)
+        return "ran", None
+
+    callers.submit(scheduler.call, "other", blocking_request(gate, started), 1)
+    assert started.wait(5)
+    cancel = threading.Event()
+    queued = callers.submit(scheduler.call, "s", request, 1, cancel_event=cancel, poll_interval=0.01)
+    wait_until(lambda: scheduler.queue_depth() == 1)
+    cancel.set()
+    with pytest.raises(RequestCancelledError):
+        queued.result(timeout=5)
+    assert scheduler.queue_depth() == 0
+    gate.set()
+    assert not ran
+
+
+def test_cancel_interrupts_a_request_in_flight(scheduler, callers):
+    client = FakeGeminiClient(FakeGeminiConfig(**{**FAST, "time_to_first_token_ms": 10_000}))
+    cancel = threading.Event()
+    in_flight = callers.submit(scheduler.call, "s", fake_stream_request(client), 100, cancel_event=cancel,
+                               poll_interval=0.01)
+    wait_until(lambda: scheduler.stats()["in_flight"] == 1)
+    started = time.monotonic()
+    cancel.set()
+    with pytest.raises(RequestCancelledError):
+        in_flight.result(timeout=5)
+    assert time.monotonic() - started < 2
+    wait_until(lambda: scheduler.stats()["in_flight"] == 0)
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+from cryptography.fernet import Fernet
+
+from jobs import DONE, FAILED, INTERRUPTED_JOB_ERROR, QUEUED, RUNNING, JobQueue, JobStore
+
+
+@pytest.fixture
+def store():
+    return JobStore()
+
+
+@pytest.fixture
+def open_disk_store(tmp_path):
+    """Opens (another connection to) one encrypted on-disk store, like a second process would."""
+    path, key = str(tmp_path / "jobs.sqlite3"), Fernet.generate_key().decode("ascii")
+    return lambda: JobStore(path, key)
+
+
+def wait_for_status(store, job_id: str, statuses, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while store.status(job_id) not in statuses:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    return store.get(job_id)
+
+
+def test_claim_takes_the_oldest_queued_job(store):
+    first = store.add("summary", {"notes": "א"}, session_id="s1")
+    second = store.add("summary", {"notes": "ב"}, session_id="s2")
+    assert store.position(second) == 1
+
+    job = store.claim_next("worker-1")
+    assert (job.id, job.status, job.attempts, job.payload) == (first, RUNNING, 1, {"notes": "א"})
+    assert store.position(second) == 0
+    assert store.claim_next("worker-1").id == second
+    assert store.claim_next("worker-1") is None
+
+
+def test_workers_sharing_a_store_never_claim_the_same_job(open_disk_store):
+    stores = [open_disk_store(), open_disk_store()]
+    job_ids = [stores[0].add("summary", {"i": i}) for i in range(40)]
+    claimed, lock = [], threading.Lock()
+
+    def work(store):
+        while (job := store.claim_next(threading.current_thread().name)) is not None:
+            with lock:
+                claimed.append(job.id)
+
+    threads = [threading.Thread(target=work, args=(stores[i % 2],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(job_ids)
+
+
+def test_expired_leases_are_requeued(store):
+    job_id = store.add("summary", {})
+    store.claim_next("worker-1", lease_seconds=0.05)
+    assert store.requeue_expired() == 0
+    time.sleep(0.1)
+    assert store.requeue_expired() == 1
+    assert store.status(job_id) == QUEUED
+    assert store.claim_next("worker-2").attempts == 2
+
+
+def test_renewed_leases_are_kept(store):
+    job_id = store.add("summary", {})
+    store.claim_next("worker-1", lease_seconds=0.05)
+    store.renew([job_id], lease_seconds=60)
+    time.sleep(0.1)
+    assert store.requeue_expired() == 0
+    assert store.status(job_id) == RUNNING
+
+
+def test_requeue_running_after_a_restart(store):
+    job_id = store.add("summary", {})
+    store.claim_next("worker-1")
+    store.set_progress(job_id, "חלקי")
+    assert store.progress(job_id) == "חלקי"
+    assert store.requeue_running() == 1
+    assert store.status(job_id) == QUEUED
+    assert store.progress(job_id) == ""
+
+
+def test_finish_and_fail_drop_the_payload(store):
+    done_id, failed_id = store.add("summary", {"notes": "א"}), store.add("summary", {"notes": "ב"})
+    store.claim_next()
+    store.claim_next()
+    store.finish(done_id, {"summary": "סיכום"}, b"docx")
+    store.fail(failed_id, "ValueError: boom")
+    done, failed = store.get(done_id), store.get(failed_id)
+    assert (done.status, done.payload, done.result, done.artifact) == (DONE, {}, {"summary": "סיכום"}, b"docx")
+    assert (failed.status, failed.payload, failed.error) == (FAILED, {}, "ValueError: boom")
+    assert not done.active and not failed.active
+    assert store.purge(0) == 2
+    assert store.get(done_id) is None
+
+
+def test_disk_store_encrypts_notes(open_disk_store):
+    store = open_disk_store()
+    job_id = store.add("summary", {"notes": "secret notes"})
+    raw = sqlite3.connect(store.path).execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    assert b"secret notes" not in raw
+    assert open_disk_store().get(job_id).payload == {"notes": "secret notes"}
+
+
+def test_queue_runs_jobs_and_reports_errors(store):
+    def handler(payload, on_progress):
+        if payload.get("fail"):
+            raise ValueError("bad notes")
+        on_progress("partial")
+        return {"summary": payload["notes"]}, b"file"
+
+    queue = JobQueue(store, {"summary": handler}, workers=2, poll_seconds=0.05)
+    ok_id = queue.submit("summary", {"notes": "א"}, session_id="s1")
+    failed_id = queue.submit("summary", {"fail": True}, session_id="s1")
+    assert wait_for_status(store, ok_id, (DONE, FAILED)).result == {"summary": "א"}
+    assert wait_for_status(store, failed_id, (DONE, FAILED)).error == "ValueError: bad notes"
+    with pytest.raises(ValueError):
+        queue.submit("unknown", {})
+
+
+def test_queue_fails_jobs_interrupted_too_often(store):
+    job_id = store.add("summary", {})
+    for _ in range(2):  # two earlier runs died mid-job
+        store.claim_next()
+        store.requeue_running()
+    JobQueue(store, {"summary": lambda payload, on_progress: ({}, None)}, workers=1, max_attempts=2,
+             poll_seconds=0.05)
+    assert wait_for_status(store, job_id, (DONE, FAILED)).error == INTERRUPTED_JOB_ERROR
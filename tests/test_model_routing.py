@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from fake_gemini import FakeGeminiClient, FakeGeminiConfig
+
+API_KEY = "test-key"
+FAST = dict(time_to_first_token_ms=0, inter_chunk_ms=0, latency_jitter=0, output_chars=240, chunk_chars=60)
+
+
+@pytest.fixture
+def core(monkeypatch):
+    """summary_core with fresh shared resources, no retries and a short hedge delay."""
+    import summary_core
+
+    for name, value in {"TELEMETRY_LOG_PATH": "", "SUMMARY_CACHE_DIR": "", "PII_SCRUBBING": "false",
+                        "GEMINI_MAX_RETRIES": "0", "GEMINI_HEDGE_AFTER_SECONDS": "0.2"}.items():
+        monkeypatch.setenv(name, value)
+    summary_core._shared_resources.clear()
+    yield summary_core
+    for (kind, _), resource in list(summary_core._shared_resources.items()):
+        if kind == "gemini_scheduler":
+            resource.close()
+    summary_core._shared_resources.clear()
+
+
+class ModelsTried(list):
+    """The models called, in order; models in slow answer after a second, models in failing raise."""
+
+    def __init__(self):
+        super().__init__()
+        self.slow, self.failing = set(), set()
+
+    async def before_call(self, model: str):
+        self.append(model)
+        if model in self.slow:
+            await asyncio.sleep(1.0)
+        if model in self.failing:
+            raise genai_errors.APIError(500, {"error": {"code": 500, "message": "fake failure"}})
+
+
+@pytest.fixture
+def models_tried(core):
+    """Installs a FakeGeminiClient that reports its calls to a ModelsTried."""
+    client = FakeGeminiClient(FakeGeminiConfig(**FAST))
+    core.install_gemini_client(API_KEY, client)
+    models, tried = client.aio.models, ModelsTried()
+    generate_content, generate_content_stream = models.generate_content, models.generate_content_stream
+
+    async def generate(model, contents, config=None):
+        await tried.before_call(model)
+        return await generate_content(model, contents, config)
+
+    async def generate_stream(model, contents, config=None):
+        await tried.before_call(model)
+        return await generate_content_stream(model, contents, config)
+
+    models.generate_content, models.generate_content_stream = generate, generate_stream
+    return tried
+
+
+def test_fast_primary_is_the_only_model_called(core, models_tried):
+    summary = core.generate_narrative_summary(API_KEY, "פגישה ראשונה", on_chunk=lambda text: None)
+    assert summary
+    assert models_tried == [core.GEMINI_MODEL_NAME]
+
+
+def test_slow_streamed_request_is_hedged(core, models_tried):
+    models_tried.slow.add(core.GEMINI_MODEL_NAME)
+    chunks = []
+    summary = core.generate_narrative_summary(API_KEY, "פגישה שנייה", on_chunk=chunks.append)
+    assert models_tried == [core.GEMINI_MODEL_NAME, core.GEMINI_FALLBACK_MODEL_NAME]
+    assert summary and chunks
+
+
+def test_slow_non_streamed_request_is_not_hedged(core, models_tried):
+    models_tried.slow.add(core.GEMINI_MODEL_NAME)
+    assert core.generate_narrative_summary(API_KEY, "פגישה שלישית")
+    assert models_tried == [core.GEMINI_MODEL_NAME]
+
+
+def test_failed_primary_fails_over_to_the_backup(core, models_tried):
+    models_tried.failing.add(core.GEMINI_MODEL_NAME)
+    assert core.generate_narrative_summary(API_KEY, "פגישה רביעית")
+    assert models_tried == [core.GEMINI_MODEL_NAME, core.GEMINI_FALLBACK_MODEL_NAME]
+
+
+def test_error_lists_the_models_tried(core, models_tried):
+    models_tried.failing.update([core.GEMINI_MODEL_NAME, core.GEMINI_FALLBACK_MODEL_NAME])
+    with pytest.raises(genai_errors.APIError) as raised:
+        core.generate_narrative_summary(API_KEY, "פגישה חמישית", on_chunk=lambda text: None)
+    assert raised.value.models_tried == [core.GEMINI_MODEL_NAME, core.GEMINI_FALLBACK_MODEL_NAME]
@@ -0,0 +1,36 @@
+import pytest
+
+from notes_diff import diff_notes, split_sentences
+
+NOTES = "המטופלת הגיעה בזמן. דיברנו על העבודה. היא ישנה מעט."
+
+
+def test_split_sentences_normalizes_whitespace():
+    assert split_sentences("  אחת.   שתיים\n שלוש  ") == ["אחת.", "שתיים", "שלוש"]
+    assert split_sentences("") == []
+
+
+def test_whitespace_only_edits_are_empty():
+    delta = diff_notes(NOTES, NOTES.replace(" ", "  ") + "\n")
+    assert delta.empty
+    assert delta.changed_ratio == 0.0
+
+
+def test_added_sentence():
+    delta = diff_notes(NOTES, NOTES + " נוסף: קשיי ריכוז.")
+    assert (delta.added, delta.removed) == (["נוסף: קשיי ריכוז."], [])
+    assert not delta.empty
+
+
+def test_changed_sentence_is_removed_and_added():
+    delta = diff_notes(NOTES, NOTES.replace("מעט", "היטב"))
+    assert delta.removed == ["היא ישנה מעט."]
+    assert delta.added == ["היא ישנה היטב."]
+
+
+def test_changed_ratio_is_relative_to_the_new_notes():
+    delta = diff_notes(NOTES, NOTES.replace("דיברנו על העבודה. ", ""))
+    assert delta.removed == ["דיברנו על העבודה."]
+    new_length = len("המטופלת הגיעה בזמן.") + len("היא ישנה מעט.")
+    assert delta.changed_ratio == pytest.approx(len("דיברנו על העבודה.") / new_length)
+    assert diff_notes("", NOTES).changed_ratio == pytest.approx(1.0)
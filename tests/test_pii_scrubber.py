@@ -0,0 +1,90 @@
+import pytest
+
+from pii_scrubber import Scrubber, identifier_pattern, parse_name_list, trie_pattern, valid_israeli_id
+
+# The few-shot example the app shipped with
+EXAMPLE_NOTES = ("פגישה עם דנה, בת 32, רווקה. הגיעה עקב תחושות חרדה וקשיי הירדמות שהחמירו לאחר פרידה "
+                 "מבן זוג לפני חודשיים.")
+
+
+def test_example_name_is_replaced():
+    scrubber = Scrubber()
+    scrubbed = scrubber.scrub(EXAMPLE_NOTES)
+    assert "דנה" not in scrubbed
+    assert scrubbed.startswith("פגישה עם [NAME_1], בת 32")
+    assert scrubber.restore(scrubbed) == EXAMPLE_NOTES
+
+
+@pytest.mark.parametrize("name", ["דנה", "שרה", "חנה", "יוסף", "מרים", "תמר", "נועם", "עומר"])
+def test_word_like_names_are_replaced_by_default(name):
+    assert Scrubber().scrub(f"פגישה עם {name} היום") == "פגישה עם [NAME_1] היום"
+
+
+@pytest.mark.parametrize("text", ["תחושה יותר טובה", "האופק הטיפולי", "והשקד", "מאוד טובה", "כל אופק"])
+def test_word_like_names_in_word_contexts_are_kept(text):
+    assert Scrubber().scrub(text) == text
+
+
+def test_titled_word_names():
+    scrubber = Scrubber(("כהן",), titled_word_names=True)
+    assert scrubber.scrub("תחושה טובה") == "תחושה טובה"
+    assert scrubber.scrub("גב' טובה הגיעה") == "גב' [NAME_1] הגיעה"
+    assert scrubber.scrub("תמר כהן") == "[NAME_2] [NAME_3]"
+    assert scrubber.scrub("פגישה עם יעל") == "פגישה עם [NAME_4]"
+
+
+def test_prefix_letters_stay_outside_the_placeholder():
+    scrubber = Scrubber()
+    assert scrubber.scrub("ולמשה יש אח, ומשה") == "ול[NAME_1] יש אח, ו[NAME_1]"
+
+
+def test_round_trip_all_kinds():
+    notes = ("רחל (ת\"ז 000000018) גרה ברחוב הרצל 12, טלפון 052-1234567, "
+             "מייל rachel@example.com, ולרחל יש אח בשם יונתן.")
+    scrubber = Scrubber()
+    scrubbed = scrubber.scrub(notes)
+    for value in ("רחל", "000000018", "הרצל 12", "052-1234567", "rachel@example.com", "יונתן"):
+        assert value not in scrubbed
+    assert scrubber.counts() == {"name": 2, "id": 1, "phone": 1, "email": 1, "address": 1}
+    assert scrubber.restore(scrubbed) == notes
+
+
+def test_same_value_same_placeholder_across_texts():
+    scrubber = Scrubber()
+    first = scrubber.scrub("משה הגיע")
+    second = scrubber.scrub("הסיכום של משה")
+    assert first == "[NAME_1] הגיע" and second == "הסיכום של [NAME_1]"
+    assert scrubber.replaced == 1
+
+
+def test_invalid_id_number_is_kept():
+    assert Scrubber().scrub("מספר 123456789") == "מספר 123456789"
+
+
+def test_restore_partial_holds_back_unfinished_placeholder():
+    scrubber = Scrubber()
+    scrubber.scrub("משה")
+    assert scrubber.restore("פגישה עם [NAM", partial=True) == "פגישה עם "
+    assert scrubber.restore("פגישה עם [NAME_1]", partial=True) == "פגישה עם משה"
+    assert scrubber.restore("[NAME_9] לא מוכר") == "[NAME_9] לא מוכר"
+
+
+@pytest.mark.parametrize("digits,valid", [("000000018", True), ("00000001-8", True), ("000000019", False),
+                                          ("12345678", False), ("123456782", True)])
+def test_valid_israeli_id(digits, valid):
+    assert valid_israeli_id(digits) is valid
+
+
+def test_trie_pattern_matches_exactly_the_words():
+    import re
+
+    words = ["אבי", "אביגיל", "אביטל", "משה"]
+    pattern = re.compile(f"(?:{trie_pattern(words)})$")
+    assert all(pattern.match(word) for word in words)
+    assert not any(pattern.match(word) for word in ["אב", "אביג", "מש", "משהו"])
+
+
+def test_parse_name_list():
+    assert parse_name_list(" כהן, לוי  כהן\nמזרחי") == ("כהן", "לוי", "מזרחי")
+    assert parse_name_list(None) == ()
+    assert identifier_pattern(("כהן",)) is identifier_pattern(("כהן",))
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from prompts import SUMMARY_SECTIONS, get_prompt
+
+
+@pytest.fixture
+def prompt():
+    return get_prompt()
+
+
+def test_sections_come_back_in_topic_order(prompt):
+    answer = {"plan": "  להמשיך פעם בשבוע. ", "patient_details": "דנה, 32", "unknown": "ignored"}
+    sections = prompt.parse_sections(json.dumps(answer, ensure_ascii=False))
+    titles = dict(SUMMARY_SECTIONS)
+    assert sections == [
+        {"key": "patient_details", "title": titles["patient_details"], "text": "דנה, 32"},
+        {"key": "plan", "title": titles["plan"], "text": "להמשיך פעם בשבוע."},
+    ]
+
+
+def test_empty_and_null_sections_are_skipped(prompt):
+    sections = prompt.parse_sections(json.dumps({"assessment": "חרדה", "plan": "  ", "objective": None}))
+    assert [section["key"] for section in sections] == ["assessment"]
+
+
+@pytest.mark.parametrize("answer, message", [
+    ("not json", "not valid JSON"),
+    ("[]", "not a JSON object"),
+    ('{"plan": ["a"]}', "'plan' is not a string"),
+    ('{"plan": "", "unknown": "text"}', "no non-empty section"),
+    ("{}", "no non-empty section"),
+])
+def test_invalid_answers_raise(prompt, answer, message):
+    with pytest.raises(ValueError, match=message):
+        prompt.parse_sections(answer)
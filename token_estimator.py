@@ -0,0 +1,147 @@
+"""
+Fast local token and latency estimates for Gemini requests.
+
+Notes are estimated word by word with per-script characters-per-token
+ratios (Hebrew words split into more tokens than English ones, digits and
+punctuation are roughly a token each), then scaled by a calibration factor.
+The factor is learned from the prompt_token_count Gemini reports for real
+requests, the same tokenizer count_tokens uses, so calibration costs no
+extra API calls. The fixed part of a prompt (system prompt and few-shot
+turns) is counted exactly with count_tokens once and cached.
+"""
+import re
+import threading
+import time
+from functools import lru_cache
+
+# Characters per token by script, for the Gemini (SentencePiece) tokenizer
+CHARS_PER_TOKEN = {
+    "hebrew": 3.0,
+    "latin": 4.0,
+    "digit": 1.5,
+}
+WORD_PATTERN = re.compile(r"[\u0590-\u05FF\uFB1D-\uFB4F]+|[A-Za-z\u00C0-\u024F]+|\d+|[^\s\w]|_+")
+
+
+@lru_cache(maxsize=512)
+def raw_token_estimate(text: str) -> float:
+    """Uncalibrated token estimate; cached since the same notes are estimated on every rerun."""
+    tokens = 0.0
+    for word in WORD_PATTERN.findall(text):
+        first = word[0]
+        if "\u0590" <= first <= "\u05FF" or "\uFB1D" <= first <= "\uFB4F":
+            tokens += max(1.0, len(word) / CHARS_PER_TOKEN["hebrew"])
+        elif first.isdigit():
+            tokens += max(1.0, len(word) / CHARS_PER_TOKEN["digit"])
+        elif first.isalpha():
+            tokens += max(1.0, len(word) / CHARS_PER_TOKEN["latin"])
+        else:
+            tokens += 1.0
+    return tokens
+
+
+class TokenEstimator:
+    """
+    Calibrated token counts plus a simple latency model, both updated from
+    completed requests with exponential smoothing. Thread-safe.
+    """
+
+    def __init__(self, smoothing: float = 0.2, time_to_first_token_seconds: float = 2.0,
+                 output_tokens_per_second: float = 120.0, expected_output_tokens: int = 1024):
+        self.smoothing = smoothing
+        self.scale = 1.0
+        self.observations = 0
+        self.time_to_first_token_seconds = time_to_first_token_seconds
+        self.output_tokens_per_second = output_tokens_per_second
+        self.expected_output_tokens = float(expected_output_tokens)
+        self._fixed_tokens = {}  # key -> (tokens, exact, valid_until)
+        self._counting = set()  # keys with a background count in flight
+        self._lock = threading.Lock()
+
+    def _smooth(self, current: float, observed: float) -> float:
+        return current + self.smoothing * (observed - current)
+
+    def estimate(self, text: str) -> int:
+        return int(round(raw_token_estimate(text) * self.scale)) if text else 0
+
+    def observe(self, text: str, actual_tokens: int):
+        """Calibrates against the real token count of text (e.g. from usage_metadata)."""
+        raw = raw_token_estimate(text)
+        if raw < 20 or not actual_tokens or actual_tokens <= 0:
+            return  # too short to say anything about the ratio
+        ratio = min(3.0, max(0.33, actual_tokens / raw))
+        with self._lock:
+            # The first observation replaces the default outright; later ones are smoothed
+            self.scale = ratio if not self.observations else self._smooth(self.scale, ratio)
+            self.observations += 1
+
+    def observe_latency(self, time_to_first_token_seconds: float = None, output_tokens: int = None,
+                        generation_seconds: float = None):
+        """Updates the latency model from a streamed request's timings."""
+        with self._lock:
+            if time_to_first_token_seconds is not None and time_to_first_token_seconds > 0:
+                self.time_to_first_token_seconds = self._smooth(self.time_to_first_token_seconds,
+                                                                time_to_first_token_seconds)
+            if output_tokens:
+                self.expected_output_tokens = self._smooth(self.expected_output_tokens, output_tokens)
+                if generation_seconds and generation_seconds > 0.2:
+                    self.output_tokens_per_second = self._smooth(self.output_tokens_per_second,
+                                                                 output_tokens / generation_seconds)
+
+    def estimate_seconds(self, output_tokens: float = None) -> float:
+        """Expected time from dispatch to the last token of one request."""
+        output_tokens = self.expected_output_tokens if output_tokens is None else output_tokens
+        return self.time_to_first_token_seconds + output_tokens / max(1.0, self.output_tokens_per_second)
+
+    def fixed_tokens(self, key, count_exact, fallback_text: str, retry_seconds: float = 300, wait: bool = True,
+                     exact_only: bool = False):
+        """
+        Token count of a fixed prompt part, from count_exact() (e.g. a count_tokens
+        call) the first time and cached afterwards. If count_exact fails, the local
+        estimate of fallback_text is used and the exact count is retried later.
+        With wait=False the caller never blocks on count_exact(): until an exact
+        count is cached, it gets the local estimate while count_exact() runs once
+        on a background thread. With exact_only, None takes the estimate's place.
+        """
+        now = time.time()
+        with self._lock:
+            cached = self._fixed_tokens.get(key)
+            if cached and (cached[1] or cached[2] > now):
+                return cached[0] if cached[1] or not exact_only else None
+            if not wait:
+                if key not in self._counting:
+                    self._counting.add(key)
+                    threading.Thread(target=self._count_fixed, args=(key, count_exact, fallback_text, retry_seconds),
+                                     name="fixed-token-count", daemon=True).start()
+                if exact_only:
+                    return None
+                return cached[0] if cached else self.estimate(fallback_text)
+        tokens, exact = self._count_fixed(key, count_exact, fallback_text, retry_seconds)
+        return tokens if exact or not exact_only else None
+
+    def _count_fixed(self, key, count_exact, fallback_text: str, retry_seconds: float) -> tuple:
+        try:
+            tokens, exact = int(count_exact()), True
+        except Exception:
+            tokens, exact = self.estimate(fallback_text), False
+        with self._lock:
+            self._fixed_tokens[key] = (tokens, exact, time.time() + retry_seconds)
+            self._counting.discard(key)
+        return tokens, exact
+
+    def chars_for_tokens(self, text: str, tokens: int) -> int:
+        """How many leading characters of text fit in about this many tokens."""
+        estimated = self.estimate(text)
+        if estimated <= tokens:
+            return len(text)
+        return int(len(text) * tokens / estimated)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "scale": round(self.scale, 3),
+                "observations": self.observations,
+                "time_to_first_token_seconds": round(self.time_to_first_token_seconds, 2),
+                "output_tokens_per_second": round(self.output_tokens_per_second, 1),
+                "expected_output_tokens": round(self.expected_output_tokens),
+            }
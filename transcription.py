@@ -0,0 +1,199 @@
+"""
+Local transcription of dictated session notes (Hebrew, on CPU).
+
+Audio is decoded and resampled to 16 kHz mono as a stream, and transcribed
+in chunks of about CHUNK_SECONDS, so memory stays flat however long the
+recording is and text is available after the first chunk. Each chunk ends
+at the quietest moment near its end, so words are rarely cut in half, and
+the tail of the text so far is given to the model as context for the next
+chunk. Nothing leaves the machine.
+
+The model runs on faster-whisper (CTranslate2, int8 on CPU) and PyAV, which
+comes with it. Without faster-whisper installed, dictation is simply not
+offered.
+"""
+import importlib.util
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import telemetry
+
+SAMPLE_RATE = 16000
+CHUNK_SECONDS = 20.0  # Whisper's window is 30 s; shorter chunks show text sooner
+BOUNDARY_SEARCH_SECONDS = 4.0  # a chunk is cut at the quietest 100 ms within its last seconds
+BOUNDARY_FRAME_SECONDS = 0.1
+CONTEXT_CHARS = 200  # tail of the previous text passed as the next chunk's prompt
+MEMORY_SAMPLE_SECONDS = 0.05
+DEFAULT_MODEL = "ivrit-ai/whisper-large-v3-turbo-ct2"  # Whisper fine-tuned on Hebrew, in CTranslate2 format
+AUDIO_TYPES = ["wav", "mp3", "m4a", "ogg", "oga", "opus", "webm", "flac", "aac"]
+
+
+def transcription_available() -> bool:
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+@dataclass
+class Transcript:
+    text: str
+    audio_seconds: float
+    seconds: float  # decoding and transcription, without loading the model
+    load_seconds: float  # model load, when this call was the one that loaded it
+    chunks: int
+    peak_rss_mb: float  # process peak while transcribing
+    added_rss_mb: float  # that peak above the process size when transcription started
+
+    @property
+    def real_time_factor(self) -> float:
+        """Processing time per second of audio; below 1 is faster than real time."""
+        return self.seconds / self.audio_seconds if self.audio_seconds else 0.0
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak so far, in KiB on Linux
+
+
+class _MemorySampler:
+    """Samples the process's resident memory in the background; peak is the highest value seen."""
+
+    def __init__(self):
+        self.baseline = _rss_bytes()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(MEMORY_SAMPLE_SECONDS):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+def iter_audio(source, chunk_seconds: float = CHUNK_SECONDS):
+    """
+    Decodes an audio file (path or file-like) to 16 kHz mono float32 and
+    yields it in chunks of up to chunk_seconds, each cut at a quiet point.
+    Raises ValueError for data that can't be decoded as audio.
+    """
+    import av
+    import numpy as np
+
+    chunk_samples = int(chunk_seconds * SAMPLE_RATE)
+    frame = int(BOUNDARY_FRAME_SECONDS * SAMPLE_RATE)
+    search = int(min(BOUNDARY_SEARCH_SECONDS, chunk_seconds / 2) * SAMPLE_RATE)
+    pending, pending_samples = [], 0
+
+    try:
+        with av.open(source, mode="r", metadata_errors="ignore") as container:
+            if not container.streams.audio:
+                raise ValueError("the file has no audio")
+            resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+            for decoded in container.decode(audio=0):
+                for resampled in resampler.resample(decoded):
+                    samples = resampled.to_ndarray().reshape(-1)
+                    pending.append(samples)
+                    pending_samples += len(samples)
+                    while pending_samples >= chunk_samples:
+                        buffer = np.concatenate(pending)
+                        window = buffer[chunk_samples - search:chunk_samples].astype(np.float32)
+                        energy = np.square(window[:len(window) // frame * frame]).reshape(-1, frame).sum(axis=1)
+                        cut = chunk_samples - search + int(np.argmin(energy)) * frame + frame // 2
+                        yield buffer[:cut].astype(np.float32) / 32768.0
+                        pending, pending_samples = [buffer[cut:]], len(buffer) - cut
+            for resampled in resampler.resample(None):
+                pending.append(resampled.to_ndarray().reshape(-1))
+    except av.error.FFmpegError as e:
+        raise ValueError(f"not a readable audio file ({e})") from e
+    if pending:
+        tail = np.concatenate(pending)
+        if len(tail):
+            yield tail.astype(np.float32) / 32768.0
+
+
+class Transcriber:
+    """
+    One Whisper model for the process. Concurrent transcriptions take turns
+    chunk by chunk, so each one keeps making progress.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, compute_type: str = "int8", cpu_threads: int = 0,
+                 beam_size: int = 1, language: str = "he", chunk_seconds: float = CHUNK_SECONDS):
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.cpu_threads = cpu_threads or os.cpu_count() or 1
+        self.beam_size = beam_size
+        self.language = language
+        self.chunk_seconds = chunk_seconds
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._load_lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+
+                self._model = WhisperModel(self.model_name, device="cpu", compute_type=self.compute_type,
+                                           cpu_threads=self.cpu_threads)
+            return self._model
+
+    def _transcribe_chunk(self, model, samples, context: str):
+        with self._run_lock:
+            segments, _info = model.transcribe(
+                samples, language=self.language, beam_size=self.beam_size, vad_filter=True,
+                condition_on_previous_text=False, without_timestamps=True, initial_prompt=context or None,
+            )
+            for segment in segments:  # a generator: decoding happens as it's consumed
+                yield segment.text.strip()
+
+    def transcribe(self, source, on_text=None) -> Transcript:
+        """
+        Transcribes an audio file (path or file-like). on_text, if given, is
+        called with the full text so far after every transcribed segment.
+        """
+        load_started = time.perf_counter()
+        loaded = self._model is not None
+        model = self._get_model()
+        load_seconds = 0.0 if loaded else time.perf_counter() - load_started
+
+        parts, audio_samples, chunks = [], 0, 0
+        with telemetry.trace("transcription", model=self.model_name, compute_type=self.compute_type,
+                             cpu_threads=self.cpu_threads) as request_trace:
+            with _MemorySampler() as memory:
+                started = time.perf_counter()
+                for samples in iter_audio(source, self.chunk_seconds):
+                    chunks += 1
+                    audio_samples += len(samples)
+                    context = " ".join(parts)[-CONTEXT_CHARS:]
+                    for text in self._transcribe_chunk(model, samples, context):
+                        if text:
+                            parts.append(text)
+                            if on_text:
+                                on_text(" ".join(parts))
+                seconds = time.perf_counter() - started
+            transcript = Transcript(
+                text=" ".join(parts), audio_seconds=audio_samples / SAMPLE_RATE, seconds=seconds,
+                load_seconds=load_seconds, chunks=chunks, peak_rss_mb=memory.peak / 2**20,
+                added_rss_mb=(memory.peak - memory.baseline) / 2**20,
+            )
+            # Only sizes and timings, never the text
+            request_trace.set(audio_seconds=round(transcript.audio_seconds, 2), chunks=chunks,
+                              load_ms=round(load_seconds * 1000, 1), text_chars=len(transcript.text),
+                              real_time_factor=round(transcript.real_time_factor, 3) if audio_samples else None,
+                              peak_rss_mb=round(transcript.peak_rss_mb, 1),
+                              added_rss_mb=round(transcript.added_rss_mb, 1))
+        return transcript
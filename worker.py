@@ -0,0 +1,95 @@
+"""
+Worker processes for a multi-process deployment.
+
+With JOB_BROKER_URL set, the Streamlit app only submits summary jobs to the
+broker; these processes run them. Start any number of them, on one machine
+or several that reach the same broker:
+
+    JOB_BROKER_URL=sqlite:///data/broker.sqlite3 python -m worker --processes 4 --threads 4
+    JOB_BROKER_URL=redis://broker-host:6379/0 python -m worker
+
+Every process shares the broker's job queue, summary cache, templates and
+Gemini rate limits. Settings are read from the environment and, when present,
+from .streamlit/secrets.toml, like the app. The API key is GEMINI_API_KEY.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+
+def load_settings():
+    """Registers .streamlit/secrets.toml (if any) as a settings source; the environment still applies."""
+    from summary_core import add_settings_source
+
+    if os.path.exists(SECRETS_FILE):
+        import tomllib
+
+        with open(SECRETS_FILE, "rb") as f:
+            add_settings_source(tomllib.load(f))
+
+
+def run_worker(threads: int):
+    """One worker process: job threads on the shared queue until the process is stopped."""
+    load_settings()
+    from summary_core import get_broker, get_job_queue, get_setting
+
+    api_key = get_setting("GEMINI_API_KEY")
+    queue = get_job_queue(api_key, workers=threads)
+    print(f"worker {queue.worker_id}: {threads} threads on {get_setting('JOB_BROKER_URL')}"
+          f" ({type(get_broker()).__name__})", flush=True)
+    while True:
+        time.sleep(3600)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m worker", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes (default: CPUs)")
+    parser.add_argument("--threads", type=int, default=4, help="job threads per process (jobs mostly wait on Gemini)")
+    args = parser.parse_args(argv)
+
+    load_settings()
+    from summary_core import get_broker, get_setting
+
+    if not get_setting("GEMINI_API_KEY"):
+        print("GEMINI_API_KEY is not set.", file=sys.stderr)
+        return 2
+    if not get_setting("JOB_BROKER_URL"):
+        print("JOB_BROKER_URL is not set (e.g. sqlite:///data/broker.sqlite3 or redis://localhost:6379/0).",
+              file=sys.stderr)
+        return 2
+    try:
+        get_broker()  # fail here, once, on a bad URL or a missing key
+    except (ValueError, ImportError) as e:
+        print(f"Can't open the job broker: {e}", file=sys.stderr)
+        return 2
+
+    if args.processes <= 1:
+        run_worker(args.threads)
+        return 0
+    # spawn: each process builds its own connections, threads and scheduler from scratch
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(args.threads,), name=f"worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def stop(*_):
+        for process in processes:
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())